@@ -19,14 +19,59 @@ def get_env(key, default=None):
 OTS_INSTANCE_NAME = get_env('OTS_INSTANCE_NAME', 'xxxxxxxxxxxxxxxx')
 OTS_ENDPOINT = get_env('OTS_ENDPOINT', 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx')
 OTS_TABLE_NAME = get_env('OTS_TABLE_NAME', 'Books')
+BOOK_LIST_INDEX_TABLE = get_env('BOOK_LIST_INDEX_TABLE', 'BookListIndex')  # 图书列表索引（list_key为__all__或category:<分类> + 倒序创建时间 + book_id）
 USERS_TABLE = get_env('USERS_TABLE', 'Users')
+USER_ID_INDEX_TABLE = get_env('USER_ID_INDEX_TABLE', 'UserIdIndex')  # user_id -> email 映射表
+SESSIONS_TABLE = get_env('SESSIONS_TABLE', 'Sessions')  # 登录会话表（token为主键）
 VERIFICATION_CODES_TABLE = get_env('VERIFICATION_CODES_TABLE', 'VerificationCodes')
 BORROW_RECORDS_TABLE = get_env('BORROW_RECORDS_TABLE', 'BorrowRecords')
-FAVORITES_TABLE = get_env('FAVORITES_TABLE', 'Favorites')
-VIEW_HISTORY_TABLE = get_env('VIEW_HISTORY_TABLE', 'ViewHistory')
+FAVORITES_TABLE = get_env('FAVORITES_TABLE', 'Favorites')  # 旧收藏表（favorite_id主键，迁移完成后停用）
+USER_FAVORITES_TABLE = get_env('USER_FAVORITES_TABLE', 'UserFavorites')  # 收藏表（user_id + book_id复合主键）
+VIEW_HISTORY_TABLE = get_env('VIEW_HISTORY_TABLE', 'ViewHistory')  # 旧浏览历史表（history_id主键，迁移完成后停用）
+USER_VIEW_HISTORY_TABLE = get_env('USER_VIEW_HISTORY_TABLE', 'UserViewHistory')  # 浏览历史表（user_id + 倒序时间戳主键）
 ANNOUNCEMENTS_TABLE = get_env('ANNOUNCEMENTS_TABLE', 'Announcements')
-COMMENTS_TABLE = get_env('COMMENTS_TABLE', 'Comments')
+COMMENTS_TABLE = get_env('COMMENTS_TABLE', 'Comments')  # 旧评论表（comment_id主键，迁移完成后停用）
+BOOK_COMMENTS_TABLE = get_env('BOOK_COMMENTS_TABLE', 'BookComments')  # 评论表（book_id + created_at + comment_id主键）
+COMMENT_ID_INDEX_TABLE = get_env('COMMENT_ID_INDEX_TABLE', 'CommentIdIndex')  # comment_id -> 评论主键 映射表
 RESERVATIONS_TABLE = get_env('RESERVATIONS_TABLE', 'Reservations')
+COMMENT_LIKES_TABLE = get_env('COMMENT_LIKES_TABLE', 'CommentLikes')
+# 借阅/预约查询索引表（由仓储层在写入时同步维护）
+BORROWS_BY_USER_TABLE = get_env('BORROWS_BY_USER_TABLE', 'BorrowsByUser')  # user_id + borrow_id
+BORROWS_BY_BOOK_TABLE = get_env('BORROWS_BY_BOOK_TABLE', 'BorrowsByBookStatus')  # book_id + status + due_date + borrow_id
+BORROWS_BY_DUE_DATE_TABLE = get_env('BORROWS_BY_DUE_DATE_TABLE', 'BorrowsByDueDate')  # status + due_date + borrow_id
+RESERVATIONS_BY_USER_TABLE = get_env('RESERVATIONS_BY_USER_TABLE', 'ReservationsByUser')  # user_id + reservation_id
+RESERVATIONS_BY_BOOK_TABLE = get_env('RESERVATIONS_BY_BOOK_TABLE', 'ReservationsByBookStatus')  # book_id + status + expected_return_date + reservation_id
+RESERVATIONS_BY_RETURN_DATE_TABLE = get_env('RESERVATIONS_BY_RETURN_DATE_TABLE', 'ReservationsByReturnDate')  # status + expected_return_date + reservation_id
+# 登录会话有效期（秒），同时作为Sessions表的OTS TTL
+SESSION_TTL_SECONDS = int(get_env('SESSION_TTL_SECONDS', str(7 * 24 * 3600)))
+# 是否兼容旧版Token（以user_id作为Token），全部客户端重新登录后可关闭
+ALLOW_LEGACY_USER_ID_TOKEN = get_env('ALLOW_LEGACY_USER_ID_TOKEN', 'true').lower() == 'true'
+# 收藏表迁移期间双读：新表未命中时回查旧Favorites表；migrate_favorites成功后写入完成标记自动停止双读，也可设为false强制关闭
+FAVORITES_DUAL_READ = get_env('FAVORITES_DUAL_READ', 'true').lower() == 'true'
+# 浏览历史表迁移期间双读：合并旧ViewHistory表中的记录；migrate_view_history成功后写入完成标记自动停止双读，也可设为false强制关闭
+VIEW_HISTORY_DUAL_READ = get_env('VIEW_HISTORY_DUAL_READ', 'true').lower() == 'true'
+# 浏览历史保留策略：每个用户保留最近N条，超过TTL天数的记录由OTS自动清理（-1表示永久保留）
+VIEW_HISTORY_MAX_PER_USER = int(get_env('VIEW_HISTORY_MAX_PER_USER', '100'))
+VIEW_HISTORY_TTL_DAYS = int(get_env('VIEW_HISTORY_TTL_DAYS', '180'))
+# 浏览历史写后缓冲：队列上限（满时丢弃并计数）、每批写入条数、最长攒批时间（毫秒）
+VIEW_HISTORY_QUEUE_SIZE = int(get_env('VIEW_HISTORY_QUEUE_SIZE', '10000'))
+VIEW_HISTORY_BATCH_SIZE = int(get_env('VIEW_HISTORY_BATCH_SIZE', '200'))
+VIEW_HISTORY_FLUSH_MS = int(get_env('VIEW_HISTORY_FLUSH_MS', '500'))
+# 同一用户重复浏览同一本书的合并窗口（秒）：窗口内的再次浏览替换上一条记录而非新增（0表示不合并）
+VIEW_HISTORY_DEDUP_SECONDS = int(get_env('VIEW_HISTORY_DEDUP_SECONDS', '3600'))
+# 评论表迁移期间双读：合并旧Comments表中尚未迁移的评论；migrate_comments成功后写入完成标记自动停止双读，也可设为false强制关闭
+COMMENTS_DUAL_READ = get_env('COMMENTS_DUAL_READ', 'true').lower() == 'true'
+# 借阅/预约查询走索引表（默认关闭，执行scripts.backfill_lookup_indexes回填存量数据后再开启；关闭时为全表过滤扫描）
+LOOKUP_INDEX_READS = get_env('LOOKUP_INDEX_READS', 'false').lower() == 'true'
+# 图书列表走BookListIndex有序分页（默认关闭，执行scripts.backfill_book_list_index后再开启；关闭时为全表读取+内存排序）
+BOOK_LIST_INDEX_READS = get_env('BOOK_LIST_INDEX_READS', 'false').lower() == 'true'
+# 进程内图书检索索引全量重建间隔（秒），用于同步其他进程的写入（0表示仅首次构建）
+SEARCH_INDEX_REFRESH_SECONDS = int(get_env('SEARCH_INDEX_REFRESH_SECONDS', '600'))
+# 图书列表/计数/AI知识库从进程内目录快照读取（false时回退到列表索引表）；快照全量重建间隔（秒），兜底丢失的变更通知
+CATALOG_SNAPSHOT_READS = get_env('CATALOG_SNAPSHOT_READS', 'true').lower() == 'true'
+CATALOG_SNAPSHOT_REFRESH_SECONDS = int(get_env('CATALOG_SNAPSHOT_REFRESH_SECONDS', '600'))
+# 全表并行扫描线程数
+PARALLEL_SCAN_WORKERS = int(get_env('PARALLEL_SCAN_WORKERS', '4'))
 
 # 对象存储（OSS）配置
 OSS_BUCKET_NAME = get_env('OSS_BUCKET_NAME', 'book-mgmt-images')
@@ -37,6 +82,28 @@ REDIS_HOST = get_env('REDIS_HOST', 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx')  # 加引
 REDIS_PORT = int(get_env('REDIS_PORT', '6379'))  # 统一用get_env，保持整数类型
 REDIS_PASSWORD = get_env('REDIS_PASSWORD', 'FluxLib_Redis_2024')  # 加引号，敏感信息建议通过环境变量传入
 REDIS_DB = int(get_env('REDIS_DB', '0'))  # 统一用get_env，保持整数类型
+# 图书详情缓存：键带版本号（缓存数据结构变化时递增），TTL按比例随机抖动避免集中过期
+BOOK_CACHE_VERSION = get_env('BOOK_CACHE_VERSION', '1')
+BOOK_CACHE_TTL_SECONDS = int(get_env('BOOK_CACHE_TTL_SECONDS', '600'))
+BOOK_CACHE_TTL_JITTER = float(get_env('BOOK_CACHE_TTL_JITTER', '0.1'))
+# 图书写入后禁止回填缓存的时间窗口（秒），防止并发读取把写入前的旧数据写回缓存
+BOOK_CACHE_DIRTY_SECONDS = int(get_env('BOOK_CACHE_DIRTY_SECONDS', '3'))
+# /books列表页响应缓存：键含目录版本号（图书任何写入都会递增），仅缓存前若干页
+BOOK_PAGE_CACHE_TTL_SECONDS = int(get_env('BOOK_PAGE_CACHE_TTL_SECONDS', '300'))
+BOOK_PAGE_CACHE_MAX_PAGE = int(get_env('BOOK_PAGE_CACHE_MAX_PAGE', '5'))
+# 进程内L1缓存（Redis之前的一级缓存）：每个缓存的最大条目数与存活时间（秒），TTL兜底丢失的失效消息
+L1_CACHE_MAX_SIZE = int(get_env('L1_CACHE_MAX_SIZE', '10000'))
+L1_CACHE_TTL_SECONDS = int(get_env('L1_CACHE_TTL_SECONDS', '30'))
+# "不存在"结果的负缓存时间（秒），无效Token、已删除图书的重复请求只需一次Redis读取（0表示关闭）
+NEGATIVE_CACHE_TTL_SECONDS = int(get_env('NEGATIVE_CACHE_TTL_SECONDS', '30'))
+# L1条目过期后仍可返回旧值的时间窗口（秒），期间由一次后台刷新更新（stale-while-revalidate）
+L1_CACHE_STALE_SECONDS = int(get_env('L1_CACHE_STALE_SECONDS', '30'))
+# 缓存未命中时跨进程合并加载的锁有效期（毫秒），其他进程最多等待同样时长后自行加载
+SINGLE_FLIGHT_LOCK_MS = int(get_env('SINGLE_FLIGHT_LOCK_MS', '3000'))
+# L1缓存失效通知的Redis发布/订阅频道
+CACHE_INVALIDATION_CHANNEL = get_env('CACHE_INVALIDATION_CHANNEL', 'cache:invalidate')
+# 评论点赞数在Redis中累加，由后台线程按此间隔（秒）批量写回评论表
+COMMENT_LIKES_FLUSH_SECONDS = int(get_env('COMMENT_LIKES_FLUSH_SECONDS', '5'))
 
 # 阿里云密钥（与原代码一致，含空值校验）
 ALIYUN_ACCESS_KEY = get_env('ALIYUN_ACCESS_KEY', 'xxxxxxxxxxxxxxxxxxxxxxxxxx')
@@ -1,4 +1,5 @@
 import os
+import threading
 from flask import Flask, jsonify
 from config import logger, PORT
 from routes import routes_bp
@@ -11,6 +12,7 @@ from repositories.comment_like_repository import CommentLikeRepository
 from repositories.favorite_repository import FavoriteRepository
 from repositories.view_history_repository import ViewHistoryRepository
 from repositories.announcement_repository import AnnouncementRepository
+from utils.write_behind import queue_stats
 
 # 创建Flask应用
 app = Flask(__name__)
@@ -59,6 +61,12 @@ def health_check():
     return 'OK', 200
 
 
+@app.route('/health/write-behind', methods=["GET"])
+def write_behind_stats():
+    """本进程写后队列统计（排队数、累计写入/失败/丢弃数）"""
+    return jsonify(queue_stats()), 200
+
+
 def init_app():
     """应用启动前初始化"""
     try:
@@ -89,6 +97,10 @@ def init_app():
         else:
             logger.info("✅ 图书表检测到有效数据，可正常提供图书相关功能")
 
+        # 4. 后台预构建图书检索/联想索引（不阻塞启动）
+        threading.Thread(target=Book.warm_search_index, daemon=True).start()
+        logger.info("🔎 图书检索/联想索引后台构建中...")
+
     except Exception as e:
         logger.error(f"❌ 应用初始化失败: {str(e)}", exc_info=True)
         raise
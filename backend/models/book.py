@@ -1,9 +1,33 @@
 import uuid
 import time
 from typing import List, Tuple, Optional, Dict, Any
-from config import logger
+from config import logger, SEARCH_INDEX_REFRESH_SECONDS, CATALOG_SNAPSHOT_READS, CATALOG_SNAPSHOT_REFRESH_SECONDS
 from models.borrow import Borrow
-from repositories.book_repository import BookRepository
+from repositories.book_repository import BookRepository, STOCK_INSUFFICIENT, STOCK_UNCERTAIN, to_reverse_created_at
+from utils.cache import book_cache, subscribe_invalidations
+from utils.catalog_snapshot import CatalogSnapshot
+from utils.cursor import encode_cursor, decode_cursor
+from utils.redis_client import redis_client, CATALOG_VERSION_MESSAGE
+from utils.search_index import BookSearchIndex, BookSuggestIndex
+
+# 进程内图书检索/联想索引（首次使用时流式扫描Books表构建，写路径增量维护）
+_search_index = BookSearchIndex(
+    lambda: BookRepository().iter_all(raise_on_error=True), SEARCH_INDEX_REFRESH_SECONDS,
+    loader_many=lambda book_ids: BookRepository().get_many(book_ids, raise_on_error=True)
+)
+_suggest_index = BookSuggestIndex(
+    lambda: BookRepository().iter_all(raise_on_error=True), Borrow.count_by_book, SEARCH_INDEX_REFRESH_SECONDS
+)
+# 进程内图书目录快照（列表顺序与列表索引一致：倒序创建时间 + book_id），其他进程的写入通过图书缓存失效消息同步
+_catalog = CatalogSnapshot(
+    lambda: BookRepository().iter_all(raise_on_error=True),
+    lambda book_ids: BookRepository().get_many(book_ids, raise_on_error=True),
+    lambda book: (to_reverse_created_at(book.get('created_at')), book['book_id']),
+    CATALOG_SNAPSHOT_REFRESH_SECONDS,
+    version_loader=redis_client.get_catalog_version
+)
+subscribe_invalidations(book_cache.name, _catalog)
+subscribe_invalidations(CATALOG_VERSION_MESSAGE, _catalog.version_watcher)
 
 
 class Book:
@@ -68,14 +92,19 @@ class Book:
             logger.error(f"创建图书失败: book_id={book_id}")
             return False, "创建图书失败"
 
+        # 新建图书同样发布变更（递增目录版本号，通知其他进程的目录快照）
+        _catalog.upsert(book_entity_data)
+        _search_index.upsert(book_entity_data)
+        _suggest_index.upsert(book_entity_data)
+        cls._invalidate_cache([book_id])
+
         logger.info(f"创建图书成功: book_id={book_id}, title={book_entity_data['title']}")
         return True, book_id
 
     @classmethod
     def get_by_id(cls, book_id: str) -> Optional['Book']:
-        """通过book_id获取图书"""
-        repository = BookRepository()
-        data = repository.get_by_id(book_id)
+        """通过book_id获取图书（进程内L1 + Redis两级缓存，未命中时读OTS并回填；OTS读取失败时抛出异常，不写入负缓存）"""
+        data = book_cache.get(book_id, lambda key: BookRepository().get_by_id(key, raise_on_error=True))
 
         if not data:
             return None
@@ -83,58 +112,127 @@ class Book:
         return cls(data)
 
     @classmethod
-    def get_list(cls, page: int = 1, size: int = 10, category: str = '') -> Tuple[List['Book'], int]:
-        """获取图书列表"""
-        try:
-            logger.info(f"📚 Book.get_list() 开始: page={page}, size={size}, category='{category}'")
+    def get_many(cls, book_ids: List[str]) -> Dict[str, 'Book']:
+        """批量获取图书（两级缓存 + 未命中部分BatchGetRow回填），返回以book_id为键的字典"""
+        data_map = book_cache.get_many(book_ids, lambda keys: BookRepository().get_many(keys, raise_on_error=True))
 
-            # 计算分页偏移
-            offset = (page - 1) * size
+        return {book_id: cls(data) for book_id, data in data_map.items()}
 
-            # 通过仓储层获取数据
-            repository = BookRepository()
-            filters = {'category': category} if category else None
-            all_books_data = repository.get_all(filters)
+    @staticmethod
+    def _invalidate_cache(book_ids: List[str]):
+        """图书写入后失效详情缓存（本进程L1、Redis，并通知其他进程），下次读取从OTS回填；同时递增目录版本号使列表页缓存失效
 
-            logger.info(f"📊 查询到总记录数: {len(all_books_data)}")
+        需在本进程目录快照更新之后调用：新版本号一经可见，其他请求即可能按新版本渲染并缓存列表页
+        """
+        book_cache.invalidate(book_ids)
+        redis_client.bump_catalog_version()
 
-            if not all_books_data:
-                logger.info("📭 无图书数据")
-                return [], 0
+    @staticmethod
+    def is_catalog_current(version) -> bool:
+        """按目录版本号version渲染的列表页能否缓存：目录快照已收到该版本及之前的全部变更通知并已刷新"""
+        return not CATALOG_SNAPSHOT_READS or _catalog.is_current(version)
 
-            # 按创建时间倒序
-            all_books_data.sort(key=lambda x: x.get('created_at', 0), reverse=True)
+    @classmethod
+    def get_list(cls, page: int = 1, size: int = 10, category: str = '',
+                 raise_on_error: bool = False) -> Tuple[List['Book'], int]:
+        """获取图书列表（按创建时间倒序，page从1开始）
 
-            # 内存分页
-            start_index = offset
-            end_index = offset + size
-            paged_books_data = all_books_data[start_index:end_index]
+        读取失败时默认返回 ([], 0)；raise_on_error为True时抛出异常（结果会被缓存的调用方需开启，避免缓存空页）
+        """
+        try:
+            logger.info(f"📚 Book.get_list() 开始: page={page}, size={size}, category='{category}'")
 
-            logger.info(f"📄 分页结果: 起始索引={start_index}, 结束索引={end_index}, 本页数量={len(paged_books_data)}")
+            # 计算分页偏移
+            offset = (max(page, 1) - 1) * size
 
-            # 转换为Book对象
-            book_list = []
-            for i, book_data in enumerate(paged_books_data):
-                try:
-                    book_obj = cls(book_data)
-                    book_list.append(book_obj)
-                    logger.info(f"✅ 转换成功 {i + 1}: {book_obj.title} (ID: {book_obj.book_id})")
-                except Exception as e:
-                    logger.error(f"❌ 转换图书数据失败: {book_data}, 错误: {str(e)}")
+            # 从目录快照（或通过仓储层按索引顺序）读取本页数据
+            if CATALOG_SNAPSHOT_READS:
+                items, _ = _catalog.page(category, offset=offset, size=size)
+            else:
+                items = BookRepository().get_page(size=size, offset=offset, category=category)['items']
+            book_list = cls._to_books(items)
 
             # 获取总数
-            total = len(all_books_data)
+            total = cls.get_total(category)
             logger.info(f"📊 最终返回: {len(book_list)} 本书, 总数: {total}")
 
             return book_list, total
 
         except Exception as e:
             logger.error(f"💥 Book.get_list() 异常: {str(e)}", exc_info=True)
+            if raise_on_error:
+                raise
             return [], 0
 
+    @classmethod
+    def get_page(cls, cursor: str = None, size: int = 10, category: str = '') -> Tuple[List['Book'], Optional[str]]:
+        """游标分页获取图书列表（按创建时间倒序），返回 (图书列表, 下一页游标)"""
+        if CATALOG_SNAPSHOT_READS:
+            position = decode_cursor(cursor, 2, (int, str))
+            items, last = _catalog.page(category, after=tuple(position) if position else None, size=size)
+            return cls._to_books(items), encode_cursor(list(last)) if last else None
+
+        repository = BookRepository()
+        result = repository.get_page(cursor=cursor, size=size, category=category)
+
+        return cls._to_books(result['items']), result['next_cursor']
+
+    @classmethod
+    def _to_books(cls, books_data: List[Dict[str, Any]]) -> List['Book']:
+        """转换为Book对象（跳过无法转换的数据）"""
+        book_list = []
+        for book_data in books_data:
+            try:
+                book_list.append(cls(book_data))
+            except Exception as e:
+                logger.error(f"❌ 转换图书数据失败: {book_data}, 错误: {str(e)}")
+        return book_list
+
+    @classmethod
+    def search(cls, query: str, page: int = 1, size: int = 10) -> Tuple[List[Dict[str, Any]], int]:
+        """全文检索图书（进程内倒排索引，BM25排序），返回 (图书展示数据列表, 命中总数)"""
+        result = _search_index.search(query, page, size)
+        logger.info(f"🔎 图书检索: q='{query}', page={page}, 命中={result['total']}")
+        return result['items'], result['total']
+
+    @classmethod
+    def suggest(cls, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """书名/作者前缀联想（进程内有序索引，按借阅热度排序）"""
+        return _suggest_index.suggest(prefix, limit)
+
+    @classmethod
+    def warm_search_index(cls) -> int:
+        """预先构建目录快照与检索/联想索引（应用启动时调用，避免首个请求等待构建）"""
+        if CATALOG_SNAPSHOT_READS:
+            _catalog.rebuild(only_if_missing=True)
+        _suggest_index.rebuild(only_if_missing=True)
+        return _search_index.rebuild(only_if_missing=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """图书数据字典（不含仓储对象）"""
+        return {
+            'book_id': self.book_id,
+            'title': self.title,
+            'author': self.author,
+            'publisher': self.publisher,
+            'isbn': self.isbn,
+            'price': self.price,
+            'category': self.category,
+            'description': self.description,
+            'cover': self.cover,
+            'summary': self.summary,
+            'status': self.status,
+            'stock': self.stock,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
     @classmethod
     def get_total(cls, category: str = '') -> int:
         """获取图书总数"""
+        if CATALOG_SNAPSHOT_READS:
+            return _catalog.count(category)
+
         repository = BookRepository()
         filters = {'category': category} if category else None
         return repository.count(filters)
@@ -215,8 +313,13 @@ class Book:
         if not update_columns:
             return False, "没有提供有效更新字段"
 
-        # 通过仓储层更新数据
+        # 通过仓储层更新数据（无论成功与否都失效缓存，写入结果不确定时宁可回源）
         success = self._repository.update(self.book_id, update_columns)
+        if success:
+            _catalog.upsert(self.to_dict())
+            _search_index.upsert(self.to_dict())
+            _suggest_index.upsert(self.to_dict())
+        self._invalidate_cache([self.book_id])
 
         if not success:
             logger.error(f"更新图书失败: book_id={self.book_id}")
@@ -238,38 +341,84 @@ class Book:
             logger.error(f"删除图书失败: book_id={self.book_id}")
             return False, "删除图书失败"
 
+        _catalog.remove(self.book_id)
+        _search_index.remove(self.book_id)
+        _suggest_index.remove(self.book_id)
+        self._invalidate_cache([self.book_id])
+
         logger.info(f"删除图书成功: book_id={self.book_id}")
         return True, None
 
     def update_stock(self, change: int) -> Tuple[bool, Optional[str]]:
-        """更新库存"""
-        # 1. 计算新库存
-        new_stock = self.stock + change
-        if new_stock < 0:
-            logger.error(f"库存更新失败: book_id={self.book_id}, 新库存为负（{new_stock}）")
-            return False, "库存不足"
-
-        # 2. 更新库存和状态
-        self.stock = new_stock
-        self.status = 'borrowed' if new_stock == 0 else 'available'
-        self.updated_at = int(time.time())
+        """更新库存（仓储层单次条件UpdateRow原子增减，并发借阅不会超借，也无需读改写重试）"""
+        if not change:
+            return True, None
 
-        # 3. 通过仓储层更新数据
-        update_data = {
-            'stock': self.stock,
-            'status': self.status,
-            'updated_at': self.updated_at
-        }
-
-        success = self._repository.update(self.book_id, update_data)
+        updated_at = int(time.time())
+        success, result = self._repository.change_stock(self.book_id, change, updated_at)
+        if success:
+            self._apply_stock_change(change, result, updated_at)
+        self._invalidate_cache([self.book_id])
 
         if not success:
+            if result == STOCK_INSUFFICIENT:
+                logger.error(f"库存更新失败: book_id={self.book_id}, 库存不足（变化量={change}）")
+                return False, "库存不足"
             logger.error(f"库存更新失败: book_id={self.book_id}")
             return False, "库存更新失败"
 
-        logger.info(f"库存更新成功: book_id={self.book_id}, 原库存={self.stock - change}, 新库存={self.stock}")
+        logger.info(f"库存更新成功: book_id={self.book_id}, 变化量={change}, 新状态={self.status}")
         return True, None
 
+    @classmethod
+    def update_stocks(cls, books: List['Book'], changes: Dict[str, int]) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """批量更新库存（BatchWriteRow条件增减），changes为 {book_id: 变化量}，返回 {book_id: (success, err)}"""
+        results = {}
+        updated_at = int(time.time())
+        book_changes = {book.book_id: changes.get(book.book_id, 0) for book in books}
+
+        write_results = BookRepository().change_stocks(book_changes, updated_at) if book_changes else {}
+
+        for book in books:
+            success, result = write_results.get(book.book_id, (False, None))
+            if not success:
+                if result == STOCK_INSUFFICIENT:
+                    logger.error(f"库存更新失败: book_id={book.book_id}, 库存不足")
+                    results[book.book_id] = (False, "库存不足")
+                elif result == STOCK_UNCERTAIN:
+                    results[book.book_id] = (False, "库存更新结果未知，请稍后核对")
+                else:
+                    results[book.book_id] = (False, "库存更新失败")
+                continue
+
+            change = book_changes[book.book_id]
+            if change:
+                book._apply_stock_change(change, result, updated_at)
+            results[book.book_id] = (True, None)
+
+        # 本进程快照更新后再失效；写入结果不确定的图书也一并失效，宁可多回源一次也不返回旧库存
+        cls._invalidate_cache([book_id for book_id, change in book_changes.items() if change])
+        logger.info(f"批量库存更新: 数量={len(books)}, 成功={sum(1 for ok, _ in results.values() if ok)}")
+        return results
+
+    def _apply_stock_change(self, change: int, status: str, updated_at: int):
+        """条件写入成功后同步实例与进程内索引
+
+        UpdateRow不返回新值，实例可能是旧缓存，不据此推算库存：扣减后为borrowed时库存恰为0，
+        直接写入；其余情况只更新状态，并把目录快照与检索索引中的该书标记为待刷新，下次读取前回读准确值
+        """
+        self.status = status
+        self.updated_at = updated_at
+        if status == 'borrowed':
+            self.stock = 0
+            _catalog.update_fields(self.book_id, {'stock': 0, 'status': status, 'updated_at': updated_at})
+            _search_index.update_stored(self.book_id, {'stock': 0, 'status': status})
+        else:
+            _catalog.evict([self.book_id])
+            _search_index.evict([self.book_id])
+        if change < 0:
+            _suggest_index.bump(self.book_id, -change)  # 借出计入热度
+
     def get_borrow_history(self) -> List['Borrow']:
         """获取图书借阅历史"""
         logger.info(f"获取图书借阅历史: book_id={self.book_id}")
@@ -277,34 +426,8 @@ class Book:
 
     def get_earliest_return_date(self) -> str:
         """获取最早归还日期"""
-        from tablestore import (
-            CompositeColumnCondition, LogicalOperator, SingleColumnCondition,
-            ComparatorType, INF_MIN, INF_MAX
-        )
-        from utils.database import ots_get_range
-        from config import BORROW_RECORDS_TABLE
-
-        # 1. 构建条件
-        condition = CompositeColumnCondition(LogicalOperator.AND)
-        condition.add_sub_condition(SingleColumnCondition('book_id', self.book_id, ComparatorType.EQUAL))
-        condition.add_sub_condition(SingleColumnCondition('status', 'borrowed', ComparatorType.EQUAL))
-
-        # 2. OTS范围查询
-        borrow_records = ots_get_range(
-            BORROW_RECORDS_TABLE,
-            start_pk=[('borrow_id', INF_MIN)],
-            end_pk=[('borrow_id', INF_MAX)],
-            column_filter=condition
-        )
-
-        # 3. 查找最早due_date
-        earliest_date = None
-        for record in borrow_records:
-            due_date = record.get('due_date')
-            if due_date and (earliest_date is None or due_date < earliest_date):
-                earliest_date = due_date
-
-        # 4. 格式转换
+        earliest_date = Borrow.get_earliest_due_date(self.book_id)
+
         if earliest_date:
             return time.strftime('%Y-%m-%d', time.localtime(earliest_date))
         return "未知日期"
\ No newline at end of file
@@ -58,6 +58,75 @@ class Borrow:
         logger.info(f"创建借阅记录成功: borrow_id={borrow_id}, user_id={user_id}, book_id={book_id}")
         return True, borrow_id
 
+    @classmethod
+    def create_borrows(cls, book_ids: List[str], user_id: str, days: int = 30) -> Dict[str, Optional[str]]:
+        """批量创建借阅记录（BatchWriteRow），返回 {book_id: borrow_id}，失败的图书对应None"""
+        current_time = int(time.time())
+        due_date = current_time + days * 24 * 3600
+
+        borrow_list = [{
+            'borrow_id': str(uuid.uuid4()),
+            'book_id': book_id,
+            'user_id': user_id,
+            'borrow_date': current_time,
+            'due_date': due_date,
+            'return_date': 0,
+            'status': 'borrowed',
+            'is_early_return': False,
+            'created_at': current_time,
+            'updated_at': current_time
+        } for book_id in book_ids]
+
+        repository = BorrowRepository()
+        results = repository.create_many(borrow_list)
+
+        logger.info(f"批量创建借阅记录: user_id={user_id}, 数量={len(borrow_list)}, 成功={sum(results)}")
+        return {
+            borrow_data['book_id']: borrow_data['borrow_id'] if success else None
+            for borrow_data, success in zip(borrow_list, results)
+        }
+
+    @classmethod
+    def get_many(cls, borrow_ids: List[str]) -> Dict[str, 'Borrow']:
+        """根据borrow_id列表批量获取借阅记录，返回以borrow_id为键的字典"""
+        repository = BorrowRepository()
+        data_map = repository.get_many(borrow_ids)
+
+        return {borrow_id: cls(data) for borrow_id, data in data_map.items()}
+
+    @classmethod
+    def update_status_many(cls, borrows: List['Borrow'], status: str,
+                           is_early_return: bool = False) -> Dict[str, bool]:
+        """批量更新借阅状态（BatchWriteRow），返回以borrow_id为键的成功标记"""
+        if status not in ['borrowed', 'returned']:
+            return {borrow.borrow_id: False for borrow in borrows}
+
+        current_time = int(time.time())
+        updates = {}
+        for borrow in borrows:
+            update_columns = {
+                'status': status,
+                'updated_at': current_time
+            }
+            if status == 'returned':
+                update_columns['return_date'] = current_time
+                update_columns['is_early_return'] = is_early_return
+            updates[borrow.borrow_id] = update_columns
+
+        repository = BorrowRepository()
+        results = repository.update_many(updates)
+
+        # 更新实例状态
+        for borrow in borrows:
+            if results.get(borrow.borrow_id):
+                borrow.status = status
+                borrow.updated_at = current_time
+                if status == 'returned':
+                    borrow.return_date = current_time
+                    borrow.is_early_return = is_early_return
+
+        return results
+
     @classmethod
     def get_by_id(cls, borrow_id: str) -> Optional['Borrow']:
         """通过borrow_id获取借阅记录"""
@@ -96,6 +165,26 @@ class Borrow:
 
         return [cls(data) for data in data_list]
 
+    @classmethod
+    def get_earliest_due_date(cls, book_id: str) -> Optional[int]:
+        """获取图书借出记录中最早的应还日期（无借出记录返回None）"""
+        repository = BorrowRepository()
+        return repository.get_earliest_due_date(book_id)
+
+    @classmethod
+    def count_by_book(cls) -> Dict[str, int]:
+        """统计每本图书的累计借阅次数 {book_id: 次数}"""
+        repository = BorrowRepository()
+        return repository.count_by_book()
+
+    @classmethod
+    def get_overdue(cls, now: Optional[int] = None) -> List['Borrow']:
+        """获取已逾期未还的借阅记录（按应还日期升序）"""
+        repository = BorrowRepository()
+        data_list = repository.get_due_before(now or int(time.time()), status='borrowed')
+
+        return [cls(data) for data in data_list]
+
     def update_status(self, status: str, is_early_return: bool = False) -> tuple:
         """更新借阅状态"""
         if not self.borrow_id:
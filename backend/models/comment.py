@@ -1,10 +1,20 @@
 import uuid
 import time
-from typing import List, Optional, Dict, Any
-from config import logger
+from typing import List, Optional, Dict, Any, Tuple
+from config import logger, COMMENT_LIKES_FLUSH_SECONDS
 from repositories.comment_repository import CommentRepository
 from repositories.comment_like_repository import CommentLikeRepository
 from models.user import User
+from utils.cache import SingleFlight
+from utils.counter_buffer import CounterBuffer
+
+# 同一本书评论树的并发加载合并为一次（进程内）
+_tree_flight = SingleFlight('comment_tree')
+# 点赞数增量先在Redis中累加，由后台线程批量写回评论表
+_like_counter = CounterBuffer(
+    'comment_likes', lambda flush_id, deltas: CommentRepository().increment_likes(flush_id, deltas),
+    COMMENT_LIKES_FLUSH_SECONDS
+)
 
 
 class Comment:
@@ -77,43 +87,10 @@ class Comment:
 
     @classmethod
     def get_by_book_id(cls, book_id: str) -> List['Comment']:
-        """获取图书的所有评论（含回复树结构）"""
+        """获取图书的所有评论（含回复树结构，父评论按点赞数降序），同一本书的并发请求共享一次加载结果"""
         try:
-            logger.info(f"【查询评论】目标图书ID: {book_id}，开始查询Comments表")
-
-            # 通过仓储层获取数据
-            repository = CommentRepository()
-            comment_list_data = repository.get_by_book_id(book_id)
-
-            logger.info(f"✅ 从OTS查询到的评论数量: {len(comment_list_data)} 条（book_id={book_id}）")
-
-            # 转换为Comment对象
-            comments = [cls(data) for data in comment_list_data]
-            logger.info(f"✅ 转换为Comment对象的数量: {len(comments)} 条")
-
-            # 构建评论树（父评论+回复）
-            comment_map = {}
-            comment_tree = []
-
-            # 先构建所有评论的映射
-            for comment in comments:
-                comment_map[comment.comment_id] = comment
-                comment.replies = []  # 初始化回复列表
-
-            # 分类父评论和回复
-            for comment in comments:
-                if comment.parent_id and comment.parent_id in comment_map:
-                    # 回复评论：添加到父评论的replies
-                    comment_map[comment.parent_id].replies.append(comment)
-                    logger.info(f"  🔗 回复关联: 父评论ID={comment.parent_id} → 子评论ID={comment.comment_id}")
-                else:
-                    # 父评论：添加到评论树
-                    comment_tree.append(comment)
-                    logger.info(f"  📌 父评论添加: comment_id={comment.comment_id}, likes={comment.likes}")
-
-            # 按点赞数排序（父评论降序）
-            comment_tree.sort(key=lambda x: x.likes, reverse=True)
-            logger.info(f"✅ 最终返回的评论树数量: 父评论{len(comment_tree)} 条，总评论（含回复）{len(comments)} 条")
+            comment_tree = _tree_flight.do(book_id, lambda: cls._load_tree(book_id))
+            logger.info(f"✅ 最终返回的评论树数量: 父评论{len(comment_tree)} 条（book_id={book_id}）")
 
             return comment_tree
 
@@ -121,6 +98,54 @@ class Comment:
             logger.error(f"获取评论失败: book_id={book_id}, err={str(e)}", exc_info=True)
             return []
 
+    @classmethod
+    def _load_tree(cls, book_id: str) -> List['Comment']:
+        """读取图书全部评论并构建评论树"""
+        # 通过仓储层获取数据（图书评论为一次连续范围读取）
+        repository = CommentRepository()
+        result = repository.get_by_book_id(book_id)
+
+        comment_tree = cls._build_tree(result['comments'], result['replies'])
+
+        # 按点赞数排序（父评论降序）
+        comment_tree.sort(key=lambda x: x.likes, reverse=True)
+        return comment_tree
+
+    @classmethod
+    def get_page(cls, book_id: str, cursor: str = None, limit: int = None) -> Tuple[List['Comment'], Optional[str]]:
+        """分页获取图书评论（父评论按发布时间倒序，附带各自的回复），返回 (评论树, 下一页游标)"""
+        repository = CommentRepository()
+        result = repository.get_by_book_id(book_id, cursor=cursor, limit=limit or repository.DEFAULT_PAGE_SIZE)
+
+        return cls._build_tree(result['comments'], result['replies']), result['next_cursor']
+
+    @staticmethod
+    def _apply_pending_likes(comments: List['Comment']):
+        """点赞数取Redis中的总数（已落库值 + 尚未落库的增量，未缓存时以本次读取的OTS值初始化，一次Redis往返）"""
+        totals = _like_counter.totals({comment.comment_id: comment.likes for comment in comments})
+        for comment in comments:
+            comment.likes = totals.get(comment.comment_id, comment.likes)
+
+    @classmethod
+    def _build_tree(cls, top_level_data: List[Dict[str, Any]], reply_data: List[Dict[str, Any]]) -> List['Comment']:
+        """构建评论树（父评论+回复），父评论不存在的回复作为父评论展示"""
+        comment_tree = [cls(data) for data in top_level_data]
+        comment_map = {comment.comment_id: comment for comment in comment_tree}
+        for comment in comment_tree:
+            comment.replies = []  # 初始化回复列表
+
+        replies = [cls(data) for data in sorted(reply_data, key=lambda x: x.get('created_at', 0))]
+        cls._apply_pending_likes(comment_tree + replies)
+        for reply in replies:
+            reply.replies = []
+            if reply.parent_id in comment_map:
+                # 回复评论：添加到父评论的replies
+                comment_map[reply.parent_id].replies.append(reply)
+            else:
+                comment_tree.append(reply)
+
+        return comment_tree
+
     @classmethod
     def get_by_id(cls, comment_id: str) -> Optional['Comment']:
         """通过comment_id获取评论"""
@@ -130,11 +155,18 @@ class Comment:
         if not data:
             return None
 
-        return cls(data)
+        comment = cls(data)
+        cls._apply_pending_likes([comment])
+        return comment
 
-    def like_comment(self, user_id: str) -> tuple:
-        """点赞/取消点赞评论"""
-        if not self.comment_id:
+    @classmethod
+    def like_comment(cls, comment_id: str, user_id: str) -> tuple:
+        """点赞/取消点赞评论（一次条件写入切换点赞记录 + 一次Redis累加点赞数，不读取也不改写评论行）
+
+        返回 (success, 结果)；点赞数取Redis中缓存的总数，尚未缓存（该评论近期未被展示）时为None。
+        评论已删除时点赞增量在落库时丢弃
+        """
+        if not comment_id:
             logger.error("点赞失败：缺少comment_id")
             return False, "评论不存在"
 
@@ -143,55 +175,21 @@ class Comment:
             return False, "用户未登录"
 
         try:
-            # 1. 检查用户是否已点赞
-            has_liked = self._like_repository.exists(self.comment_id, user_id)
-
-            if has_liked:
-                # 2. 已点赞：取消点赞（删记录+点赞数-1）
-                del_success = self._like_repository.delete(self.comment_id, user_id)
-                if not del_success:
-                    return False, "取消点赞失败"
-
-                self.likes -= 1
-                action = "取消点赞"
-            else:
-                # 3. 未点赞：点赞（增记录+点赞数+1）
-                create_result = self._like_repository.create({
-                    'comment_id': self.comment_id,
-                    'user_id': user_id
-                })
-                if not create_result:
-                    return False, "点赞失败"
-
-                self.likes += 1
-                action = "点赞"
-
-            # 4. 更新OTS评论表（仅更新点赞数、时间，保留原作者信息）
-            update_columns = {
-                'likes': self.likes,
-                'updated_at': int(time.time()),
-                'user_display_name': self.user_display_name,
-                'user_avatar_url': self.user_avatar_url,
-                'book_id': self.book_id,
-                'content': self.content
-            }
-
-            success = self._repository.update(self.comment_id, update_columns)
-
-            if not success:
-                # 回滚：恢复点赞记录（避免数据不一致）
-                if has_liked:
-                    self._like_repository.create({
-                        'comment_id': self.comment_id,
-                        'user_id': user_id
-                    })
-                    self.likes += 1
-                else:
-                    self._like_repository.delete(self.comment_id, user_id)
-                    self.likes -= 1
-                return False, "更新评论失败"
-
-            return True, {"likes": self.likes, "action": action}
+            # 1. 条件写入切换点赞记录（无需预先查询是否已点赞）
+            liked = CommentLikeRepository().toggle(comment_id, user_id)
+            if liked is None:
+                return False, "点赞失败"
+
+            # 2. 点赞数增量写入Redis，由后台线程批量落库；Redis不可用时直接原子增减评论表
+            delta = 1 if liked else -1
+            buffered, likes = _like_counter.add(comment_id, delta)
+            if not buffered:
+                if not CommentRepository().update(comment_id, {'updated_at': int(time.time())},
+                                                  increment={'likes': delta}):
+                    logger.error(f"点赞数更新失败：comment_id={comment_id}, 变化量={delta}")
+
+            action = "点赞" if liked else "取消点赞"
+            return True, {"likes": likes, "action": action}
 
         except Exception as e:
             logger.error(f"点赞操作异常：err={str(e)}")
@@ -4,6 +4,7 @@ from typing import Optional, Dict, Any, List, Tuple
 from config import logger
 from repositories.user_repository import UserRepository
 from utils.auth import hash_password
+from utils.cache import user_cache
 
 
 class User:
@@ -77,6 +78,8 @@ class User:
             logger.error(f"用户创建失败: OTS写入异常（email={email}）")
             return False, "创建用户失败"
 
+        user_cache.invalidate([user_id])  # 清除可能存在的负缓存
+
         logger.info(f"用户创建成功: email={email}, user_id={user_id}（核心字段已完整写入）")
         return True, user_id
 
@@ -93,117 +96,86 @@ class User:
 
     @classmethod
     def get_by_id(cls, user_id: str) -> Optional['User']:
-        """通过user_id获取用户"""
-        repository = UserRepository()
-        data = repository.get_by_id(user_id)
+        """通过user_id获取用户（进程内L1 + Redis两级缓存，未命中时读OTS并回填；OTS读取失败时抛出异常，不写入负缓存）"""
+        data = user_cache.get(user_id, lambda key: UserRepository().get_by_id(key, raise_on_error=True))
 
         if not data:
             return None
 
         return cls(data)
 
+    @classmethod
+    def get_many(cls, user_ids: List[str]) -> Dict[str, 'User']:
+        """批量获取用户（两级缓存 + 未命中部分批量读OTS），返回以user_id为键的字典"""
+        data_map = user_cache.get_many(user_ids, lambda keys: UserRepository().get_many(keys, raise_on_error=True))
+
+        return {user_id: cls(data) for user_id, data in data_map.items()}
+
     def update_profile(self, display_name: str = None, avatar_url: str = None,
                        gender: str = None, background_url: str = None,
                        summary: str = None) -> tuple:
-        """更新用户资料"""
+        """更新用户资料（仅写入变更字段，不回读、不重写其他列）"""
         if not self.email:
             logger.error("用户资料更新失败: 缺少email主键")
             return False, "用户不存在"
 
-        # 获取当前用户的完整数据
-        current_user_data = self._repository.get_by_email(self.email)
-        if not current_user_data:
-            logger.error(f"用户资料更新失败: 无法获取完整数据（email={self.email}）")
-            return False, "用户数据已丢失，请重新登录"
-
         # 组装更新字段
         update_columns = {}
-        current_timestamp = int(time.time())
 
         # 处理可修改字段
         if display_name is not None and display_name.strip():
-            self.display_name = display_name.strip()
-            update_columns['display_name'] = self.display_name
+            update_columns['display_name'] = display_name.strip()
 
         if avatar_url is not None:
-            self.avatar_url = avatar_url
-            update_columns['avatar_url'] = self.avatar_url
+            update_columns['avatar_url'] = avatar_url
 
         if gender is not None:
-            self.gender = gender
-            update_columns['gender'] = self.gender
+            update_columns['gender'] = gender
 
         if background_url is not None:
-            self.background_url = background_url
-            update_columns['background_url'] = self.background_url
+            update_columns['background_url'] = background_url
 
         if summary is not None:
-            self.summary = summary
-            update_columns['summary'] = self.summary
-
-        # 强制添加核心不可修改字段
-        update_columns.update({
-            'user_id': current_user_data.get('user_id', ''),
-            'password': current_user_data.get('password', ''),
-            'role': current_user_data.get('role', 'user'),
-            'is_verified': current_user_data.get('is_verified', False),
-            'created_at': current_user_data.get('created_at', current_timestamp),
-            'updated_at': current_timestamp
-        })
+            update_columns['summary'] = summary
 
-        # 通过仓储层更新数据
+        current_timestamp = int(time.time())
+        update_columns['updated_at'] = current_timestamp
+
+        # 通过仓储层更新数据（行不存在时条件检查失败）
         success = self._repository.update(self.email, update_columns)
+        user_cache.invalidate([self.user_id])
         if not success:
             logger.error(f"用户资料更新失败: OTS写入异常（email={self.email}）")
             return False, "更新用户资料失败"
 
         # 更新成功后刷新实例字段
-        self.user_id = current_user_data.get('user_id', '')
-        self.password = current_user_data.get('password', '')
-        self.role = current_user_data.get('role', 'user')
-        self.is_verified = current_user_data.get('is_verified', False)
-        self.created_at = current_user_data.get('created_at', current_timestamp)
-        self.updated_at = current_timestamp
+        for key, value in update_columns.items():
+            setattr(self, key, value)
 
         logger.info(f"用户资料更新成功: email={self.email}，更新字段={list(update_columns.keys())}")
         return True, None
 
     def update_password(self, new_password: str) -> tuple:
-        """更新用户密码"""
+        """更新用户密码（仅写入password与updated_at）"""
         if not self.email:
             logger.error("密码更新失败: 缺少email主键")
             return False, "用户不存在"
 
-        # 获取当前用户完整数据
-        current_user_data = self._repository.get_by_email(self.email)
-        if not current_user_data:
-            logger.error(f"密码更新失败: 无法获取完整数据（email={self.email}）")
-            return False, "用户数据已丢失，请重新登录"
-
         # 密码哈希处理
         new_hashed_pw = hash_password(new_password)
         if not new_hashed_pw:
             logger.error(f"密码更新失败: 新密码哈希生成异常（email={self.email}）")
             return False, "密码处理异常"
 
-        # 组装更新字段
         current_timestamp = int(time.time())
         update_columns = {
             'password': new_hashed_pw,
-            'updated_at': current_timestamp,
-            'user_id': current_user_data.get('user_id', ''),
-            'role': current_user_data.get('role', 'user'),
-            'is_verified': current_user_data.get('is_verified', False),
-            'created_at': current_user_data.get('created_at', current_timestamp),
-            'display_name': current_user_data.get('display_name', ''),
-            'avatar_url': current_user_data.get('avatar_url', ''),
-            'gender': current_user_data.get('gender', ''),
-            'background_url': current_user_data.get('background_url', ''),
-            'summary': current_user_data.get('summary', '')
+            'updated_at': current_timestamp
         }
 
         # 通过仓储层更新数据
         success = self._repository.update(self.email, update_columns)
+        user_cache.invalidate([self.user_id])
         if not success:
             logger.error(f"密码更新失败: OTS写入异常（email={self.email}）")
             return False, "更新密码失败"
@@ -212,7 +184,7 @@ class User:
         self.password = new_hashed_pw
         self.updated_at = current_timestamp
 
-        logger.info(f"密码更新成功: email={self.email}（其他核心字段已保留）")
+        logger.info(f"密码更新成功: email={self.email}")
         return True, None
 
     @classmethod
@@ -1,8 +1,44 @@
 import uuid
 import time
 from typing import List, Optional, Dict, Any
-from config import logger
+from config import (
+    logger, VIEW_HISTORY_QUEUE_SIZE, VIEW_HISTORY_BATCH_SIZE, VIEW_HISTORY_FLUSH_MS, VIEW_HISTORY_DEDUP_SECONDS
+)
 from repositories.view_history_repository import ViewHistoryRepository
+from utils.redis_client import redis_client
+from utils.write_behind import WriteBehindQueue
+
+
+def _write_view_events(events: List[Dict[str, Any]]) -> List[bool]:
+    """批量写入浏览事件；写入失败的图书把Redis中的最近浏览回退为仍在库中的旧记录（无则清除），
+    避免下次浏览替换一条从未写入的记录、却留下旧记录"""
+    try:
+        results = ViewHistoryRepository().apply_view_events(events)
+    except Exception as e:
+        logger.error(f"❌ 浏览事件批量写入异常: 条数={len(events)}, {e}")
+        results = [False] * len(events)
+    if VIEW_HISTORY_DEDUP_SECONDS > 0:
+        # (user_id, book_id) -> [批次前仍在库中的旧记录倒序时间戳, 最后一次失败写入的倒序时间戳]
+        failed = {}
+        for event, success in zip(events, results):
+            if success:
+                continue
+            history = event['history']
+            replaced = event.get('replaces')
+            key = (history['user_id'], history['book_id'])
+            if key not in failed:
+                failed[key] = [replaced[1] if replaced else None, None]
+            failed[key][1] = history['reverse_ts']
+        for (user_id, book_id), (previous, reverse_ts) in failed.items():
+            redis_client.restore_last_view(user_id, book_id, reverse_ts, previous, VIEW_HISTORY_DEDUP_SECONDS)
+    return results
+
+
+# 浏览事件写后缓冲：详情页请求只入队，由后台线程按批写入（BatchWriteRow）
+_view_queue = WriteBehindQueue(
+    'view_history', _write_view_events,
+    max_size=VIEW_HISTORY_QUEUE_SIZE, batch_size=VIEW_HISTORY_BATCH_SIZE, interval_ms=VIEW_HISTORY_FLUSH_MS
+)
 
 
 class ViewHistory:
@@ -33,6 +69,26 @@ class ViewHistory:
         logger.info(f"创建浏览历史成功: user_id={user_id}, book_id={book_id}")
         return True
 
+    @classmethod
+    def record(cls, user_id: str, book_id: str) -> bool:
+        """异步记录浏览（写后缓冲入队，不等待写库），队列已满时返回False
+
+        合并窗口内再次浏览同一本书时，新记录替换上一条记录（Redis保存上一条的倒序时间戳），
+        每个(user_id, book_id)只保留一条，浏览时间始终为最近一次
+        """
+        history = ViewHistoryRepository().build_view_history(user_id, book_id)
+        replaced, previous = None, None
+        if VIEW_HISTORY_DEDUP_SECONDS > 0:
+            previous = redis_client.swap_last_view(user_id, book_id, history['reverse_ts'], VIEW_HISTORY_DEDUP_SECONDS)
+            if previous is not None and previous != history['reverse_ts']:
+                replaced = (user_id, previous, book_id)
+        if _view_queue.submit({'history': history, 'replaces': replaced}):
+            return True
+        if VIEW_HISTORY_DEDUP_SECONDS > 0:
+            # 事件未入队：最近浏览回退为上一条记录
+            redis_client.restore_last_view(user_id, book_id, history['reverse_ts'], previous, VIEW_HISTORY_DEDUP_SECONDS)
+        return False
+
     @classmethod
     def get_by_user_id(cls, user_id: str) -> List['ViewHistory']:
         """根据用户ID获取所有浏览历史"""
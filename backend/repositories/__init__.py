@@ -8,6 +8,7 @@ from .favorite_repository import FavoriteRepository
 from .view_history_repository import ViewHistoryRepository
 from .announcement_repository import AnnouncementRepository
 from .reservation_repository import ReservationRepository  # 新增
+from .session_repository import SessionRepository
 
 __all__ = [
     'BaseRepository',
@@ -19,5 +20,6 @@ __all__ = [
     'FavoriteRepository',
     'ViewHistoryRepository',
     'AnnouncementRepository',
-    'ReservationRepository'
+    'ReservationRepository',
+    'SessionRepository'
 ]
\ No newline at end of file
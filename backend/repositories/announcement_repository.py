@@ -1,15 +1,18 @@
 import time
 import uuid
 from typing import List, Dict, Any, Optional
-from tablestore import INF_MIN, INF_MAX, RowExistenceExpectation
+from tablestore import RowExistenceExpectation
 from config import logger, ANNOUNCEMENTS_TABLE
-from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
+from utils.database import ots_put_row, ots_get_row, ots_delete_row
+from utils.parallel_scanner import ParallelScanner
 from repositories.base_repository import BaseRepository
 
 
 class AnnouncementRepository(BaseRepository):
     """公告数据仓储层，负责所有公告数据的OTS访问操作"""
 
+    primary_key_names = ('announcement_id',)
+
     def __init__(self):
         self.table_name = ANNOUNCEMENTS_TABLE
 
@@ -26,12 +29,9 @@ class AnnouncementRepository(BaseRepository):
         return data
 
     def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """获取所有公告数据"""
-        all_announcements = ots_get_range(
-            self.table_name,
-            start_pk=[('announcement_id', INF_MIN)],
-            end_pk=[('announcement_id', INF_MAX)]
-        )
+        """获取所有公告数据（按主键分片并行扫描）"""
+        scanner = ParallelScanner(self.table_name, self.primary_key_names)
+        all_announcements = list(scanner.iter_rows())
 
         logger.info(f"查询到公告总数: {len(all_announcements)}")
         return all_announcements
@@ -67,20 +67,12 @@ class AnnouncementRepository(BaseRepository):
         return announcement_id
 
     def update(self, announcement_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新公告数据"""
+        """更新公告数据（UpdateRow仅发送指定列）"""
         if not announcement_id:
             logger.error("更新公告失败: 缺少announcement_id")
             return False
 
-        primary_key = [('announcement_id', announcement_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
-
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
+        success, err = self.update_row(announcement_id, update_data)
 
         if not success:
             logger.error(f"更新公告失败: announcement_id={announcement_id}, err={err}")
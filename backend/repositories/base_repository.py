@@ -1,11 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from config import logger
+from tablestore import INF_MIN, INF_MAX, RowExistenceExpectation
+from utils.database import ots_batch_write, ots_batch_get_rows, ots_iter_range, ots_update_row
 
 
 class BaseRepository(ABC):
     """仓储层基类，定义通用的数据访问接口"""
 
+    # 主键列名（按OTS表主键顺序），批量写入接口依赖此属性，子类需声明
+    primary_key_names: Tuple[str, ...] = ()
+    # 维护型索引表（SecondaryIndex），主表写入成功后由create/update/delete及批量接口同步
+    secondary_indexes: tuple = ()
+
     @abstractmethod
     def get_by_id(self, id: str) -> Optional[Dict[str, Any]]:
         """根据ID获取单个实体"""
@@ -16,6 +23,204 @@ class BaseRepository(ABC):
         """获取所有实体，支持过滤条件"""
         pass
 
+    def get_many(self, ids: List[str], raise_on_error: bool = False) -> Dict[str, Dict[str, Any]]:
+        """根据ID列表批量获取实体，返回以ID为键的字典（不存在的ID不出现在结果中）
+
+        单主键表默认使用BatchGetRow批量读取，其余情况逐个调用get_by_id；需要字段类型校准的子类应重写此方法。
+        raise_on_error开启时读取失败抛出异常（仅BatchGetRow路径支持），结果中缺失的ID即确认不存在
+        """
+        if len(self.primary_key_names) == 1:
+            key_name = self.primary_key_names[0]
+            unique_ids = [entity_id for entity_id in dict.fromkeys(ids) if entity_id]
+            if not unique_ids:
+                return {}
+            rows = ots_batch_get_rows(self.table_name, [self._build_primary_key(i) for i in unique_ids],
+                                      raise_on_error=raise_on_error)
+            return {data[key_name]: data for data in rows}
+
+        result = {}
+        for entity_id in dict.fromkeys(ids):
+            data = self.get_by_id(entity_id)
+            if data:
+                result[entity_id] = data
+        return result
+
+    def _build_primary_key(self, entity_id) -> list:
+        """根据实体ID构造OTS主键（复合主键的ID为按主键顺序排列的元组）"""
+        if not self.primary_key_names:
+            raise NotImplementedError(f"{type(self).__name__} 未声明 primary_key_names")
+        values = entity_id if isinstance(entity_id, (tuple, list)) else (entity_id,)
+        return list(zip(self.primary_key_names, values))
+
+    def _entity_id(self, entity_data: Dict[str, Any]):
+        """从实体数据中提取ID（单主键返回值，复合主键返回元组）"""
+        values = tuple(entity_data.get(name) for name in self.primary_key_names)
+        return values[0] if len(values) == 1 else values
+
+    def create_many(self, entities: List[Dict[str, Any]]) -> List[bool]:
+        """批量创建实体（BatchWriteRow），返回与entities一一对应的成功标记
+
+        实体数据需包含全部主键列，其余字段全部作为属性列写入
+        """
+        operations = []
+        for entity_data in entities:
+            attribute_columns = [
+                (key, value) for key, value in entity_data.items()
+                if key not in self.primary_key_names
+            ]
+            operations.append({
+                'type': 'put',
+                'primary_key': self._build_primary_key(self._entity_id(entity_data)),
+                'attribute_columns': attribute_columns
+            })
+
+        results = self._batch_write(operations, [self._entity_id(e) for e in entities], '创建')
+        self._sync_secondary_indexes([(None, e) for e, success in zip(entities, results) if success])
+        return results
+
+    def update_many(self, updates: Dict[Any, Dict[str, Any]]) -> Dict[Any, bool]:
+        """批量更新实体（BatchWriteRow UpdateRow，仅覆盖指定列），返回以ID为键的成功标记"""
+        ids = list(updates)
+        # 仅在更新涉及索引来源列时读取旧数据（如库存变更不影响索引，无需回读）
+        indexed_ids = [
+            entity_id for entity_id in ids
+            if any(index.affected_by(updates[entity_id]) for index in self.secondary_indexes)
+        ]
+        old_rows = self.get_many(indexed_ids) if indexed_ids else {}
+        operations = [{
+            'type': 'update',
+            'primary_key': self._build_primary_key(entity_id),
+            'attribute_columns': self._update_operations(updates[entity_id])
+        } for entity_id in ids]
+
+        results = dict(zip(ids, self._batch_write(operations, ids, '更新')))
+        self._sync_secondary_indexes([
+            (old_rows[entity_id], {**old_rows[entity_id], **updates[entity_id]})
+            for entity_id in ids if results[entity_id] and entity_id in old_rows
+        ])
+        return results
+
+    def _update_operations(self, update_data: Dict[str, Any], increment: Dict[str, int] = None,
+                           primary_key_names: Tuple[str, ...] = None) -> Dict[str, list]:
+        """组装UpdateRow的列操作：值为None的列删除，其余列覆盖写，increment为 {列名: 增量}（原子增减）
+
+        主键列（默认为本表primary_key_names）忽略
+        """
+        key_names = self.primary_key_names if primary_key_names is None else primary_key_names
+        columns = {key: value for key, value in update_data.items() if key not in key_names}
+        operations = {}
+        put = [(key, value) for key, value in columns.items() if value is not None]
+        delete = [key for key, value in columns.items() if value is None]
+        if put:
+            operations['put'] = put
+        if delete:
+            operations['delete_all'] = delete
+        if increment:
+            operations['increment'] = list(increment.items())
+        return operations
+
+    def update_row(self, entity_id, update_data: Dict[str, Any], increment: Dict[str, int] = None,
+                   column_condition=None, expect_exist=RowExistenceExpectation.EXPECT_EXIST) -> Tuple[bool, Optional[str]]:
+        """单行部分列更新（UpdateRow仅发送变更列，不读旧值、不整行覆盖），返回 (success, err)
+
+        - update_data中值为None的列会被删除；increment中的列原子增减
+        - 默认要求行已存在，条件不满足时err以OTSConditionCheckFail开头
+        - 仅在更新涉及索引来源列时回读旧数据并同步索引表
+        """
+        affected = any(index.affected_by(update_data) for index in self.secondary_indexes)
+        old_data = self.get_by_id(entity_id) if affected else None
+
+        success, err = ots_update_row(
+            self.table_name,
+            self._build_primary_key(entity_id),
+            self._update_operations(update_data, increment),
+            expect_exist=expect_exist,
+            column_condition=column_condition
+        )
+        if success and old_data:
+            self._sync_secondary_indexes([(old_data, {**old_data, **update_data})])
+        return success, err
+
+    def delete_many(self, ids: List[Any]) -> Dict[Any, bool]:
+        """批量删除实体（BatchWriteRow），返回以ID为键的成功标记"""
+        ids = list(dict.fromkeys(ids))
+        old_rows = self.get_many(ids) if self.secondary_indexes else {}
+        operations = [{
+            'type': 'delete',
+            'primary_key': self._build_primary_key(entity_id)
+        } for entity_id in ids]
+
+        results = dict(zip(ids, self._batch_write(operations, ids, '删除')))
+        self._sync_secondary_indexes([
+            (old_rows[entity_id], None)
+            for entity_id in ids if results[entity_id] and entity_id in old_rows
+        ])
+        return results
+
+    def _sync_secondary_indexes(self, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """主表写入成功后同步全部索引表，changes为(旧数据, 新数据)列表"""
+        if not changes:
+            return
+        for index in self.secondary_indexes:
+            index.sync(changes)
+
+    def rebuild_secondary_indexes(self, batch_size: int = 200) -> int:
+        """按主表全量回填索引表（覆盖写，可重复执行），返回处理的主表行数"""
+        processed = 0
+        batch = []
+        for row in ots_iter_range(
+            self.table_name,
+            start_pk=[(name, INF_MIN) for name in self.primary_key_names],
+            end_pk=[(name, INF_MAX) for name in self.primary_key_names],
+            raise_on_error=True
+        ):
+            batch.append((None, row))
+            if len(batch) >= batch_size:
+                self._sync_secondary_indexes(batch)
+                processed += len(batch)
+                logger.info(f"📦 索引回填进度: 表={self.table_name}, 已处理={processed}")
+                batch = []
+
+        if batch:
+            self._sync_secondary_indexes(batch)
+            processed += len(batch)
+
+        logger.info(f"✅ 索引回填完成: 表={self.table_name}, 共处理={processed}")
+        return processed
+
+    def repair_secondary_indexes(self) -> int:
+        """处理同步失败的索引修复队列（按主表当前数据重写），返回处理的修复项数"""
+        return sum(index.repair(self.get_many) for index in self.secondary_indexes)
+
+    def _get_by_index(self, index, prefix: tuple, lower=None, upper=None, column_filter=None,
+                      max_rows=None) -> List[Dict[str, Any]]:
+        """按索引前缀范围读取主键，再批量回表读取主表数据（按索引顺序返回，已删除的行被跳过）"""
+        bounds = {}
+        if lower is not None:
+            bounds['lower'] = lower
+        if upper is not None:
+            bounds['upper'] = upper
+        entity_ids = [
+            self._entity_id(row)
+            for row in index.iter_prefix(prefix, column_filter=column_filter, max_rows=max_rows, **bounds)
+        ]
+        data_map = self.get_many(entity_ids)
+        return [data_map[entity_id] for entity_id in entity_ids if entity_id in data_map]
+
+    def _batch_write(self, operations: List[Dict[str, Any]], ids: List[Any], action: str) -> List[bool]:
+        """执行批量写入并记录失败行"""
+        if not operations:
+            return []
+
+        results = ots_batch_write(self.table_name, operations)
+        for entity_id, (success, err) in zip(ids, results):
+            if not success:
+                logger.error(f"批量{action}失败: 表={self.table_name}, id={entity_id}, err={err}")
+
+        succeeded = sum(1 for success, _ in results if success)
+        logger.info(f"批量{action}完成: 表={self.table_name}, 总数={len(results)}, 成功={succeeded}")
+        return [success for success, _ in results]
+
     @abstractmethod
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
         """创建新实体"""
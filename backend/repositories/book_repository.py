@@ -1,25 +1,79 @@
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 from tablestore import (
     SingleColumnCondition, ComparatorType, CompositeColumnCondition,
     LogicalOperator, INF_MIN, INF_MAX, RowExistenceExpectation
 )
-from config import logger, OTS_TABLE_NAME
-from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
+from config import logger, OTS_TABLE_NAME, BOOK_LIST_INDEX_TABLE, BOOK_LIST_INDEX_READS
+from utils.database import (
+    ots_put_row, ots_get_row, ots_update_row, ots_get_range, ots_iter_range, ots_delete_row,
+    ots_batch_get_rows, ots_batch_write, is_condition_check_failure, is_ambiguous_write_failure
+)
+from utils.cursor import encode_cursor, decode_cursor
+from utils.parallel_scanner import ParallelScanner
 from repositories.base_repository import BaseRepository
+from repositories.secondary_index import SecondaryIndex
+
+# 全部图书在列表索引中的分区键，分类分区键为 category:<分类名>
+ALL_BOOKS_LIST_KEY = '__all__'
+CATEGORY_LIST_KEY_PREFIX = 'category:'
+# 10位秒级时间戳上限，用于计算倒序创建时间
+MAX_CREATED_AT = 10 ** 10 - 1
+# 库存条件更新失败时的错误标记（库存不足，区别于OTS写入异常）
+STOCK_INSUFFICIENT = 'STOCK_INSUFFICIENT'
+# 库存增减结果未知（请求超时等，可能已生效）：不重试，避免重复增减，需人工核对
+STOCK_UNCERTAIN = 'STOCK_UNCERTAIN'
+# 扣减库存时条件分支的最大轮数（两次条件写入之间可能有并发归还改变库存）
+STOCK_UPDATE_ROUNDS = 2
+
+
+def to_reverse_created_at(created_at) -> int:
+    """创建时间转换为倒序值（越新越小），缺失按最早处理"""
+    return MAX_CREATED_AT - int(created_at or 0)
+
+
+def category_list_key(category: str) -> Optional[str]:
+    """分类对应的列表索引分区键（无分类的图书不进入分类分区）"""
+    return CATEGORY_LIST_KEY_PREFIX + category if category else None
 
 
 class BookRepository(BaseRepository):
-    """图书数据仓储层，负责所有图书数据的OTS访问操作"""
+    """图书数据仓储层，负责所有图书数据的OTS访问操作
+
+    图书列表通过BookListIndex分页：索引主键为(list_key, 倒序创建时间, book_id)，
+    一页即一次有界范围读取加一次BatchGetRow回表，成本与页大小相关而与馆藏规模无关。
+    每本图书在'__all__'分区和所属分类分区各有一行索引，分类变更时由索引同步迁移分区
+    """
+
+    primary_key_names = ('book_id',)
+    list_index = SecondaryIndex(
+        BOOK_LIST_INDEX_TABLE, ('list_key', 'reverse_created_at', 'book_id'),
+        derive=lambda book: {
+            'list_key': ALL_BOOKS_LIST_KEY,
+            'reverse_created_at': to_reverse_created_at(book.get('created_at'))
+        },
+        source_columns=('created_at',),
+        name='all'
+    )
+    category_index = SecondaryIndex(
+        BOOK_LIST_INDEX_TABLE, ('list_key', 'reverse_created_at', 'book_id'),
+        derive=lambda book: {
+            'list_key': category_list_key(book.get('category')),
+            'reverse_created_at': to_reverse_created_at(book.get('created_at'))
+        },
+        source_columns=('created_at', 'category'),
+        name='category'
+    )
+    secondary_indexes = (list_index, category_index)
 
     def __init__(self):
         self.table_name = OTS_TABLE_NAME
 
-    def get_by_id(self, book_id: str) -> Optional[Dict[str, Any]]:
-        """根据book_id获取图书数据"""
+    def get_by_id(self, book_id: str, raise_on_error: bool = False) -> Optional[Dict[str, Any]]:
+        """根据book_id获取图书数据（raise_on_error开启时读取失败抛出异常，返回None即确认不存在）"""
         logger.info(f"查询Books表: 表名={self.table_name}, 主键=book_id, 查询值={book_id}")
 
-        data = ots_get_row(self.table_name, primary_key=[('book_id', book_id)])
+        data = ots_get_row(self.table_name, primary_key=[('book_id', book_id)], raise_on_error=raise_on_error)
         if not data:
             logger.info(f"图书不存在: book_id={book_id}（OTS表无记录）")
             return None
@@ -33,32 +87,60 @@ class BookRepository(BaseRepository):
         logger.info(f"获取图书成功: book_id={book_id}, title={data.get('title')}")
         return data
 
-    def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """获取所有图书数据，支持过滤条件"""
-        column_filter = None
+    def get_many(self, book_ids: List[str], raise_on_error: bool = False) -> Dict[str, Dict[str, Any]]:
+        """根据book_id列表批量获取图书数据（BatchGetRow），返回以book_id为键的字典
 
-        # 处理过滤条件
-        if filters and 'category' in filters and filters['category']:
-            column_filter = SingleColumnCondition('category', filters['category'], ComparatorType.EQUAL)
-            logger.info(f"分类过滤: {filters['category']}")
+        raise_on_error开启时读取失败抛出异常，结果中缺失的book_id即确认不存在
+        """
+        unique_ids = [book_id for book_id in dict.fromkeys(book_ids) if book_id]
+        if not unique_ids:
+            return {}
 
-        # 查询所有数据
-        all_books = ots_get_range(
+        rows = ots_batch_get_rows(
             self.table_name,
-            start_pk=[('book_id', INF_MIN)],
-            end_pk=[('book_id', INF_MAX)],
-            column_filter=column_filter
+            [[('book_id', book_id)] for book_id in unique_ids],
+            raise_on_error=raise_on_error
         )
 
-        logger.info(f"查询到总记录数: {len(all_books)}")
+        result = {}
+        for data in rows:
+            # 字段类型校准
+            if 'stock' in data:
+                data['stock'] = int(data['stock'])
+            if 'price' in data:
+                data['price'] = float(data['price'])
+            result[data['book_id']] = data
 
-        # 类型转换
-        for book in all_books:
+        logger.info(f"批量获取图书: 请求 {len(unique_ids)} 本, 命中 {len(result)} 本")
+        return result
+
+    def iter_all(self, filters: Dict[str, Any] = None, max_rows: int = None,
+                 raise_on_error: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式遍历图书数据（逐行返回，内存占用与表大小无关），支持过滤条件
+
+        raise_on_error：读取中途失败时抛出异常（全量构建索引/快照时必须开启，避免以截断的数据替换）
+        """
+        column_filter = self._build_filter(filters)
+
+        for book in ots_iter_range(
+            self.table_name,
+            start_pk=[('book_id', INF_MIN)],
+            end_pk=[('book_id', INF_MAX)],
+            column_filter=column_filter,
+            max_rows=max_rows,
+            raise_on_error=raise_on_error
+        ):
+            # 类型转换
             if 'stock' in book:
                 book['stock'] = int(book['stock'])
             if 'price' in book:
                 book['price'] = float(book['price'])
+            yield book
 
+    def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """获取所有图书数据，支持过滤条件"""
+        all_books = list(self.iter_all(filters))
+        logger.info(f"查询到总记录数: {len(all_books)}")
         return all_books
 
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
@@ -96,25 +178,18 @@ class BookRepository(BaseRepository):
             logger.error(f"创建图书失败: book_id={book_id}, err={err}")
             return None
 
+        self._sync_secondary_indexes([(None, dict(attribute_columns, book_id=book_id))])
+
         logger.info(f"创建图书成功: book_id={book_id}, title={entity_data['title']}")
         return book_id
 
     def update(self, book_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新图书数据"""
+        """更新图书数据（UpdateRow仅覆盖指定列，并同步列表索引）"""
         if not book_id:
             logger.error("更新图书失败: 缺少book_id")
             return False
 
-        primary_key = [('book_id', book_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
-
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
-
+        success, err = self.update_row(book_id, update_data)
         if not success:
             logger.error(f"更新图书失败: book_id={book_id}, err={err}")
             return False
@@ -122,8 +197,95 @@ class BookRepository(BaseRepository):
         logger.info(f"更新图书成功: book_id={book_id}")
         return True
 
+    @staticmethod
+    def _stock_update(change: int, updated_at: int, status: str) -> Dict[str, list]:
+        """库存变更的UpdateRow列：stock原子增减，status/updated_at在同一次写入中覆盖"""
+        return {
+            'increment': [('stock', change)],
+            'put': [('status', status), ('updated_at', updated_at)]
+        }
+
+    @staticmethod
+    def _stock_condition(change: int, comparator) -> SingleColumnCondition:
+        """扣减库存的列条件（stock与扣减量比较，stock列缺失视为不满足）"""
+        return SingleColumnCondition('stock', -change, comparator, pass_if_missing=False)
+
+    def change_stock(self, book_id: str, change: int, updated_at: int) -> Tuple[bool, Optional[str]]:
+        """原子增减库存（单次UpdateRow：INCREMENT + 列条件，不读旧值、无读改写竞争）
+
+        扣减k本时先以 stock > k 为条件写入status='available'，不满足再以 stock == k 为条件写入
+        status='borrowed'；两者都不满足即库存不足。归还（change>0）只要求行存在，status置为available。
+        返回 (True, 新status)；库存不足返回 (False, STOCK_INSUFFICIENT)，其他失败返回 (False, 错误信息)
+        """
+        primary_key = [('book_id', book_id)]
+        if change == 0:
+            return True, None
+        if change > 0:
+            success, err = ots_update_row(
+                self.table_name, primary_key, self._stock_update(change, updated_at, 'available'),
+                expect_exist=RowExistenceExpectation.EXPECT_EXIST
+            )
+            return (True, 'available') if success else (False, err)
+
+        branches = (
+            (ComparatorType.GREATER_THAN, 'available'),
+            (ComparatorType.EQUAL, 'borrowed')
+        )
+        for _ in range(STOCK_UPDATE_ROUNDS):
+            for comparator, status in branches:
+                success, err = ots_update_row(
+                    self.table_name, primary_key, self._stock_update(change, updated_at, status),
+                    expect_exist=RowExistenceExpectation.EXPECT_EXIST,
+                    column_condition=self._stock_condition(change, comparator)
+                )
+                if success:
+                    return True, status
+                if not is_condition_check_failure(err):
+                    logger.error(f"库存更新失败: book_id={book_id}, err={err}")
+                    return False, err
+
+        logger.info(f"库存不足: book_id={book_id}, 扣减={-change}")
+        return False, STOCK_INSUFFICIENT
+
+    def change_stocks(self, changes: Dict[str, int], updated_at: int) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """批量原子增减库存，返回 {book_id: (success, 新status或错误)}，含义同change_stock
+
+        先用一次BatchWriteRow按常见情况提交（扣减以 stock > k 为条件），
+        条件不满足的行（恰好借完或库存不足）再逐行走change_stock的条件分支；
+        增减不幂等，批量写入不重试，结果未知的行返回 (False, STOCK_UNCERTAIN)
+        """
+        book_ids = [book_id for book_id, change in changes.items() if change]
+        operations = []
+        for book_id in book_ids:
+            change = changes[book_id]
+            operations.append({
+                'type': 'update',
+                'primary_key': [('book_id', book_id)],
+                'attribute_columns': self._stock_update(change, updated_at, 'available'),
+                'expect_exist': RowExistenceExpectation.EXPECT_EXIST,
+                'column_condition': (
+                    self._stock_condition(change, ComparatorType.GREATER_THAN) if change < 0 else None
+                )
+            })
+
+        results = {book_id: (True, None) for book_id, change in changes.items() if not change}
+        for book_id, (success, err) in zip(book_ids, ots_batch_write(self.table_name, operations, idempotent=False)):
+            if success:
+                results[book_id] = (True, 'available')
+            elif is_condition_check_failure(err) and changes[book_id] < 0:
+                results[book_id] = self.change_stock(book_id, changes[book_id], updated_at)
+            elif is_ambiguous_write_failure(err):
+                logger.error(f"批量库存更新结果未知（可能已生效，未重试，需核对库存）: book_id={book_id}, "
+                             f"变化量={changes[book_id]}, err={err}")
+                results[book_id] = (False, STOCK_UNCERTAIN)
+            else:
+                logger.error(f"批量库存更新失败: book_id={book_id}, err={err}")
+                results[book_id] = (False, err)
+        return results
+
     def delete(self, book_id: str) -> bool:
         """删除图书（单主键：book_id，适配基类*args签名）"""
+        old_data = self.get_by_id(book_id)
         success, err = ots_delete_row(
             self.table_name,
             primary_key=[('book_id', book_id)]
@@ -133,49 +295,104 @@ class BookRepository(BaseRepository):
             logger.error(f"删除图书失败: book_id={book_id}, err={err}")
             return False
 
+        if old_data:
+            self._sync_secondary_indexes([(old_data, None)])
         logger.info(f"删除图书成功: book_id={book_id}")
         return True
 
     def count(self, filters: Dict[str, Any] = None) -> int:
-        """统计图书数量"""
-        column_filter = None
+        """统计图书数量
 
-        if filters and 'category' in filters and filters['category']:
-            column_filter = SingleColumnCondition('category', filters['category'], ComparatorType.EQUAL)
+        按分类统计时只读取该分类在列表索引中的主键；全量统计按主键分片并行扫描（仅读取主键）
+        """
+        category = filters.get('category') if filters else None
+        if category and BOOK_LIST_INDEX_READS:
+            count = sum(1 for _ in self.category_index.iter_prefix((category_list_key(category),),
+                                                                  raise_on_error=True))
+            logger.info(f"分类图书数统计完成: category={category}, {count} 条记录")
+            return count
 
-        count = 0
-        next_start_pk = [('book_id', INF_MIN)]
-        max_batches = 100
+        column_filter = self._build_filter(filters)
+        column_to_get = ['category'] if column_filter else ['book_id']
 
-        batch_count = 0
-        while next_start_pk and batch_count < max_batches:
-            batch_count += 1
-            logger.info(f"总数统计第 {batch_count} 批次, next_start_pk={next_start_pk}")
-
-            batch = ots_get_range(
-                self.table_name,
-                start_pk=next_start_pk,
-                end_pk=[('book_id', INF_MAX)],
-                column_filter=column_filter,
-                limit=1000
-            )
-
-            logger.info(f"总数统计批次 {batch_count} 获取到 {len(batch)} 条记录")
-
-            if not batch:
-                break
-
-            count += len(batch)
-
-            # 更新下一批次起始主键
-            if len(batch) > 0:
-                next_start_pk = [('book_id', batch[-1]['book_id'])]
-            else:
-                next_start_pk = None
+        scanner = ParallelScanner(self.table_name, self.primary_key_names)
+        count = scanner.count(column_filter=column_filter, column_to_get=column_to_get)
 
         logger.info(f"图书总数统计完成: {count} 条记录")
         return count
 
+    def get_page(self, cursor: str = None, size: int = 10, offset: int = 0,
+                 category: str = '') -> Dict[str, Any]:
+        """按创建时间倒序分页获取图书，返回 {'items': 图书列表, 'next_cursor': 下一页游标}
+
+        - cursor：上一页返回的不透明游标（为空时从第一页开始）
+        - offset：兼容page参数的跳过行数（仅在索引中跳过主键，不回表）
+        """
+        position = decode_cursor(cursor, 2, (int, str))
+        if BOOK_LIST_INDEX_READS:
+            list_key = category_list_key(category) or ALL_BOOKS_LIST_KEY
+            return self._page_from_index(list_key, position, offset, size)
+        return self._page_in_memory({'category': category} if category else None, position, offset, size)
+
+    def _page_from_index(self, list_key: str, position, offset: int, size: int) -> Dict[str, Any]:
+        """从列表索引读取一页主键并批量回表（索引或回表读取失败时抛出异常，不返回残缺的页）"""
+        if position:
+            start_pk = [('list_key', list_key), ('reverse_created_at', position[0]), ('book_id', position[1])]
+        else:
+            start_pk = [('list_key', list_key), ('reverse_created_at', INF_MIN), ('book_id', INF_MIN)]
+        end_pk = [('list_key', list_key), ('reverse_created_at', INF_MAX), ('book_id', INF_MAX)]
+
+        # 起点为游标本身（左闭区间）需跳过，多读1行判断是否有下一页
+        max_rows = offset + size + (2 if position else 1)
+        keys = [
+            (row['reverse_created_at'], row['book_id'])
+            for row in ots_iter_range(self.list_index.table_name, start_pk, end_pk, max_rows=max_rows,
+                                      raise_on_error=True)
+        ]
+        if position and keys and list(keys[0]) == position:
+            keys = keys[1:]
+        keys = keys[offset:]
+
+        has_more = len(keys) > size
+        keys = keys[:size]
+        data_map = self.get_many([book_id for _, book_id in keys], raise_on_error=True)
+        orphaned = [book_id for _, book_id in keys if book_id not in data_map]
+        if orphaned:
+            logger.warning(f"⚠️ 列表索引指向不存在的图书（已跳过）: list_key={list_key}, book_ids={orphaned}")
+
+        logger.info(f"📄 图书索引分页: list_key={list_key}, 跳过={offset}, 本页={len(keys)}, 有下一页={has_more}")
+        return {
+            'items': [data_map[book_id] for _, book_id in keys if book_id in data_map],
+            'next_cursor': encode_cursor(list(keys[-1])) if has_more and keys else None
+        }
+
+    def _page_in_memory(self, filters: Optional[Dict[str, Any]], position, offset: int, size: int) -> Dict[str, Any]:
+        """全表读取后按索引顺序内存分页（索引未启用时的回退路径）"""
+        books = list(self.iter_all(filters, raise_on_error=True))
+        books.sort(key=lambda book: (to_reverse_created_at(book.get('created_at')), book['book_id']))
+
+        if position:
+            position = tuple(position)
+            books = [
+                book for book in books
+                if (to_reverse_created_at(book.get('created_at')), book['book_id']) > position
+            ]
+        books = books[offset:]
+
+        page = books[:size]
+        next_cursor = None
+        if len(books) > size and page:
+            next_cursor = encode_cursor([to_reverse_created_at(page[-1].get('created_at')), page[-1]['book_id']])
+        return {'items': page, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _build_filter(filters: Dict[str, Any] = None):
+        """根据过滤条件构建OTS列过滤器"""
+        if filters and 'category' in filters and filters['category']:
+            logger.info(f"分类过滤: {filters['category']}")
+            return SingleColumnCondition('category', filters['category'], ComparatorType.EQUAL)
+        return None
+
     def check_table_data(self) -> bool:
         """检查图书表数据状态"""
         try:
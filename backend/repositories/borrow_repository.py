@@ -1,16 +1,32 @@
 import time
+from collections import Counter
 from typing import List, Dict, Any, Optional
 from tablestore import (
     SingleColumnCondition, ComparatorType, CompositeColumnCondition,
     LogicalOperator, INF_MIN, INF_MAX, RowExistenceExpectation
 )
-from config import logger, BORROW_RECORDS_TABLE
+from config import (
+    logger, BORROW_RECORDS_TABLE, BORROWS_BY_USER_TABLE, BORROWS_BY_BOOK_TABLE, BORROWS_BY_DUE_DATE_TABLE,
+    LOOKUP_INDEX_READS
+)
 from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
 from repositories.base_repository import BaseRepository
+from repositories.secondary_index import SecondaryIndex
+from utils.parallel_scanner import ParallelScanner
 
 
 class BorrowRepository(BaseRepository):
-    """借阅记录仓储层，负责所有借阅数据的OTS访问操作"""
+    """借阅记录仓储层，负责所有借阅数据的OTS访问操作
+
+    按用户、按(图书, 状态)、按(状态, 应还日期)的查询通过索引表范围读取后回表，
+    索引表在create/update/delete（含批量接口）成功后同步维护
+    """
+
+    primary_key_names = ('borrow_id',)
+    by_user = SecondaryIndex(BORROWS_BY_USER_TABLE, ('user_id', 'borrow_id'), ('book_id', 'status'))
+    by_book = SecondaryIndex(BORROWS_BY_BOOK_TABLE, ('book_id', 'status', 'due_date', 'borrow_id'))
+    by_due_date = SecondaryIndex(BORROWS_BY_DUE_DATE_TABLE, ('status', 'due_date', 'borrow_id'), ('user_id', 'book_id'))
+    secondary_indexes = (by_user, by_book, by_due_date)
 
     def __init__(self):
         self.table_name = BORROW_RECORDS_TABLE
@@ -69,26 +85,19 @@ class BorrowRepository(BaseRepository):
             logger.error(f"创建借阅记录失败: borrow_id={borrow_id}, err={err}")
             return None
 
+        self._sync_secondary_indexes([(None, dict(attribute_columns, borrow_id=borrow_id))])
+
         logger.info(
             f"创建借阅记录成功: borrow_id={borrow_id}, user_id={entity_data['user_id']}, book_id={entity_data['book_id']}")
         return borrow_id
 
     def update(self, borrow_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新借阅记录"""
+        """更新借阅记录（UpdateRow仅覆盖指定列，并同步索引表）"""
         if not borrow_id:
             logger.error("更新借阅记录失败: 缺少borrow_id")
             return False
 
-        primary_key = [('borrow_id', borrow_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
-
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
-
+        success, err = self.update_row(borrow_id, update_data)
         if not success:
             logger.error(f"更新借阅记录失败: borrow_id={borrow_id}, err={err}")
             return False
@@ -98,6 +107,7 @@ class BorrowRepository(BaseRepository):
 
     def delete(self, borrow_id: str) -> bool:
         """删除借阅记录（单主键：borrow_id，适配基类*args签名）"""
+        old_data = self.get_by_id(borrow_id)
         success, err = ots_delete_row(
             self.table_name,
             primary_key=[('borrow_id', borrow_id)]
@@ -107,6 +117,8 @@ class BorrowRepository(BaseRepository):
             logger.error(f"删除借阅记录失败: borrow_id={borrow_id}, err={err}")
             return False
 
+        if old_data:
+            self._sync_secondary_indexes([(old_data, None)])
         logger.info(f"删除借阅记录成功: borrow_id={borrow_id}")
         return True
 
@@ -116,7 +128,17 @@ class BorrowRepository(BaseRepository):
         return len(all_borrows)
 
     def get_by_user_book(self, user_id: str, book_id: str) -> Optional[Dict[str, Any]]:
-        """获取用户的某本图书借阅记录"""
+        """获取用户的某本图书借阅记录（借阅中）"""
+        if LOOKUP_INDEX_READS:
+            condition = CompositeColumnCondition(LogicalOperator.AND)
+            condition.add_sub_condition(SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL, False))
+            condition.add_sub_condition(SingleColumnCondition('status', 'borrowed', ComparatorType.EQUAL, False))
+
+            for borrow in self._get_by_index(self.by_user, (user_id,), column_filter=condition):
+                if borrow.get('book_id') == book_id and borrow.get('status') == 'borrowed':
+                    return borrow
+            return None
+
         condition = CompositeColumnCondition(LogicalOperator.AND)
         condition.add_sub_condition(SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL))
         condition.add_sub_condition(SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL))
@@ -137,6 +159,9 @@ class BorrowRepository(BaseRepository):
 
     def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
         """获取用户所有借阅记录"""
+        if LOOKUP_INDEX_READS:
+            return self._get_by_index(self.by_user, (user_id,))
+
         condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
         borrow_list = ots_get_range(
             self.table_name,
@@ -149,6 +174,9 @@ class BorrowRepository(BaseRepository):
 
     def get_by_book_id(self, book_id: str) -> List[Dict[str, Any]]:
         """获取图书的所有借阅记录"""
+        if LOOKUP_INDEX_READS:
+            return self._get_by_index(self.by_book, (book_id,))
+
         condition = SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL)
         borrow_list = ots_get_range(
             self.table_name,
@@ -160,7 +188,11 @@ class BorrowRepository(BaseRepository):
         return borrow_list
 
     def get_borrowed_records_by_book(self, book_id: str) -> List[Dict[str, Any]]:
-        """获取图书的已借出记录"""
+        """获取图书的已借出记录（按应还日期升序）"""
+        if LOOKUP_INDEX_READS:
+            borrow_list = self._get_by_index(self.by_book, (book_id, 'borrowed'))
+            return [borrow for borrow in borrow_list if borrow.get('status') == 'borrowed']
+
         condition = CompositeColumnCondition(LogicalOperator.AND)
         condition.add_sub_condition(SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL))
         condition.add_sub_condition(SingleColumnCondition('status', 'borrowed', ComparatorType.EQUAL))
@@ -172,4 +204,45 @@ class BorrowRepository(BaseRepository):
             column_filter=condition
         )
 
-        return borrow_list
\ No newline at end of file
+        return sorted(borrow_list, key=lambda borrow: borrow.get('due_date') or 0)
+
+    def get_earliest_due_date(self, book_id: str) -> Optional[int]:
+        """获取图书借出记录中最早的应还日期（索引表按due_date有序，只读取1行索引）"""
+        if LOOKUP_INDEX_READS:
+            for row in self.by_book.iter_prefix((book_id, 'borrowed'), max_rows=1):
+                return row['due_date']
+            return None
+
+        due_dates = [
+            borrow['due_date'] for borrow in self.get_borrowed_records_by_book(book_id)
+            if borrow.get('due_date')
+        ]
+        return min(due_dates) if due_dates else None
+
+    def get_due_before(self, timestamp: int, status: str = 'borrowed') -> List[Dict[str, Any]]:
+        """获取指定状态下应还日期早于timestamp的借阅记录（按应还日期升序，如逾期未还）"""
+        if LOOKUP_INDEX_READS:
+            return self._get_by_index(self.by_due_date, (status,), upper=timestamp)
+
+        condition = CompositeColumnCondition(LogicalOperator.AND)
+        condition.add_sub_condition(SingleColumnCondition('status', status, ComparatorType.EQUAL))
+        condition.add_sub_condition(SingleColumnCondition('due_date', timestamp, ComparatorType.LESS_THAN))
+
+        borrow_list = ots_get_range(
+            self.table_name,
+            start_pk=[('borrow_id', INF_MIN)],
+            end_pk=[('borrow_id', INF_MAX)],
+            column_filter=condition
+        )
+
+        return sorted(borrow_list, key=lambda borrow: borrow.get('due_date') or 0)
+
+    def count_by_book(self) -> Dict[str, int]:
+        """统计每本图书的累计借阅次数（并行扫描，仅读取book_id列）"""
+        scanner = ParallelScanner(self.table_name, self.primary_key_names)
+        counts = Counter(
+            row['book_id'] for row in scanner.iter_rows(column_to_get=['book_id']) if row.get('book_id')
+        )
+
+        logger.info(f"图书借阅次数统计完成: 图书数={len(counts)}, 借阅总数={sum(counts.values())}")
+        return dict(counts)
@@ -2,13 +2,18 @@ import time
 from typing import List, Dict, Any, Optional
 from tablestore import RowExistenceExpectation
 from config import logger, COMMENT_LIKES_TABLE
-from utils.database import ots_put_row, ots_get_row, ots_delete_row
+from utils.database import ots_put_row, ots_get_row, ots_delete_row, is_condition_check_failure
 from repositories.base_repository import BaseRepository
 
+# 点赞切换的最大轮数（写入与删除之间点赞状态可能被同一用户的并发请求改变）
+TOGGLE_ATTEMPTS = 2
+
 
 class CommentLikeRepository(BaseRepository):
     """评论点赞仓储层，负责所有评论点赞数据的OTS访问操作"""
 
+    primary_key_names = ('comment_id', 'user_id')
+
     def __init__(self):
         self.table_name = COMMENT_LIKES_TABLE
 
@@ -31,7 +36,7 @@ class CommentLikeRepository(BaseRepository):
         return all_likes
 
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
-        """创建点赞记录"""
+        """创建点赞记录（EXPECT_NOT_EXIST条件写入，已点赞时返回None）"""
         comment_id = entity_data.get('comment_id')
         user_id = entity_data.get('user_id')
 
@@ -39,11 +44,6 @@ class CommentLikeRepository(BaseRepository):
             logger.error("创建点赞失败：缺少comment_id或user_id")
             return None
 
-        # 先检查是否已点赞
-        if self.exists(comment_id, user_id):
-            logger.warning(f"已点赞：comment_id={comment_id}, user_id={user_id}")
-            return None
-
         current_time = int(time.time())
         primary_key = [('comment_id', comment_id), ('user_id', user_id)]
         attribute_columns = [('created_at', current_time)]
@@ -56,7 +56,10 @@ class CommentLikeRepository(BaseRepository):
         )
 
         if not success:
-            logger.error(f"创建点赞记录失败：err={err}")
+            if is_condition_check_failure(err):
+                logger.warning(f"已点赞：comment_id={comment_id}, user_id={user_id}")
+            else:
+                logger.error(f"创建点赞记录失败：err={err}")
             return None
 
         logger.info(f"点赞成功：comment_id={comment_id}, user_id={user_id}")
@@ -67,26 +70,58 @@ class CommentLikeRepository(BaseRepository):
         return False
 
     def delete(self, comment_id: str, user_id: str) -> bool:
-        """删除点赞记录（复合主键：comment_id+user_id，适配基类*args签名）"""
+        """删除点赞记录（复合主键：comment_id+user_id，适配基类*args签名；EXPECT_EXIST条件删除，未点赞时返回False）"""
         if not comment_id or not user_id:
             logger.error("取消点赞失败：缺少comment_id或user_id")
             return False
 
-        # 先检查是否已点赞
-        if not self.exists(comment_id, user_id):
-            logger.warning(f"未点赞：comment_id={comment_id}, user_id={user_id}")
-            return False
-
         primary_key = [('comment_id', comment_id), ('user_id', user_id)]
-        success, err = ots_delete_row(self.table_name, primary_key=primary_key)
+        success, err = ots_delete_row(
+            self.table_name, primary_key=primary_key, expect_exist=RowExistenceExpectation.EXPECT_EXIST
+        )
 
         if not success:
-            logger.error(f"取消点赞失败：err={err}")
+            if is_condition_check_failure(err):
+                logger.warning(f"未点赞：comment_id={comment_id}, user_id={user_id}")
+            else:
+                logger.error(f"取消点赞失败：err={err}")
             return False
 
         logger.info(f"取消点赞成功：comment_id={comment_id}, user_id={user_id}")
         return True
 
+    def toggle(self, comment_id: str, user_id: str) -> Optional[bool]:
+        """切换点赞状态，返回切换后是否已点赞，失败返回None
+
+        不预先查询：先以EXPECT_NOT_EXIST条件写入点赞记录，已存在时再以EXPECT_EXIST条件删除；
+        只有条件写入成功的一方改变点赞状态，并发点击不会重复计数
+        """
+        primary_key = [('comment_id', comment_id), ('user_id', user_id)]
+        for _ in range(TOGGLE_ATTEMPTS):
+            success, err = ots_put_row(
+                self.table_name,
+                primary_key,
+                [('created_at', int(time.time()))],
+                expect_exist=RowExistenceExpectation.EXPECT_NOT_EXIST
+            )
+            if success:
+                return True
+            if not is_condition_check_failure(err):
+                logger.error(f"点赞失败：comment_id={comment_id}, user_id={user_id}, err={err}")
+                return None
+
+            success, err = ots_delete_row(
+                self.table_name, primary_key=primary_key, expect_exist=RowExistenceExpectation.EXPECT_EXIST
+            )
+            if success:
+                return False
+            if not is_condition_check_failure(err):
+                logger.error(f"取消点赞失败：comment_id={comment_id}, user_id={user_id}, err={err}")
+                return None
+
+        logger.warning(f"点赞状态并发变更，切换失败：comment_id={comment_id}, user_id={user_id}")
+        return None
+
     def count(self, filters: Dict[str, Any] = None) -> int:
         """统计点赞数量"""
         all_likes = self.get_all(filters)
@@ -3,70 +3,120 @@ from typing import List, Dict, Any, Optional
 from tablestore import (
     SingleColumnCondition, ComparatorType, INF_MIN, INF_MAX, RowExistenceExpectation
 )
-from config import logger, COMMENTS_TABLE
-from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
+from config import logger, COMMENTS_TABLE, BOOK_COMMENTS_TABLE, COMMENT_ID_INDEX_TABLE, COMMENTS_DUAL_READ
+from utils.database import (
+    ots_put_row, ots_get_row, ots_update_row, ots_get_range, ots_iter_range, ots_delete_row,
+    ots_batch_get_rows, ots_batch_write, is_condition_check_failure
+)
+from utils.cursor import encode_cursor, decode_cursor
+from utils.migration_state import is_migration_done
 from repositories.base_repository import BaseRepository
 
+# 评论迁移完成标记（scripts.migrate_comments成功后写入，之后不再读取旧Comments表）
+COMMENTS_MIGRATION = 'comments'
+
 
 class CommentRepository(BaseRepository):
-    """评论数据仓储层，负责所有评论数据的OTS访问操作"""
+    """评论数据仓储层，负责所有评论数据的OTS访问操作
+
+    评论表以(book_id, created_at, comment_id)为主键，同一图书的评论在表内连续存储；
+    CommentIdIndex维护comment_id到主键的映射，供点赞等按comment_id的操作点查。
+    迁移窗口内（COMMENTS_DUAL_READ开启且迁移完成标记未写入）同时合并旧Comments表（comment_id主键）中的评论，
+    迁移完成后只访问新表。
+    """
+
+    primary_key_names = ('book_id', 'created_at', 'comment_id')
+
+    # 分页读取默认/最大每页父评论数
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
 
     def __init__(self):
-        self.table_name = COMMENTS_TABLE
+        self.table_name = BOOK_COMMENTS_TABLE
+        self.index_table_name = COMMENT_ID_INDEX_TABLE
+        self.legacy_table_name = COMMENTS_TABLE
+
+    @staticmethod
+    def _dual_read() -> bool:
+        """是否处于迁移窗口（需要合并旧表）"""
+        return COMMENTS_DUAL_READ and not is_migration_done(COMMENTS_MIGRATION)
+
+    @staticmethod
+    def _normalize(comment: Dict[str, Any]) -> Dict[str, Any]:
+        """字段类型校准"""
+        if 'likes' in comment:
+            comment['likes'] = int(comment['likes'])
+        comment.setdefault('parent_id', '')
+        return comment
+
+    def _get_primary_key(self, comment_id: str) -> Optional[tuple]:
+        """通过CommentIdIndex获取评论主键 (book_id, created_at, comment_id)"""
+        index_data = ots_get_row(self.index_table_name, primary_key=[('comment_id', comment_id)])
+        if not index_data:
+            return None
+        return index_data['book_id'], int(index_data['created_at']), comment_id
 
     def get_by_id(self, comment_id: str) -> Optional[Dict[str, Any]]:
-        """根据comment_id获取评论数据"""
-        logger.info(f"查询Comments表: comment_id={comment_id}")
+        """根据comment_id获取评论数据（索引点查 + 评论表点查）"""
+        logger.info(f"查询评论: comment_id={comment_id}")
+
+        primary_key = self._get_primary_key(comment_id)
+        data = ots_get_row(self.table_name, self._build_primary_key(primary_key)) if primary_key else None
+
+        if not data and self._dual_read():
+            data = ots_get_row(self.legacy_table_name, primary_key=[('comment_id', comment_id)])
 
-        data = ots_get_row(self.table_name, primary_key=[('comment_id', comment_id)])
         if not data:
             logger.info(f"评论不存在: comment_id={comment_id}")
             return None
 
-        # 类型转换
-        if 'likes' in data:
-            data['likes'] = int(data['likes'])
-
         logger.info(f"获取评论成功: comment_id={comment_id}")
-        return data
+        return self._normalize(data)
 
     def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """获取所有评论数据"""
         all_comments = ots_get_range(
             self.table_name,
-            start_pk=[('comment_id', INF_MIN)],
-            end_pk=[('comment_id', INF_MAX)]
+            start_pk=[('book_id', INF_MIN), ('created_at', INF_MIN), ('comment_id', INF_MIN)],
+            end_pk=[('book_id', INF_MAX), ('created_at', INF_MAX), ('comment_id', INF_MAX)]
         )
 
         logger.info(f"查询到评论总数: {len(all_comments)}")
-
-        # 类型转换
-        for comment in all_comments:
-            if 'likes' in comment:
-                comment['likes'] = int(comment['likes'])
-
-        return all_comments
+        return [self._normalize(comment) for comment in all_comments]
 
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
-        """创建新评论"""
+        """创建新评论（同时写入comment_id索引）"""
         comment_id = entity_data.get('comment_id')
         if not comment_id:
             logger.error("创建评论失败: 缺少comment_id")
             return None
 
-        primary_key = [('comment_id', comment_id)]
-        attribute_columns = [
+        primary_key = [
             ('book_id', entity_data['book_id']),
+            ('created_at', entity_data['created_at']),
+            ('comment_id', comment_id)
+        ]
+        attribute_columns = [
             ('user_id', entity_data['user_id']),
             ('user_display_name', entity_data['user_display_name']),
             ('user_avatar_url', entity_data['user_avatar_url']),
             ('content', entity_data['content']),
             ('parent_id', entity_data.get('parent_id', '')),
             ('likes', entity_data.get('likes', 0)),
-            ('created_at', entity_data['created_at']),
             ('updated_at', entity_data['updated_at'])
         ]
 
+        # 先写索引：评论行可见时索引必然已存在
+        index_success, index_err = ots_put_row(
+            self.index_table_name,
+            [('comment_id', comment_id)],
+            [('book_id', entity_data['book_id']), ('created_at', entity_data['created_at'])],
+            expect_exist=RowExistenceExpectation.IGNORE
+        )
+        if not index_success:
+            logger.error(f"创建评论失败: 写入评论索引失败 comment_id={comment_id}, err={index_err}")
+            return None
+
         success, err = ots_put_row(
             self.table_name,
             primary_key,
@@ -82,21 +132,20 @@ class CommentRepository(BaseRepository):
             f"创建评论成功: comment_id={comment_id}, book_id={entity_data['book_id']}, user_id={entity_data['user_id']}")
         return comment_id
 
-    def update(self, comment_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新评论数据"""
+    def update(self, comment_id: str, update_data: Dict[str, Any], increment: Dict[str, int] = None) -> bool:
+        """更新评论数据（UpdateRow仅发送指定列，主键列忽略；increment为原子增减的列，如点赞数）"""
         if not comment_id:
             logger.error("更新评论失败: 缺少comment_id")
             return False
 
-        primary_key = [('comment_id', comment_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
+        primary_key = self._get_primary_key(comment_id)
+        if not primary_key:
+            if self._dual_read():
+                return self._legacy_update(comment_id, update_data, increment)
+            logger.error(f"更新评论失败: 评论不存在 comment_id={comment_id}")
+            return False
 
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
+        success, err = self.update_row(primary_key, update_data, increment)
 
         if not success:
             logger.error(f"更新评论失败: comment_id={comment_id}, err={err}")
@@ -106,11 +155,16 @@ class CommentRepository(BaseRepository):
         return True
 
     def delete(self, comment_id: str) -> bool:
-        """删除评论"""
-        success, err = ots_delete_row(
-            self.table_name,
-            primary_key=[('comment_id', comment_id)]
-        )
+        """删除评论（同时删除comment_id索引）"""
+        primary_key = self._get_primary_key(comment_id)
+        if primary_key:
+            success, err = ots_delete_row(self.table_name, primary_key=self._build_primary_key(primary_key))
+            if success:
+                ots_delete_row(self.index_table_name, primary_key=[('comment_id', comment_id)])
+        elif self._dual_read():
+            success, err = ots_delete_row(self.legacy_table_name, primary_key=[('comment_id', comment_id)])
+        else:
+            success, err = False, '评论不存在'
 
         if not success:
             logger.error(f"删除评论失败: comment_id={comment_id}, err={err}")
@@ -124,44 +178,177 @@ class CommentRepository(BaseRepository):
         all_comments = self.get_all(filters)
         return len(all_comments)
 
-    def get_by_book_id(self, book_id: str) -> List[Dict[str, Any]]:
-        """根据book_id获取所有评论"""
-        logger.info(f"【查询评论】目标图书ID: {book_id}，开始查询Comments表")
+    def get_by_book_id(self, book_id: str, cursor: str = None, limit: int = None) -> Dict[str, Any]:
+        """获取图书评论，返回 {'comments': 父评论列表, 'replies': 回复列表, 'next_cursor': 下一页游标}
+
+        - limit为None且无cursor：返回该图书全部评论（一次前缀范围读取）
+        - 分页：父评论按发布时间倒序每页limit条，回复为本页父评论下的全部回复
+        """
+        if limit is None and cursor is None:
+            comments = self._get_all_by_book(book_id)
+            logger.info(f"✅ 查询到评论数量: {len(comments)} 条（book_id={book_id}）")
+            return {
+                'comments': [comment for comment in comments if not comment['parent_id']],
+                'replies': [comment for comment in comments if comment['parent_id']],
+                'next_cursor': None
+            }
+
+        limit = max(1, min(limit or self.DEFAULT_PAGE_SIZE, self.MAX_PAGE_SIZE))
+        position = decode_cursor(cursor, 2, (int, str))
+
+        if self._dual_read():
+            # 迁移窗口内旧表评论不在连续区间中，合并后在内存中分页
+            return self._page_in_memory(self._get_all_by_book(book_id), position, limit)
+
+        # 1. 父评论：从游标位置倒序读取（多读1条判断是否有下一页）
+        start_pk = [('book_id', book_id), ('created_at', INF_MAX), ('comment_id', INF_MAX)]
+        if position:
+            start_pk = [('book_id', book_id), ('created_at', position[0]), ('comment_id', position[1])]
+        end_pk = [('book_id', book_id), ('created_at', INF_MIN), ('comment_id', INF_MIN)]
+
+        top_condition = SingleColumnCondition('parent_id', '', ComparatorType.EQUAL, pass_if_missing=True)
+        top_level = []
+        for comment in ots_iter_range(self.table_name, start_pk, end_pk, column_filter=top_condition,
+                                      max_rows=limit + 2, direction='BACKWARD'):
+            # 游标位置本身为上一页最后一条（起始主键为闭区间），跳过
+            if position and comment['comment_id'] == position[1]:
+                continue
+            top_level.append(self._normalize(comment))
+
+        has_more = len(top_level) > limit
+        top_level = top_level[:limit]
+        if not top_level:
+            return {'comments': [], 'replies': [], 'next_cursor': None}
+
+        # 2. 回复：创建时间不早于本页最早父评论，正向读取后按父评论归属过滤
+        parent_ids = {comment['comment_id'] for comment in top_level}
+        oldest = top_level[-1]
+        reply_condition = SingleColumnCondition('parent_id', '', ComparatorType.NOT_EQUAL, pass_if_missing=False)
+        replies = [
+            self._normalize(reply) for reply in ots_iter_range(
+                self.table_name,
+                [('book_id', book_id), ('created_at', oldest['created_at']), ('comment_id', INF_MIN)],
+                [('book_id', book_id), ('created_at', INF_MAX), ('comment_id', INF_MAX)],
+                column_filter=reply_condition
+            ) if reply.get('parent_id') in parent_ids
+        ]
 
-        condition = SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL)
-        comment_list = ots_get_range(
+        next_cursor = encode_cursor([oldest['created_at'], oldest['comment_id']]) if has_more else None
+        logger.info(f"✅ 评论分页查询: book_id={book_id}, 父评论{len(top_level)}条, 回复{len(replies)}条")
+        return {'comments': top_level, 'replies': replies, 'next_cursor': next_cursor}
+
+    def _get_all_by_book(self, book_id: str) -> List[Dict[str, Any]]:
+        """读取图书全部评论（迁移窗口内合并旧表）"""
+        comments = [self._normalize(comment) for comment in ots_iter_range(
             self.table_name,
-            start_pk=[('comment_id', INF_MIN)],
-            end_pk=[('comment_id', INF_MAX)],
-            column_filter=condition,
-            column_to_get=[
-                'comment_id', 'book_id', 'user_id', 'user_display_name', 'user_avatar_url',
-                'content', 'parent_id', 'likes', 'created_at', 'updated_at'
-            ]
+            [('book_id', book_id), ('created_at', INF_MIN), ('comment_id', INF_MIN)],
+            [('book_id', book_id), ('created_at', INF_MAX), ('comment_id', INF_MAX)]
+        )]
+
+        if self._dual_read():
+            comment_ids = {comment['comment_id'] for comment in comments}
+            condition = SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL, pass_if_missing=False)
+            for comment in ots_iter_range(
+                self.legacy_table_name,
+                start_pk=[('comment_id', INF_MIN)],
+                end_pk=[('comment_id', INF_MAX)],
+                column_filter=condition
+            ):
+                if comment['comment_id'] not in comment_ids:
+                    comments.append(self._normalize(comment))
+
+        return comments
+
+    @staticmethod
+    def _page_in_memory(comments: List[Dict[str, Any]], position: Optional[list], limit: int) -> Dict[str, Any]:
+        """在内存中按与范围读取相同的顺序和游标语义分页"""
+        top_level = sorted(
+            (comment for comment in comments if not comment['parent_id']),
+            key=lambda comment: (comment['created_at'], comment['comment_id']),
+            reverse=True
         )
-
-        logger.info(f"✅ 从OTS查询到的评论数量: {len(comment_list)} 条（book_id={book_id}）")
-
-        # 类型转换
-        for comment in comment_list:
-            if 'likes' in comment:
-                comment['likes'] = int(comment['likes'])
-
-        return comment_list
+        if position:
+            top_level = [comment for comment in top_level
+                         if (comment['created_at'], comment['comment_id']) < tuple(position)]
+
+        page = top_level[:limit]
+        parent_ids = {comment['comment_id'] for comment in page}
+        replies = sorted(
+            (comment for comment in comments if comment['parent_id'] in parent_ids),
+            key=lambda comment: (comment['created_at'], comment['comment_id'])
+        )
+        next_cursor = None
+        if len(top_level) > limit:
+            next_cursor = encode_cursor([page[-1]['created_at'], page[-1]['comment_id']])
+
+        return {'comments': page, 'replies': replies, 'next_cursor': next_cursor}
+
+    def _legacy_update(self, comment_id: str, update_data: Dict[str, Any], increment: Dict[str, int] = None) -> bool:
+        """更新旧Comments表中尚未迁移的评论（同样为部分列UpdateRow，不读取原记录）"""
+        success, err = ots_update_row(
+            self.legacy_table_name,
+            [('comment_id', comment_id)],
+            self._update_operations(update_data, increment, primary_key_names=('comment_id',)),
+            expect_exist=RowExistenceExpectation.EXPECT_EXIST
+        )
+        if not success:
+            logger.error(f"更新旧评论失败: comment_id={comment_id}, err={err}")
+        return success
+
+    def increment_likes(self, flush_id: str, deltas: Dict[str, int]) -> Dict[str, bool]:
+        """批量原子增减点赞数（CommentIdIndex批量解析主键 + BatchWriteRow INCREMENT），返回 {comment_id: 是否完成}
+
+        每行以 likes_flush_id != flush_id 为条件并写入flush_id：同一批次重放（请求超时后重试、落库中途崩溃）时
+        已生效的行条件不满足，不会重复累加；评论已删除（索引或评论行不存在）时同样条件不满足，视为完成，增量丢弃。
+        索引读取失败时抛出异常，整批留待下次重放
+        """
+        comment_ids = list(deltas)
+        index_rows = ots_batch_get_rows(self.index_table_name, [[('comment_id', comment_id)] for comment_id in comment_ids],
+                                        raise_on_error=True)
+        primary_keys = {
+            row['comment_id']: self._build_primary_key((row['book_id'], int(row['created_at']), row['comment_id']))
+            for row in index_rows
+        }
+
+        results = {}
+        targets = {self.table_name: [], self.legacy_table_name: []}
+        for comment_id in comment_ids:
+            if comment_id in primary_keys:
+                targets[self.table_name].append((comment_id, primary_keys[comment_id]))
+            elif self._dual_read():
+                targets[self.legacy_table_name].append((comment_id, [('comment_id', comment_id)]))
+            else:
+                logger.warning(f"点赞数落库跳过: 评论不存在 comment_id={comment_id}")
+                results[comment_id] = True
+
+        updated_at = int(time.time())
+        for table_name, items in targets.items():
+            if not items:
+                continue
+            operations = [{
+                'type': 'update',
+                'primary_key': primary_key,
+                'attribute_columns': {
+                    'put': [('updated_at', updated_at), ('likes_flush_id', flush_id)],
+                    'increment': [('likes', deltas[comment_id])]
+                },
+                'expect_exist': RowExistenceExpectation.EXPECT_EXIST,
+                'column_condition': SingleColumnCondition(
+                    'likes_flush_id', flush_id, ComparatorType.NOT_EQUAL, pass_if_missing=True
+                )
+            } for comment_id, primary_key in items]
+            for (comment_id, _), (success, err) in zip(items, ots_batch_write(table_name, operations)):
+                results[comment_id] = success or is_condition_check_failure(err)
+        return results
 
     def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
         """根据user_id获取用户所有评论"""
         condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
         comment_list = ots_get_range(
             self.table_name,
-            start_pk=[('comment_id', INF_MIN)],
-            end_pk=[('comment_id', INF_MAX)],
+            start_pk=[('book_id', INF_MIN), ('created_at', INF_MIN), ('comment_id', INF_MIN)],
+            end_pk=[('book_id', INF_MAX), ('created_at', INF_MAX), ('comment_id', INF_MAX)],
             column_filter=condition
         )
 
-        # 类型转换
-        for comment in comment_list:
-            if 'likes' in comment:
-                comment['likes'] = int(comment['likes'])
-
-        return comment_list
\ No newline at end of file
+        return [self._normalize(comment) for comment in comment_list]
@@ -1,54 +1,62 @@
 import time
-from typing import List, Dict, Any, Optional
-from tablestore import (
-    SingleColumnCondition, ComparatorType, CompositeColumnCondition,
-    LogicalOperator, INF_MIN, INF_MAX, RowExistenceExpectation
-)
-from config import logger, FAVORITES_TABLE
-from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
+from typing import List, Dict, Any, Optional, Tuple
+from tablestore import SingleColumnCondition, ComparatorType, INF_MIN, INF_MAX, RowExistenceExpectation
+from config import logger, FAVORITES_TABLE, USER_FAVORITES_TABLE, FAVORITES_DUAL_READ
+from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_iter_range, ots_delete_row, ots_batch_write
+from utils.migration_state import is_migration_done, mark_migration_done
 from repositories.base_repository import BaseRepository
 
+# 收藏迁移完成标记（scripts.migrate_favorites成功后写入，之后不再回查旧Favorites表）
+FAVORITES_MIGRATION = 'favorites'
+
 
 class FavoriteRepository(BaseRepository):
-    """收藏数据仓储层，负责所有收藏数据的OTS访问操作"""
+    """收藏数据仓储层，负责所有收藏数据的OTS访问操作
 
-    def __init__(self):
-        self.table_name = FAVORITES_TABLE
+    收藏表以(user_id, book_id)为复合主键：收藏检查为单次点查，用户收藏列表为主键前缀范围查询。
+    迁移窗口内（FAVORITES_DUAL_READ开启且迁移完成标记未写入）每个用户首次访问时扫描一次旧Favorites表
+    （favorite_id主键），把该用户的旧收藏条件写入新表并记录用户级迁移标记，之后该用户只访问新表。
+    迁移完成标记写入前，取消收藏在新表留下删除标记行（deleted=True）而不是删除整行：迁移脚本与用户级迁移均以
+    EXPECT_NOT_EXIST写入，不会把迁移期间已取消的收藏写回；读取时跳过删除标记行。
+    """
 
-    def get_by_id(self, favorite_id: str) -> Optional[Dict[str, Any]]:
-        """根据favorite_id获取收藏数据"""
-        logger.info(f"查询Favorites表: favorite_id={favorite_id}")
+    primary_key_names = ('user_id', 'book_id')
 
-        data = ots_get_row(self.table_name, primary_key=[('favorite_id', favorite_id)])
-        if not data:
-            logger.info(f"收藏记录不存在: favorite_id={favorite_id}")
-            return None
+    def __init__(self):
+        self.table_name = USER_FAVORITES_TABLE
+        self.legacy_table_name = FAVORITES_TABLE
 
-        logger.info(f"获取收藏记录成功: favorite_id={favorite_id}")
-        return data
+    @staticmethod
+    def _dual_read() -> bool:
+        """是否处于迁移窗口（需要回查旧表）"""
+        return FAVORITES_DUAL_READ and not is_migration_done(FAVORITES_MIGRATION)
+
+    def get_by_id(self, id: str) -> Optional[Dict[str, Any]]:
+        """复合主键表不支持单ID查询，请使用get_by_user_book"""
+        return None
 
     def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """获取所有收藏数据"""
-        all_favorites = ots_get_range(
+        all_favorites = [favorite for favorite in ots_get_range(
             self.table_name,
-            start_pk=[('favorite_id', INF_MIN)],
-            end_pk=[('favorite_id', INF_MAX)]
-        )
+            start_pk=[('user_id', INF_MIN), ('book_id', INF_MIN)],
+            end_pk=[('user_id', INF_MAX), ('book_id', INF_MAX)]
+        ) if not favorite.get('deleted')]
 
         logger.info(f"查询到收藏总数: {len(all_favorites)}")
         return all_favorites
 
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
-        """创建新收藏"""
-        favorite_id = entity_data.get('favorite_id')
-        if not favorite_id:
-            logger.error("创建收藏失败: 缺少favorite_id")
+        """创建新收藏（重复收藏为覆盖写，幂等）"""
+        user_id = entity_data.get('user_id')
+        book_id = entity_data.get('book_id')
+        if not user_id or not book_id:
+            logger.error("创建收藏失败: 缺少user_id或book_id")
             return None
 
-        primary_key = [('favorite_id', favorite_id)]
+        primary_key = [('user_id', user_id), ('book_id', book_id)]
         attribute_columns = [
-            ('user_id', entity_data['user_id']),
-            ('book_id', entity_data['book_id']),
+            ('favorite_id', entity_data['favorite_id']),
             ('created_at', entity_data['created_at']),
             ('updated_at', entity_data['updated_at'])
         ]
@@ -61,48 +69,33 @@ class FavoriteRepository(BaseRepository):
         )
 
         if not success:
-            logger.error(f"创建收藏失败: favorite_id={favorite_id}, err={err}")
+            logger.error(f"创建收藏失败: user_id={user_id}, book_id={book_id}, err={err}")
             return None
 
-        logger.info(
-            f"创建收藏成功: favorite_id={favorite_id}, user_id={entity_data['user_id']}, book_id={entity_data['book_id']}")
-        return favorite_id
-
-    def update(self, favorite_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新收藏数据"""
-        if not favorite_id:
-            logger.error("更新收藏失败: 缺少favorite_id")
-            return False
-
-        primary_key = [('favorite_id', favorite_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
+        logger.info(f"创建收藏成功: favorite_id={entity_data['favorite_id']}, user_id={user_id}, book_id={book_id}")
+        return entity_data['favorite_id']
 
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
+    def update(self, id: str, update_data: Dict[str, Any]) -> bool:
+        """收藏记录不支持更新"""
+        return False
 
-        if not success:
-            logger.error(f"更新收藏失败: favorite_id={favorite_id}, err={err}")
-            return False
-
-        logger.info(f"更新收藏成功: favorite_id={favorite_id}")
-        return True
-
-    def delete(self, favorite_id: str) -> bool:
-        """删除收藏"""
-        success, err = ots_delete_row(
-            self.table_name,
-            primary_key=[('favorite_id', favorite_id)]
-        )
+    def delete(self, user_id: str, book_id: str) -> bool:
+        """删除收藏（复合主键：user_id + book_id）；迁移完成前写入删除标记行，防止迁移把旧表记录写回"""
+        primary_key = [('user_id', user_id), ('book_id', book_id)]
+        if is_migration_done(FAVORITES_MIGRATION):
+            success, err = ots_delete_row(self.table_name, primary_key=primary_key)
+        else:
+            success, err = ots_put_row(
+                self.table_name, primary_key,
+                [('deleted', True), ('updated_at', int(time.time()))],
+                expect_exist=RowExistenceExpectation.IGNORE
+            )
 
         if not success:
-            logger.error(f"删除收藏失败: favorite_id={favorite_id}, err={err}")
+            logger.error(f"删除收藏失败: user_id={user_id}, book_id={book_id}, err={err}")
             return False
 
-        logger.info(f"删除收藏成功: favorite_id={favorite_id}")
+        logger.info(f"删除收藏成功: user_id={user_id}, book_id={book_id}")
         return True
 
     def count(self, filters: Dict[str, Any] = None) -> int:
@@ -111,107 +104,107 @@ class FavoriteRepository(BaseRepository):
         return len(all_favorites)
 
     def exists_by_user_book(self, user_id: str, book_id: str) -> bool:
-        """检查用户是否收藏该图书"""
-        logger.info(f"【收藏检查】开始检查: user_id={user_id}, book_id={book_id}，表={self.table_name}")
-
-        condition = CompositeColumnCondition(LogicalOperator.AND)
-        user_condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
-        book_condition = SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL)
-        condition.add_sub_condition(user_condition)
-        condition.add_sub_condition(book_condition)
-
-        logger.info(f"【收藏检查】过滤条件: user_id匹配={user_id}, book_id匹配={book_id}")
-
-        favorite_list = ots_get_range(
-            self.table_name,
-            start_pk=[('favorite_id', INF_MIN)],
-            end_pk=[('favorite_id', INF_MAX)],
-            column_filter=condition,
-            limit=1,
-            column_to_get=['favorite_id', 'user_id', 'book_id']
-        )
-
-        logger.info(f"【收藏检查】查询结果: 找到{len(favorite_list)}条记录")
-
-        if favorite_list:
-            logger.info(f"【收藏检查】匹配的原始记录: {favorite_list[0]}")
-        else:
-            # 无结果时打印所有记录，定位是否字段存储问题
-            all_favorites = ots_get_range(
-                self.table_name,
-                start_pk=[('favorite_id', INF_MIN)],
-                end_pk=[('favorite_id', INF_MAX)],
-                column_to_get=['favorite_id', 'user_id', 'book_id']
-            )
-            logger.info(f"【收藏检查】OTS中所有收藏记录: {all_favorites}")
-
-        return len(favorite_list) > 0
+        """检查用户是否收藏该图书（单次点查）"""
+        return self.get_by_user_book(user_id, book_id) is not None
 
     def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
-        """根据user_id获取用户所有收藏"""
-        logger.info(f"【收藏查询】开始查询: user_id={user_id}，表={self.table_name}")
-
-        condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
-        logger.info(f"【收藏查询】过滤条件: user_id匹配={user_id}（字符串精确匹配）")
-
+        """根据user_id获取用户所有收藏（主键前缀范围查询）"""
+        legacy_pending = self._migrate_user(user_id)
         favorite_list = ots_get_range(
             self.table_name,
-            start_pk=[('favorite_id', INF_MIN)],
-            end_pk=[('favorite_id', INF_MAX)],
-            column_filter=condition,
-            column_to_get=['favorite_id', 'user_id', 'book_id', 'created_at']
+            start_pk=[('user_id', user_id), ('book_id', INF_MIN)],
+            end_pk=[('user_id', user_id), ('book_id', INF_MAX)]
         )
 
-        logger.info(f"【收藏查询】查询结果: 找到{len(favorite_list)}条记录")
-
-        if favorite_list:
-            logger.info(f"【收藏查询】原始记录示例: {favorite_list[0]}")
-        else:
-            # 无结果时打印所有记录，定位是否字段存储问题
-            all_favorites = ots_get_range(
-                self.table_name,
-                start_pk=[('favorite_id', INF_MIN)],
-                end_pk=[('favorite_id', INF_MAX)],
-                column_to_get=['favorite_id', 'user_id', 'book_id']
-            )
-            logger.info(f"【收藏查询】OTS中所有收藏记录: {all_favorites}")
+        # 合并本次未能写入新表的旧记录（以book_id去重，新表优先，删除标记行同样屏蔽旧记录）
+        book_ids = {favorite['book_id'] for favorite in favorite_list}
+        for favorite in legacy_pending:
+            if favorite['book_id'] not in book_ids:
+                book_ids.add(favorite['book_id'])
+                favorite_list.append(favorite)
+        favorite_list = [favorite for favorite in favorite_list if not favorite.get('deleted')]
 
+        logger.info(f"【收藏查询】user_id={user_id}，找到{len(favorite_list)}条记录")
         return favorite_list
 
     def get_by_user_book(self, user_id: str, book_id: str) -> Optional[Dict[str, Any]]:
-        """根据用户ID和图书ID获取收藏记录"""
-        condition = CompositeColumnCondition(LogicalOperator.AND)
-        condition.add_sub_condition(SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL))
-        condition.add_sub_condition(SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL))
-
-        favorite_list = ots_get_range(
-            self.table_name,
-            start_pk=[('favorite_id', INF_MIN)],
-            end_pk=[('favorite_id', INF_MAX)],
-            column_filter=condition,
-            limit=1
-        )
+        """根据用户ID和图书ID获取收藏记录（单次点查）"""
+        legacy_pending = self._migrate_user(user_id)
+        data = ots_get_row(self.table_name, primary_key=[('user_id', user_id), ('book_id', book_id)])
+        if data:
+            return None if data.get('deleted') else data
 
-        if not favorite_list:
-            return None
+        for favorite in legacy_pending:
+            if favorite['book_id'] == book_id:
+                return favorite
 
-        return favorite_list[0]
+        return None
 
     def delete_by_user_book(self, user_id: str, book_id: str) -> bool:
-        """根据用户ID和图书ID删除收藏"""
-        # 1. 查找用户的该图书收藏记录
-        favorite_data = self.get_by_user_book(user_id, book_id)
-        if not favorite_data:
+        """根据用户ID和图书ID删除收藏（迁移窗口内同时按favorite_id删除旧表记录，单次点删）"""
+        favorite = self.get_by_user_book(user_id, book_id)
+        if not favorite:
             logger.warning(f"删除收藏失败: 未找到记录（user_id={user_id}, book_id={book_id}）")
             return False
 
-        # 2. 删除找到的收藏记录
-        favorite_id = favorite_data['favorite_id']
-        success = self.delete(favorite_id)
-
-        if not success:
-            logger.error(f"删除收藏失败: favorite_id={favorite_id}")
+        if not self.delete(user_id, book_id):
             return False
+        if self._dual_read() and favorite.get('favorite_id'):
+            self._legacy_delete(favorite['favorite_id'])
+        return True
 
-        logger.info(f"删除收藏成功: favorite_id={favorite_id}, user_id={user_id}, book_id={book_id}")
-        return True
\ No newline at end of file
+    def copy_from_legacy(self, favorites: List[Dict[str, Any]]) -> List[Tuple[bool, Optional[str]]]:
+        """旧收藏记录写入新表（BatchWriteRow，EXPECT_NOT_EXIST：不覆盖新收藏，也不写回已取消的收藏），
+        返回与favorites一一对应的 (success, err)，已存在时err以OTSConditionCheckFail开头"""
+        operations = []
+        for favorite in favorites:
+            current_time = int(time.time())
+            operations.append({
+                'type': 'put',
+                'primary_key': [('user_id', favorite['user_id']), ('book_id', favorite['book_id'])],
+                'attribute_columns': [
+                    ('favorite_id', favorite['favorite_id']),
+                    ('created_at', favorite.get('created_at', current_time)),
+                    ('updated_at', favorite.get('updated_at', current_time))
+                ],
+                'expect_exist': RowExistenceExpectation.EXPECT_NOT_EXIST
+            })
+        return ots_batch_write(self.table_name, operations)
+
+    def _migrate_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """迁移窗口内把用户的旧收藏写入新表（每个用户只扫描一次旧表），返回本次未能写入新表的旧记录
+
+        全部写入成功（或已存在）后记录用户级迁移标记；存在失败时不记录，下次访问重试，本次由调用方合并返回
+        """
+        if not self._dual_read():
+            return []
+        user_migration = f"{FAVORITES_MIGRATION}:{user_id}"
+        if is_migration_done(user_migration):
+            return []
+
+        legacy_list = [favorite for favorite in self._legacy_find(user_id) if favorite.get('book_id')]
+        pending = [
+            favorite for favorite, (success, err) in zip(legacy_list, self.copy_from_legacy(legacy_list))
+            if not success and not (err and err.startswith('OTSConditionCheckFail'))
+        ]
+        if pending:
+            logger.error(f"用户旧收藏迁移失败: user_id={user_id}, 失败={len(pending)}/{len(legacy_list)}")
+        else:
+            mark_migration_done(user_migration)
+        return pending
+
+    def _legacy_find(self, user_id: str) -> List[Dict[str, Any]]:
+        """在旧Favorites表中按user_id过滤扫描，仅用于迁移窗口内的用户级迁移"""
+        return list(ots_iter_range(
+            self.legacy_table_name,
+            start_pk=[('favorite_id', INF_MIN)],
+            end_pk=[('favorite_id', INF_MAX)],
+            column_filter=SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL, pass_if_missing=False)
+        ))
+
+    def _legacy_delete(self, favorite_id: str) -> bool:
+        """删除旧Favorites表中的记录"""
+        success, err = ots_delete_row(self.legacy_table_name, primary_key=[('favorite_id', favorite_id)])
+        if not success:
+            logger.error(f"删除旧收藏记录失败: favorite_id={favorite_id}, err={err}")
+        return success
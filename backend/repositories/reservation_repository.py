@@ -4,13 +4,28 @@ from tablestore import (
     SingleColumnCondition, ComparatorType, CompositeColumnCondition,
     LogicalOperator, INF_MIN, INF_MAX, RowExistenceExpectation
 )
-from config import logger, RESERVATIONS_TABLE
+from config import (
+    logger, RESERVATIONS_TABLE, RESERVATIONS_BY_USER_TABLE, RESERVATIONS_BY_BOOK_TABLE,
+    RESERVATIONS_BY_RETURN_DATE_TABLE, LOOKUP_INDEX_READS
+)
 from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
 from repositories.base_repository import BaseRepository
+from repositories.secondary_index import SecondaryIndex
 
 
 class ReservationRepository(BaseRepository):
-    """预约记录仓储层，负责所有预约数据的OTS访问操作"""
+    """预约记录仓储层，负责所有预约数据的OTS访问操作
+
+    按用户、按(图书, 状态)、按(状态, 预计归还日期)的查询通过索引表范围读取后回表，
+    索引表在create/update/delete（含批量接口）成功后同步维护
+    """
+
+    primary_key_names = ('reservation_id',)
+    by_user = SecondaryIndex(RESERVATIONS_BY_USER_TABLE, ('user_id', 'reservation_id'), ('book_id', 'status'))
+    by_book = SecondaryIndex(RESERVATIONS_BY_BOOK_TABLE, ('book_id', 'status', 'expected_return_date', 'reservation_id'))
+    by_return_date = SecondaryIndex(
+        RESERVATIONS_BY_RETURN_DATE_TABLE, ('status', 'expected_return_date', 'reservation_id'), ('user_id', 'book_id'))
+    secondary_indexes = (by_user, by_book, by_return_date)
 
     def __init__(self):
         self.table_name = RESERVATIONS_TABLE
@@ -69,6 +84,8 @@ class ReservationRepository(BaseRepository):
             logger.error(f"创建预约记录失败: reservation_id={reservation_id}, err={err}")
             return None
 
+        self._sync_secondary_indexes([(None, dict(attribute_columns, reservation_id=reservation_id))])
+
         logger.info(
             f"创建预约记录成功: reservation_id={reservation_id}, "
             f"user_id={entity_data['user_id']}, book_id={entity_data['book_id']}"
@@ -76,21 +93,12 @@ class ReservationRepository(BaseRepository):
         return reservation_id
 
     def update(self, reservation_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新预约记录"""
+        """更新预约记录（UpdateRow仅覆盖指定列，并同步索引表）"""
         if not reservation_id:
             logger.error("更新预约记录失败: 缺少reservation_id")
             return False
 
-        primary_key = [('reservation_id', reservation_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
-
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
-
+        success, err = self.update_row(reservation_id, update_data)
         if not success:
             logger.error(f"更新预约记录失败: reservation_id={reservation_id}, err={err}")
             return False
@@ -100,6 +108,7 @@ class ReservationRepository(BaseRepository):
 
     def delete(self, reservation_id: str) -> bool:
         """删除预约记录"""
+        old_data = self.get_by_id(reservation_id)
         success, err = ots_delete_row(
             self.table_name,
             primary_key=[('reservation_id', reservation_id)]
@@ -109,6 +118,8 @@ class ReservationRepository(BaseRepository):
             logger.error(f"删除预约记录失败: reservation_id={reservation_id}, err={err}")
             return False
 
+        if old_data:
+            self._sync_secondary_indexes([(old_data, None)])
         logger.info(f"删除预约记录成功: reservation_id={reservation_id}")
         return True
 
@@ -119,6 +130,9 @@ class ReservationRepository(BaseRepository):
 
     def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
         """根据user_id获取用户所有预约记录"""
+        if LOOKUP_INDEX_READS:
+            return self._get_by_index(self.by_user, (user_id,))
+
         condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
         reservation_list = ots_get_range(
             self.table_name,
@@ -131,6 +145,9 @@ class ReservationRepository(BaseRepository):
 
     def get_by_book_id(self, book_id: str) -> List[Dict[str, Any]]:
         """根据book_id获取图书的所有预约记录"""
+        if LOOKUP_INDEX_READS:
+            return self._get_by_index(self.by_book, (book_id,))
+
         condition = SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL)
         reservation_list = ots_get_range(
             self.table_name,
@@ -143,6 +160,16 @@ class ReservationRepository(BaseRepository):
 
     def get_active_by_user_book(self, user_id: str, book_id: str) -> Optional[Dict[str, Any]]:
         """获取用户对某本图书的活跃预约记录"""
+        if LOOKUP_INDEX_READS:
+            condition = CompositeColumnCondition(LogicalOperator.AND)
+            condition.add_sub_condition(SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL, False))
+            condition.add_sub_condition(SingleColumnCondition('status', 'reserved', ComparatorType.EQUAL, False))
+
+            for reservation in self._get_by_index(self.by_user, (user_id,), column_filter=condition):
+                if reservation.get('book_id') == book_id and reservation.get('status') == 'reserved':
+                    return reservation
+            return None
+
         condition = CompositeColumnCondition(LogicalOperator.AND)
         condition.add_sub_condition(SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL))
         condition.add_sub_condition(SingleColumnCondition('book_id', book_id, ComparatorType.EQUAL))
@@ -159,4 +186,22 @@ class ReservationRepository(BaseRepository):
         if not reservation_list:
             return None
 
-        return reservation_list[0]
\ No newline at end of file
+        return reservation_list[0]
+
+    def get_expected_return_before(self, timestamp: int, status: str = 'reserved') -> List[Dict[str, Any]]:
+        """获取指定状态下预计归还日期早于timestamp的预约记录（按预计归还日期升序）"""
+        if LOOKUP_INDEX_READS:
+            return self._get_by_index(self.by_return_date, (status,), upper=timestamp)
+
+        condition = CompositeColumnCondition(LogicalOperator.AND)
+        condition.add_sub_condition(SingleColumnCondition('status', status, ComparatorType.EQUAL))
+        condition.add_sub_condition(SingleColumnCondition('expected_return_date', timestamp, ComparatorType.LESS_THAN))
+
+        reservation_list = ots_get_range(
+            self.table_name,
+            start_pk=[('reservation_id', INF_MIN)],
+            end_pk=[('reservation_id', INF_MAX)],
+            column_filter=condition
+        )
+
+        return sorted(reservation_list, key=lambda reservation: reservation.get('expected_return_date') or 0)
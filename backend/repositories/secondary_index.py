@@ -0,0 +1,150 @@
+import json
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from tablestore import INF_MIN, INF_MAX
+from config import logger
+from utils.database import ots_batch_write, ots_iter_range
+from utils.redis_client import redis_client
+
+
+class SecondaryIndex:
+    """维护型索引表：索引行由主表行派生（主键列取自主表字段，最后一列需为主表主键），可冗余少量属性列
+
+    主表写入成功后由仓储层调用sync同步；索引键变化（如status、due_date变更）时删除旧索引行并写入新行。
+    读取方应以主表数据为准，容忍索引行短暂滞后。同步失败的行记入Redis修复队列，由repair按主表当前数据重写。
+
+    - derive：由主表行计算派生列（如分区键、倒序时间戳），派生列可作为索引主键列
+    - source_columns：影响索引行的主表列，更新未涉及这些列时无需同步（默认为主键列+属性列）
+    - name：多个索引共用一张索引表时用于区分修复队列（默认为索引表名）
+    """
+
+    def __init__(self, table_name: str, key_columns: Tuple[str, ...], attribute_columns: Tuple[str, ...] = (),
+                 derive: Callable[[Dict[str, Any]], Dict[str, Any]] = None, source_columns: Tuple[str, ...] = None,
+                 name: str = None):
+        self.table_name = table_name
+        self.name = f"{table_name}:{name}" if name else table_name
+        self.key_columns = key_columns
+        self.attribute_columns = attribute_columns
+        self.derive = derive
+        self.source_columns = frozenset(source_columns or key_columns + attribute_columns)
+
+    def affected_by(self, update_data: Dict[str, Any]) -> bool:
+        """判断主表更新是否可能改变索引行"""
+        return not self.source_columns.isdisjoint(update_data)
+
+    def row_key(self, entity: Optional[Dict[str, Any]]) -> Optional[tuple]:
+        """计算实体对应的索引主键，缺少任一索引列时返回None（该实体不建索引）"""
+        if not entity:
+            return None
+        if self.derive:
+            entity = {**entity, **self.derive(entity)}
+        values = tuple(entity.get(name) for name in self.key_columns)
+        if any(value is None or value == '' for value in values):
+            return None
+        return values
+
+    def _attributes(self, entity: Dict[str, Any]) -> list:
+        return [(name, entity[name]) for name in self.attribute_columns if name in entity]
+
+    def build_operations(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """根据主表行的新旧数据生成索引表写操作（old为None表示新建，new为None表示删除）"""
+        old_key = self.row_key(old)
+        new_key = self.row_key(new)
+        operations = []
+
+        if old_key and old_key != new_key:
+            operations.append({
+                'type': 'delete',
+                'primary_key': list(zip(self.key_columns, old_key))
+            })
+
+        if new_key:
+            attributes = self._attributes(new)
+            if old_key == new_key and attributes == self._attributes(old):
+                return operations
+            operations.append({
+                'type': 'put',
+                'primary_key': list(zip(self.key_columns, new_key)),
+                'attribute_columns': attributes
+            })
+
+        return operations
+
+    def sync(self, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> int:
+        """批量同步索引表，changes为(旧数据, 新数据)列表，返回失败行数"""
+        return self._write([op for old, new in changes for op in self.build_operations(old, new)])
+
+    def _write(self, operations: List[Dict[str, Any]]) -> int:
+        """批量写入索引表，失败的行记入修复队列（主表主键 + 待删除的旧索引主键），返回失败行数"""
+        if not operations:
+            return 0
+
+        repairs = []
+        for operation, (success, err) in zip(operations, ots_batch_write(self.table_name, operations)):
+            if not success:
+                logger.error(
+                    f"❌ 索引表同步失败: 表={self.table_name}, 操作={operation['type']}, "
+                    f"主键={operation['primary_key']}, err={err}"
+                )
+                # 索引主键最后一列为主表主键
+                repairs.append(json.dumps({
+                    'id': operation['primary_key'][-1][1],
+                    'delete': operation['primary_key'] if operation['type'] == 'delete' else None
+                }, ensure_ascii=False))
+
+        if repairs and not redis_client.add_index_repairs(self.name, repairs):
+            logger.error(f"❌ 索引修复项未能入队，需执行全量回填: 索引={self.name}, 条数={len(repairs)}")
+        return len(repairs)
+
+    def repair(self, get_many: Callable[[List[Any]], Dict[Any, Dict[str, Any]]], batch_size: int = 1000) -> int:
+        """处理修复队列：删除残留的旧索引行，再按主表当前数据重写索引行（主表行已删除则只删除），返回处理的项数
+
+        get_many(ids, raise_on_error=True)：按主表主键批量读取主表数据，读取失败时抛出异常（结果中缺失的主键即已删除）；
+        主表读取失败时修复项原样放回队列，仍失败的写入重新入队，并结束本次处理（留待下次执行）
+        """
+        processed = 0
+        while True:
+            raw_entries = redis_client.take_index_repairs(self.name, batch_size)
+            if not raw_entries:
+                break
+            entries = [json.loads(entry) for entry in raw_entries]
+
+            entity_ids = list(dict.fromkeys(entry['id'] for entry in entries))
+            try:
+                rows = get_many(entity_ids, raise_on_error=True)
+            except Exception as e:
+                logger.error(f"❌ 索引修复读取主表失败，修复项放回队列: 索引={self.name}, err={str(e)}")
+                if not redis_client.add_index_repairs(self.name, raw_entries):
+                    logger.error(f"❌ 索引修复项未能放回队列，需执行全量回填: 索引={self.name}, 条数={len(raw_entries)}")
+                break
+            processed += len(entries)
+            puts = [op for entity_id in entity_ids if entity_id in rows
+                    for op in self.build_operations(None, rows[entity_id])]
+            put_keys = {tuple(map(tuple, op['primary_key'])) for op in puts}
+            deletes = {
+                tuple(map(tuple, entry['delete'])) for entry in entries
+                if entry['delete'] and tuple(map(tuple, entry['delete'])) not in put_keys
+            }
+            operations = [{'type': 'delete', 'primary_key': list(key)} for key in deletes] + puts
+
+            failed = self._write(operations)
+            logger.info(f"🔧 索引修复: 索引={self.name}, 修复项={len(entries)}, 写入={len(operations)}, 失败={failed}")
+            if failed:
+                break
+        return processed
+
+    def iter_prefix(self, prefix: tuple, lower=INF_MIN, upper=INF_MAX, column_filter=None, max_rows=None,
+                    raise_on_error=False):
+        """按索引主键前缀范围读取索引行
+
+        前缀之后的第一列限定在[lower, upper)区间（默认全范围），其余列取全范围；raise_on_error同ots_iter_range
+        """
+        prefix_pk = list(zip(self.key_columns, prefix))
+        rest = self.key_columns[len(prefix):]
+        start_pk = prefix_pk + [(name, lower if i == 0 else INF_MIN) for i, name in enumerate(rest)]
+        end_pk = prefix_pk + [(name, upper if i == 0 else INF_MIN if upper is not INF_MAX else INF_MAX)
+                              for i, name in enumerate(rest)]
+
+        return ots_iter_range(
+            self.table_name, start_pk, end_pk,
+            column_filter=column_filter, max_rows=max_rows, raise_on_error=raise_on_error
+        )
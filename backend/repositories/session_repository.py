@@ -0,0 +1,95 @@
+import time
+import secrets
+from typing import List, Dict, Any, Optional
+from tablestore import RowExistenceExpectation
+from config import logger, SESSIONS_TABLE, SESSION_TTL_SECONDS
+from utils.database import ots_put_row, ots_get_row, ots_delete_row
+from repositories.base_repository import BaseRepository
+
+
+class SessionRepository(BaseRepository):
+    """登录会话仓储层（token为主键，过期行由OTS TTL自动清理）"""
+
+    primary_key_names = ('token',)
+
+    def __init__(self):
+        self.table_name = SESSIONS_TABLE
+
+    def get_by_id(self, token: str, raise_on_error: bool = False) -> Optional[Dict[str, Any]]:
+        """根据token获取会话（单次点查，已过期但尚未被TTL清理的会话视为不存在；raise_on_error开启时读取失败抛出异常）"""
+        if not token:
+            return None
+
+        data = ots_get_row(self.table_name, primary_key=[('token', token)], raise_on_error=raise_on_error)
+        if not data:
+            return None
+
+        if data.get('expire_at', 0) <= int(time.time()):
+            logger.info(f"会话已过期: user_id={data.get('user_id')}")
+            return None
+
+        return data
+
+    def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """会话表不支持全量查询"""
+        return []
+
+    def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
+        """创建会话"""
+        token = entity_data.get('token')
+        if not token:
+            logger.error("创建会话失败: 缺少token")
+            return None
+
+        attribute_columns = [
+            ('user_id', entity_data['user_id']),
+            ('role', entity_data.get('role', 'user')),
+            ('created_at', entity_data['created_at']),
+            ('expire_at', entity_data['expire_at'])
+        ]
+
+        success, err = ots_put_row(
+            self.table_name,
+            [('token', token)],
+            attribute_columns,
+            expect_exist=RowExistenceExpectation.EXPECT_NOT_EXIST
+        )
+
+        if not success:
+            logger.error(f"创建会话失败: user_id={entity_data['user_id']}, err={err}")
+            return None
+
+        logger.info(f"创建会话成功: user_id={entity_data['user_id']}, role={entity_data.get('role', 'user')}")
+        return token
+
+    def update(self, token: str, update_data: Dict[str, Any]) -> bool:
+        """会话不支持更新（重新登录生成新会话）"""
+        return False
+
+    def delete(self, token: str) -> bool:
+        """删除会话（注销）"""
+        success, err = ots_delete_row(self.table_name, primary_key=[('token', token)])
+
+        if not success:
+            logger.error(f"删除会话失败: err={err}")
+            return False
+
+        logger.info("删除会话成功")
+        return True
+
+    def count(self, filters: Dict[str, Any] = None) -> int:
+        """会话表不支持统计"""
+        return 0
+
+    def create_session(self, user_id: str, role: str = 'user') -> Optional[str]:
+        """为用户生成随机token并创建会话，返回token"""
+        current_time = int(time.time())
+        session_data = {
+            'token': secrets.token_urlsafe(32),
+            'user_id': user_id,
+            'role': role,
+            'created_at': current_time,
+            'expire_at': current_time + SESSION_TTL_SECONDS
+        }
+
+        return self.create(session_data)
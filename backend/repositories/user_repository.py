@@ -1,40 +1,177 @@
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from tablestore import (
-    SingleColumnCondition, ComparatorType, INF_MIN, INF_MAX, RowExistenceExpectation
+    SingleColumnCondition, ComparatorType, CompositeColumnCondition,
+    LogicalOperator, INF_MIN, INF_MAX, RowExistenceExpectation
 )
-from config import logger, USERS_TABLE
-from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
+from config import logger, USERS_TABLE, USER_ID_INDEX_TABLE
+from utils.database import (
+    ots_put_row, ots_get_row, ots_iter_range, ots_delete_row, ots_batch_get_rows, ots_batch_write
+)
+from utils.migration_state import is_migration_done
+from utils.parallel_scanner import ParallelScanner, TEXT_ALPHABET
 from repositories.base_repository import BaseRepository
 
+# UserIdIndex回填完成标记（scripts.backfill_user_id_index成功后写入，之后索引未命中不再扫描Users表）
+USER_ID_INDEX_MIGRATION = 'user_id_index'
+
 
 class UserRepository(BaseRepository):
     """用户数据仓储层，负责所有用户数据的OTS访问操作"""
 
+    primary_key_names = ('email',)
+
+    # OTS单个列过滤器中子条件数量上限
+    FILTER_MAX_CONDITIONS = 10
+
     def __init__(self):
         self.table_name = USERS_TABLE
+        self.index_table_name = USER_ID_INDEX_TABLE
 
-    def get_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """根据user_id获取用户数据"""
+    def get_by_id(self, user_id: str, raise_on_error: bool = False) -> Optional[Dict[str, Any]]:
+        """根据user_id获取用户数据（UserIdIndex点查email，再按email点查Users表）
+
+        raise_on_error开启时读取失败抛出异常，返回None即确认不存在
+        """
         logger.info(f"查询Users表: user_id={user_id}")
+        if not user_id:
+            return None
+
+        index_data = ots_get_row(self.index_table_name, primary_key=[('user_id', user_id)], raise_on_error=raise_on_error)
+        if index_data and index_data.get('email'):
+            user_data = ots_get_row(self.table_name, primary_key=[('email', index_data['email'])],
+                                    raise_on_error=raise_on_error)
+            if user_data and user_data.get('user_id') == user_id:
+                logger.info(f"获取用户成功: user_id={user_id}, email={user_data.get('email')}")
+                return user_data
 
-        # 通过email主键范围查询 + user_id过滤
-        condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
-        user_list = ots_get_range(
+        # 回填完成后以索引为准，未命中即不存在（避免无效/伪造的user_id触发全表扫描）
+        if is_migration_done(USER_ID_INDEX_MIGRATION):
+            logger.info(f"用户不存在: user_id={user_id}")
+            return None
+
+        # 回填前索引缺失（存量用户）或已失效：回退到过滤扫描并回填索引
+        user_data = self._scan_by_user_id(user_id, raise_on_error)
+        if not user_data:
+            logger.info(f"用户不存在: user_id={user_id}")
+            return None
+
+        self._put_index(user_id, user_data['email'])
+        logger.info(f"获取用户成功（扫描回退并回填索引）: user_id={user_id}, email={user_data.get('email')}")
+        return user_data
+
+    def _scan_by_user_id(self, user_id: str, raise_on_error: bool = False) -> Optional[Dict[str, Any]]:
+        """通过email主键范围查询 + user_id过滤（仅用于索引回填完成前的回退）"""
+        condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL, pass_if_missing=False)
+        user_list = list(ots_iter_range(
             self.table_name,
             start_pk=[('email', INF_MIN)],
             end_pk=[('email', INF_MAX)],
             column_filter=condition,
-            limit=1
+            max_rows=1,
+            raise_on_error=raise_on_error
+        ))
+
+        return user_list[0] if user_list else None
+
+    def _put_index(self, user_id: str, email: str) -> bool:
+        """写入/覆盖 user_id -> email 索引"""
+        success, err = ots_put_row(
+            self.index_table_name,
+            [('user_id', user_id)],
+            [('email', email)],
+            expect_exist=RowExistenceExpectation.IGNORE
         )
 
-        if not user_list:
-            logger.info(f"用户不存在: user_id={user_id}")
-            return None
+        if not success:
+            logger.warning(f"写入用户ID索引失败: user_id={user_id}, email={email}, err={err}")
+        return success
 
-        user_data = user_list[0]
-        logger.info(f"获取用户成功: user_id={user_id}, email={user_data.get('email')}")
-        return user_data
+    def _delete_index(self, user_id: str) -> bool:
+        """删除 user_id -> email 索引"""
+        success, err = ots_delete_row(self.index_table_name, primary_key=[('user_id', user_id)])
+        if not success:
+            logger.warning(f"删除用户ID索引失败: user_id={user_id}, err={err}")
+        return success
+
+    def get_many(self, user_ids: List[str], raise_on_error: bool = False) -> Dict[str, Dict[str, Any]]:
+        """根据user_id列表批量获取用户数据，返回以user_id为键的字典
+
+        先批量读取UserIdIndex得到email，再批量读取Users表；
+        索引回填完成前，未命中的user_id回退到OR条件过滤扫描并回填索引；
+        raise_on_error开启时读取失败抛出异常，结果中缺失的user_id即确认不存在
+        """
+        unique_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id]
+        if not unique_ids:
+            return {}
+
+        index_rows = ots_batch_get_rows(self.index_table_name, [[('user_id', user_id)] for user_id in unique_ids],
+                                        raise_on_error=raise_on_error)
+        emails = [row['email'] for row in index_rows if row.get('email')]
+
+        result = {}
+        for user_data in ots_batch_get_rows(self.table_name, [[('email', email)] for email in emails],
+                                            raise_on_error=raise_on_error):
+            if user_data.get('user_id'):
+                result[user_data['user_id']] = user_data
+
+        missing = [user_id for user_id in unique_ids if user_id not in result]
+        if missing and not is_migration_done(USER_ID_INDEX_MIGRATION):
+            scanned = self._scan_many(missing, raise_on_error)
+            result.update(scanned)
+            if scanned:
+                ots_batch_write(self.index_table_name, [{
+                    'type': 'put',
+                    'primary_key': [('user_id', user_id)],
+                    'attribute_columns': [('email', user_data['email'])]
+                } for user_id, user_data in scanned.items()])
+
+        logger.info(f"批量获取用户: 请求 {len(unique_ids)} 个, 命中 {len(result)} 个, 索引未命中 {len(missing)} 个")
+        return result
+
+    def _scan_many(self, user_ids: List[str], raise_on_error: bool = False) -> Dict[str, Dict[str, Any]]:
+        """OR条件范围查询批量查找用户（每次最多FILTER_MAX_CONDITIONS个user_id，仅用于索引缺失时的回退）"""
+        result = {}
+
+        for i in range(0, len(user_ids), self.FILTER_MAX_CONDITIONS):
+            chunk = user_ids[i:i + self.FILTER_MAX_CONDITIONS]
+            if len(chunk) == 1:
+                condition = SingleColumnCondition('user_id', chunk[0], ComparatorType.EQUAL, pass_if_missing=False)
+            else:
+                condition = CompositeColumnCondition(LogicalOperator.OR)
+                for user_id in chunk:
+                    condition.add_sub_condition(
+                        SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL, pass_if_missing=False)
+                    )
+
+            found = 0
+            for user_data in ots_iter_range(
+                self.table_name,
+                start_pk=[('email', INF_MIN)],
+                end_pk=[('email', INF_MAX)],
+                column_filter=condition,
+                raise_on_error=raise_on_error
+            ):
+                result[user_data['user_id']] = user_data
+                found += 1
+                if found == len(chunk):
+                    break
+
+        return result
+
+    def rebuild_user_id_index(self) -> Tuple[int, int]:
+        """全量重建UserIdIndex（并行扫描Users表并批量写入索引），返回 (写入成功条数, 用户数)"""
+        scanner = ParallelScanner(self.table_name, self.primary_key_names, alphabet=TEXT_ALPHABET)
+        operations = [{
+            'type': 'put',
+            'primary_key': [('user_id', user_data['user_id'])],
+            'attribute_columns': [('email', user_data['email'])]
+        } for user_data in scanner.iter_rows(column_to_get=['user_id']) if user_data.get('user_id')]
+
+        results = ots_batch_write(self.index_table_name, operations)
+        written = sum(1 for success, _ in results if success)
+        logger.info(f"用户ID索引重建完成: 用户数={len(operations)}, 写入成功={written}")
+        return written, len(operations)
 
     def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """根据email获取用户数据"""
@@ -49,23 +186,28 @@ class UserRepository(BaseRepository):
         return data
 
     def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """获取所有用户数据"""
-        all_users = ots_get_range(
-            self.table_name,
-            start_pk=[('email', INF_MIN)],
-            end_pk=[('email', INF_MAX)]
-        )
+        """获取所有用户数据（按邮箱前缀分片并行扫描）"""
+        scanner = ParallelScanner(self.table_name, self.primary_key_names, alphabet=TEXT_ALPHABET)
+        all_users = list(scanner.iter_rows())
 
         logger.info(f"查询到用户总数: {len(all_users)}")
         return all_users
 
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
-        """创建新用户"""
+        """创建新用户（先写user_id索引再写用户行）
+
+        索引回填完成后get_by_id不再扫描Users表，索引写入失败的用户将无法按user_id解析，因此索引写入失败即创建失败；
+        用户行写入失败时删除刚写入的索引行
+        """
         email = entity_data.get('email')
         if not email:
             logger.error("创建用户失败: 缺少email")
             return None
 
+        if not self._put_index(entity_data['user_id'], email):
+            logger.error(f"创建用户失败: 用户ID索引写入失败 email={email}")
+            return None
+
         primary_key = [('email', email)]
         attribute_columns = [
             ('user_id', entity_data['user_id']),
@@ -90,36 +232,48 @@ class UserRepository(BaseRepository):
 
         if not success:
             logger.error(f"创建用户失败: email={email}, err={err}")
+            self._delete_index(entity_data['user_id'])
             return None
 
         logger.info(f"创建用户成功: email={email}, user_id={entity_data['user_id']}")
         return entity_data['user_id']
 
     def update(self, email: str, update_data: Dict[str, Any]) -> bool:
-        """更新用户数据"""
+        """更新用户数据（UpdateRow仅发送指定列，未指定的列保持不变）
+
+        变更user_id时先写入新索引行（失败即更新失败），用户行更新成功后删除旧索引行
+        """
         if not email:
             logger.error("更新用户失败: 缺少email")
             return False
 
-        primary_key = [('email', email)]
-        update_columns = [(key, value) for key, value in update_data.items()]
+        new_user_id = update_data.get('user_id')
+        old_user_id = None
+        if new_user_id:
+            old_data = self.get_by_email(email)
+            old_user_id = old_data.get('user_id') if old_data else None
+            if old_user_id != new_user_id and not self._put_index(new_user_id, email):
+                logger.error(f"更新用户失败: 用户ID索引写入失败 email={email}, user_id={new_user_id}")
+                return False
 
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
+        success, err = self.update_row(email, update_data)
 
         if not success:
             logger.error(f"更新用户失败: email={email}, err={err}")
+            if new_user_id and old_user_id != new_user_id:
+                self._delete_index(new_user_id)
             return False
 
+        if old_user_id and old_user_id != new_user_id:
+            self._delete_index(old_user_id)
+
         logger.info(f"更新用户成功: email={email}")
         return True
 
     def delete(self, email: str) -> bool:
-        """删除用户（单主键：email，适配基类*args签名）"""
+        """删除用户（单主键：email，适配基类*args签名），同时删除user_id索引"""
+        user_data = self.get_by_email(email)
+
         success, err = ots_delete_row(
             self.table_name,
             primary_key=[('email', email)]
@@ -129,6 +283,9 @@ class UserRepository(BaseRepository):
             logger.error(f"删除用户失败: email={email}, err={err}")
             return False
 
+        if user_data and user_data.get('user_id'):
+            self._delete_index(user_data['user_id'])
+
         logger.info(f"删除用户成功: email={email}")
         return True
 
@@ -1,38 +1,59 @@
+import heapq
 import time
 import uuid
 from typing import List, Dict, Any, Optional
-from tablestore import (
-    SingleColumnCondition, ComparatorType, INF_MIN, INF_MAX, RowExistenceExpectation
+from tablestore import SingleColumnCondition, ComparatorType, INF_MIN, INF_MAX, RowExistenceExpectation
+from config import (
+    logger, VIEW_HISTORY_TABLE, USER_VIEW_HISTORY_TABLE, VIEW_HISTORY_MAX_PER_USER, VIEW_HISTORY_TTL_DAYS,
+    VIEW_HISTORY_DUAL_READ
 )
-from config import logger, VIEW_HISTORY_TABLE
-from utils.database import ots_put_row, ots_get_row, ots_get_range, ots_delete_row
+from utils.database import ots_put_row, ots_get_range, ots_iter_range, ots_delete_row
+from utils.migration_state import is_migration_done
 from repositories.base_repository import BaseRepository
 
+# 浏览历史迁移完成标记（scripts.migrate_view_history成功后写入，之后不再读取旧ViewHistory表）
+VIEW_HISTORY_MIGRATION = 'view_history'
+
 
 class ViewHistoryRepository(BaseRepository):
-    """浏览历史数据仓储层，负责所有浏览历史数据的OTS访问操作"""
+    """浏览历史数据仓储层，负责所有浏览历史数据的OTS访问操作
+
+    主键为(user_id, reverse_ts, book_id)，reverse_ts = MAX_TIMESTAMP_MS - 浏览时间毫秒数，
+    同一用户的记录在表内按浏览时间倒序排列，最近N条即一次有界的正向范围读取。
+    每个用户最多保留max_per_user条（读取时裁剪多余记录），更早的记录由表TTL自动清理。
+    迁移窗口内（VIEW_HISTORY_DUAL_READ开启且迁移完成标记未写入）读取时合并旧ViewHistory表（history_id主键）中的记录。
+    """
+
+    primary_key_names = ('user_id', 'reverse_ts', 'book_id')
+
+    # 13位毫秒时间戳上限，用于计算倒序时间戳
+    MAX_TIMESTAMP_MS = 10 ** 13 - 1
 
     def __init__(self):
-        self.table_name = VIEW_HISTORY_TABLE
+        self.table_name = USER_VIEW_HISTORY_TABLE
+        self.legacy_table_name = VIEW_HISTORY_TABLE
+        self.max_per_user = VIEW_HISTORY_MAX_PER_USER
 
-    def get_by_id(self, history_id: str) -> Optional[Dict[str, Any]]:
-        """根据history_id获取浏览历史数据"""
-        logger.info(f"查询ViewHistory表: history_id={history_id}")
+    @staticmethod
+    def _dual_read() -> bool:
+        """是否处于迁移窗口（需要合并旧表）"""
+        return VIEW_HISTORY_DUAL_READ and not is_migration_done(VIEW_HISTORY_MIGRATION)
 
-        data = ots_get_row(self.table_name, primary_key=[('history_id', history_id)])
-        if not data:
-            logger.info(f"浏览历史不存在: history_id={history_id}")
-            return None
+    @classmethod
+    def to_reverse_ts(cls, timestamp_ms: int) -> int:
+        """毫秒时间戳转换为倒序时间戳（越新越小）"""
+        return cls.MAX_TIMESTAMP_MS - timestamp_ms
 
-        logger.info(f"获取浏览历史成功: history_id={history_id}")
-        return data
+    def get_by_id(self, id: str) -> Optional[Dict[str, Any]]:
+        """复合主键表不支持单ID查询，请使用get_by_user_id"""
+        return None
 
     def get_all(self, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """获取所有浏览历史数据"""
         all_history = ots_get_range(
             self.table_name,
-            start_pk=[('history_id', INF_MIN)],
-            end_pk=[('history_id', INF_MAX)]
+            start_pk=[('user_id', INF_MIN), ('reverse_ts', INF_MIN), ('book_id', INF_MIN)],
+            end_pk=[('user_id', INF_MAX), ('reverse_ts', INF_MAX), ('book_id', INF_MAX)]
         )
 
         logger.info(f"查询到浏览历史总数: {len(all_history)}")
@@ -40,15 +61,18 @@ class ViewHistoryRepository(BaseRepository):
 
     def create(self, entity_data: Dict[str, Any]) -> Optional[str]:
         """创建新浏览历史"""
-        history_id = entity_data.get('history_id')
-        if not history_id:
-            logger.error("创建浏览历史失败: 缺少history_id")
+        user_id = entity_data.get('user_id')
+        if not user_id or entity_data.get('reverse_ts') is None:
+            logger.error("创建浏览历史失败: 缺少user_id或reverse_ts")
             return None
 
-        primary_key = [('history_id', history_id)]
+        primary_key = [
+            ('user_id', user_id),
+            ('reverse_ts', entity_data['reverse_ts']),
+            ('book_id', entity_data['book_id'])
+        ]
         attribute_columns = [
-            ('user_id', entity_data['user_id']),
-            ('book_id', entity_data['book_id']),
+            ('history_id', entity_data['history_id']),
             ('view_time', entity_data['view_time']),
             ('created_at', entity_data['created_at']),
             ('updated_at', entity_data['updated_at'])
@@ -62,48 +86,29 @@ class ViewHistoryRepository(BaseRepository):
         )
 
         if not success:
-            logger.error(f"创建浏览历史失败: history_id={history_id}, err={err}")
+            logger.error(f"创建浏览历史失败: user_id={user_id}, book_id={entity_data['book_id']}, err={err}")
             return None
 
         logger.info(
-            f"创建浏览历史成功: history_id={history_id}, user_id={entity_data['user_id']}, book_id={entity_data['book_id']}")
-        return history_id
+            f"创建浏览历史成功: history_id={entity_data['history_id']}, user_id={user_id}, book_id={entity_data['book_id']}")
+        return entity_data['history_id']
 
-    def update(self, history_id: str, update_data: Dict[str, Any]) -> bool:
-        """更新浏览历史数据"""
-        if not history_id:
-            logger.error("更新浏览历史失败: 缺少history_id")
-            return False
-
-        primary_key = [('history_id', history_id)]
-        update_columns = [(key, value) for key, value in update_data.items()]
+    def update(self, id: str, update_data: Dict[str, Any]) -> bool:
+        """浏览历史不支持更新"""
+        return False
 
-        success, err = ots_put_row(
-            self.table_name,
-            primary_key,
-            update_columns,
-            expect_exist=RowExistenceExpectation.IGNORE
-        )
-
-        if not success:
-            logger.error(f"更新浏览历史失败: history_id={history_id}, err={err}")
-            return False
-
-        logger.info(f"更新浏览历史成功: history_id={history_id}")
-        return True
-
-    def delete(self, history_id: str) -> bool:
-        """删除浏览历史"""
+    def delete(self, user_id: str, reverse_ts: int, book_id: str) -> bool:
+        """删除浏览历史（复合主键：user_id + reverse_ts + book_id）"""
         success, err = ots_delete_row(
             self.table_name,
-            primary_key=[('history_id', history_id)]
+            primary_key=[('user_id', user_id), ('reverse_ts', reverse_ts), ('book_id', book_id)]
         )
 
         if not success:
-            logger.error(f"删除浏览历史失败: history_id={history_id}, err={err}")
+            logger.error(f"删除浏览历史失败: user_id={user_id}, book_id={book_id}, err={err}")
             return False
 
-        logger.info(f"删除浏览历史成功: history_id={history_id}")
+        logger.info(f"删除浏览历史成功: user_id={user_id}, book_id={book_id}")
         return True
 
     def count(self, filters: Dict[str, Any] = None) -> int:
@@ -111,34 +116,171 @@ class ViewHistoryRepository(BaseRepository):
         all_history = self.get_all(filters)
         return len(all_history)
 
-    def get_by_user_id(self, user_id: str) -> List[Dict[str, Any]]:
-        """根据user_id获取用户所有浏览历史"""
-        condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL)
-        history_list = ots_get_range(
-            self.table_name,
+    def _user_range(self, user_id: str, start_reverse_ts=INF_MIN, start_book_id=INF_MIN):
+        """用户浏览历史的主键区间（按浏览时间倒序）"""
+        start_pk = [('user_id', user_id), ('reverse_ts', start_reverse_ts), ('book_id', start_book_id)]
+        end_pk = [('user_id', user_id), ('reverse_ts', INF_MAX), ('book_id', INF_MAX)]
+        return start_pk, end_pk
+
+    def get_by_user_id(self, user_id: str, limit: int = None) -> List[Dict[str, Any]]:
+        """获取用户最近的浏览历史（按浏览时间倒序，最多limit本不同的书，默认为保留上限）
+
+        同一本书只保留最近一条（合并窗口外的再次浏览、窗口内替换失败时会留下多条，更早的重复记录随即删除）；
+        流式读取直到得到limit + 1本不同的书或区间结束，多出的1本用于判断是否超出保留上限，超出时从该记录起裁剪
+        """
+        limit = min(limit or self.max_per_user, self.max_per_user)
+        seen = set()
+        history_list, duplicate_ids = [], []
+        oldest = None
+
+        for history, is_legacy in self._iter_user_rows(user_id, batch_size=limit + 1):
+            if history['book_id'] in seen:
+                if not is_legacy:
+                    duplicate_ids.append((user_id, history['reverse_ts'], history['book_id']))
+                continue
+            if len(history_list) == limit:
+                oldest = history
+                break
+            seen.add(history['book_id'])
+            history_list.append(history)
+
+        if duplicate_ids:
+            self.delete_many(duplicate_ids)
+            logger.info(f"浏览历史去重: user_id={user_id}, 删除重复记录={len(duplicate_ids)}")
+        if oldest is not None and limit == self.max_per_user:
+            self._trim_from(user_id, oldest['reverse_ts'], oldest['book_id'])
+
+        return history_list
+
+    def _iter_user_rows(self, user_id: str, batch_size: int):
+        """按浏览时间倒序流式返回用户的记录 (记录, 是否来自旧表)；迁移窗口内按主键顺序合并旧表记录，主键相同时只返回新表记录"""
+        start_pk, end_pk = self._user_range(user_id)
+        rows = (
+            ((history['reverse_ts'], history['book_id']), False, history)
+            for history in ots_iter_range(self.table_name, start_pk, end_pk, batch_size=batch_size)
+        )
+        if self._dual_read():
+            rows = heapq.merge(rows, self._legacy_rows(user_id), key=lambda item: item[:2])
+
+        last_key = None
+        for key, is_legacy, history in rows:
+            if key == last_key:
+                continue
+            last_key = key
+            yield history, is_legacy
+
+    def _legacy_rows(self, user_id: str) -> List[tuple]:
+        """旧表中该用户的记录（按user_id过滤扫描，转换为新表格式），按新表主键排序的 (主键, True, 记录) 列表
+
+        与迁移脚本一致，跳过浏览时间超过VIEW_HISTORY_TTL_DAYS的记录
+        """
+        min_view_time = int(time.time()) - VIEW_HISTORY_TTL_DAYS * 24 * 3600 if VIEW_HISTORY_TTL_DAYS > 0 else 0
+        condition = SingleColumnCondition('user_id', user_id, ComparatorType.EQUAL, pass_if_missing=False)
+        rows = []
+        for legacy in ots_iter_range(
+            self.legacy_table_name,
             start_pk=[('history_id', INF_MIN)],
             end_pk=[('history_id', INF_MAX)],
             column_filter=condition
-        )
+        ):
+            view_time = int(legacy.get('view_time', 0))
+            if not legacy.get('book_id') or view_time < min_view_time:
+                continue
+            history = dict(legacy, reverse_ts=self.to_reverse_ts(view_time * 1000))
+            rows.append(((history['reverse_ts'], history['book_id']), True, history))
 
-        return history_list
+        rows.sort(key=lambda item: item[:2])
+        return rows
 
-    def create_view_history(self, user_id: str, book_id: str) -> bool:
-        """创建浏览历史记录（封装创建逻辑）"""
-        # 生成唯一history_id
-        history_id = str(uuid.uuid4())
-        current_time = int(time.time())
+    def trim_user_history(self, user_id: str) -> int:
+        """裁剪用户超出保留上限的浏览历史，返回删除条数"""
+        start_pk, end_pk = self._user_range(user_id)
+        rows = list(ots_iter_range(
+            self.table_name, start_pk, end_pk,
+            column_to_get=['view_time'], max_rows=self.max_per_user + 1
+        ))
+        if len(rows) <= self.max_per_user:
+            return 0
+
+        oldest = rows[self.max_per_user]
+        return self._trim_from(user_id, oldest['reverse_ts'], oldest['book_id'])
 
-        # 组装浏览历史数据
-        history_data = {
-            'history_id': history_id,
+    def _trim_from(self, user_id: str, reverse_ts: int, book_id: str) -> int:
+        """删除用户从指定主键（含）开始的全部更早记录"""
+        start_pk, end_pk = self._user_range(user_id, reverse_ts, book_id)
+        expired_ids = [
+            (user_id, row['reverse_ts'], row['book_id'])
+            for row in ots_iter_range(self.table_name, start_pk, end_pk, column_to_get=['view_time'])
+        ]
+
+        if not expired_ids:
+            return 0
+
+        results = self.delete_many(expired_ids)
+        deleted = sum(1 for success in results.values() if success)
+        logger.info(f"浏览历史裁剪完成: user_id={user_id}, 保留上限={self.max_per_user}, 删除={deleted}")
+        return deleted
+
+    def build_view_history(self, user_id: str, book_id: str) -> Dict[str, Any]:
+        """组装一条浏览历史数据（浏览时间取当前时间，可稍后写入）"""
+        current_time_ms = int(time.time() * 1000)
+        current_time = current_time_ms // 1000
+
+        return {
+            'history_id': str(uuid.uuid4()),
             'user_id': user_id,
+            'reverse_ts': self.to_reverse_ts(current_time_ms),
             'book_id': book_id,
             'view_time': current_time,
             'created_at': current_time,
             'updated_at': current_time
         }
 
-        # 创建记录
-        result = self.create(history_data)
-        return result is not None
\ No newline at end of file
+    def apply_view_events(self, events: List[Dict[str, Any]]) -> List[bool]:
+        """批量写入浏览事件（BatchWriteRow），返回与events一一对应的成功标记
+
+        事件格式：{'history': 浏览历史数据, 'replaces': 被替换的旧记录ID (user_id, reverse_ts, book_id) 或None}
+        先写入新记录，再删除新记录已写入成功的被替换旧记录（新记录写入失败时旧记录保留，最近浏览不会丢失）；
+        旧记录在同一批内尚未写入时直接不写（连续刷新只落一条），该链上的事件随最终记录一同成功或失败
+        """
+        # 同一批内的替换链：最终记录ID -> (事件下标列表, 最终记录, 批次前已落库的被替换记录ID)
+        chains = {}
+        for i, event in enumerate(events):
+            history = event['history']
+            replaced = event.get('replaces')
+            owners, stored = [], replaced
+            if replaced is not None and replaced in chains:
+                owners, _, stored = chains.pop(replaced)
+            chains[self._entity_id(history)] = (owners + [i], history, stored)
+
+        results = [False] * len(events)
+        put_ids = list(chains)
+        put_operations = [{
+            'type': 'put',
+            'primary_key': self._build_primary_key(entity_id),
+            'attribute_columns': [(key, value) for key, value in chains[entity_id][1].items()
+                                  if key not in self.primary_key_names]
+        } for entity_id in put_ids]
+
+        delete_ids = []
+        for entity_id, success in zip(put_ids, self._batch_write(put_operations, put_ids, '写入浏览')):
+            if not success:
+                continue
+            owners, _, stored = chains[entity_id]
+            for i in owners:
+                results[i] = True
+            if stored is not None:
+                delete_ids.append(stored)
+
+        if delete_ids:
+            delete_operations = [{'type': 'delete', 'primary_key': self._build_primary_key(entity_id)}
+                                 for entity_id in delete_ids]
+            for entity_id, success in zip(delete_ids, self._batch_write(delete_operations, delete_ids, '删除被替换浏览')):
+                if not success:
+                    logger.warning(f"⚠️ 被替换的浏览记录删除失败（保留为重复记录）: id={entity_id}")
+        return results
+
+    def create_view_history(self, user_id: str, book_id: str) -> bool:
+        """创建浏览历史记录（封装创建逻辑）"""
+        result = self.create(self.build_view_history(user_id, book_id))
+        return result is not None
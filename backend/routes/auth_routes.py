@@ -63,10 +63,9 @@ def register_auth_routes(bp):
             # 调用认证服务完成登录
             success, result = login_user(email, password, admin_code)
             if success:
-                # 生成Token（沿用原有逻辑：以user_id作为Token）
-                token = result['user_id']
+                # Token由登录服务创建的会话生成（随机值，存于Sessions表）
                 return jsonify({
-                    'token': token,
+                    'token': result['token'],
                     'user_id': result['user_id'],
                     'email': email,
                     'role': result['role'],
@@ -2,7 +2,7 @@ import json
 from flask import request, jsonify
 from services.book_service import (
     get_book_list, get_book_detail, create_book,
-    update_book, delete_book, get_book_cover_url
+    update_book, delete_book, get_book_cover_url, search_books, suggest_books
 )
 from config import logger
 
@@ -20,11 +20,12 @@ def register_book_routes(bp):
             page = request.args.get('page', default=1, type=int)
             size = request.args.get('size', default=10, type=int)
             category = request.args.get('category', default='', type=str)
+            cursor = request.args.get('cursor', type=str)  # 游标分页（首页传空字符串），未传时按page分页
 
-            logger.info(f"📋 请求参数: page={page}, size={size}, category='{category}'")
+            logger.info(f"📋 请求参数: page={page}, size={size}, category='{category}', cursor={cursor!r}")
 
             # 调用图书服务
-            result = get_book_list(page=page, size=size, category=category)
+            result = get_book_list(page=page, size=size, category=category, cursor=cursor)
 
             # 记录响应状态
             status_code = result['statusCode']
@@ -61,6 +62,41 @@ def register_book_routes(bp):
             logger.error(f"处理图书创建失败: {str(e)}", exc_info=True)
             return jsonify({'error': 'Failed to create book'}), 500
 
+    @bp.route('/books/search', methods=['GET'])
+    def handle_search_books():
+        """全文检索图书（参数：q、page、size）"""
+        try:
+            query = request.args.get('q', default='', type=str)
+            page = request.args.get('page', default=1, type=int)
+            size = request.args.get('size', default=10, type=int)
+
+            result = search_books(query, page=page, size=size)
+            status_code = result['statusCode']
+            body = result['body']
+            if isinstance(body, str):
+                body = json.loads(body)
+            return jsonify(body), status_code
+        except Exception as e:
+            logger.error(f"处理图书检索失败: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Failed to search books'}), 500
+
+    @bp.route('/books/suggest', methods=['GET'])
+    def handle_suggest_books():
+        """书名/作者联想（参数：prefix、limit）"""
+        try:
+            prefix = request.args.get('prefix', default='', type=str)
+            limit = request.args.get('limit', default=10, type=int)
+
+            result = suggest_books(prefix, limit=limit)
+            status_code = result['statusCode']
+            body = result['body']
+            if isinstance(body, str):
+                body = json.loads(body)
+            return jsonify(body), status_code
+        except Exception as e:
+            logger.error(f"处理图书联想失败: {str(e)}", exc_info=True)
+            return jsonify({'error': 'Failed to suggest books'}), 500
+
     @bp.route('/books/<book_id>', methods=['GET'])
     def handle_get_book(book_id):
         """获取图书详情（对应原代码同名路由，自动记录浏览历史）"""
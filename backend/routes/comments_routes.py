@@ -9,9 +9,11 @@ def register_comments_routes(bp):
 
     @bp.route('/books/<book_id>/comments', methods=['GET'])
     def handle_get_comments(book_id):
-        """获取图书评论列表"""
+        """获取图书评论列表（可选分页参数：cursor、limit）"""
         try:
-            result = get_comments(book_id)
+            cursor = request.args.get('cursor')
+            limit = request.args.get('limit', type=int)
+            result = get_comments(book_id, cursor, limit)
             status_code = result['statusCode']
             body = result['body']
             if isinstance(body, str):
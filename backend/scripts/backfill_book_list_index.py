@@ -0,0 +1,21 @@
+"""存量图书回填BookListIndex（按创建时间倒序的全量列表及分类列表索引）
+
+在backend目录下执行：python -m scripts.backfill_book_list_index [--batch-size 200]
+可重复执行（索引写入为覆盖写）；BOOK_LIST_INDEX_READS默认关闭（列表为全表读取+内存排序），回填完成后再设为true。
+"""
+import argparse
+from config import logger
+from repositories.book_repository import BookRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回填图书列表索引表')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批处理的图书数')
+    args = parser.parse_args()
+
+    books = BookRepository().rebuild_secondary_indexes(args.batch_size)
+    logger.info(f"✅ 图书列表索引回填完成: {books} 本")
+
+
+if __name__ == '__main__':
+    main()
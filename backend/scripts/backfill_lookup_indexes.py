@@ -0,0 +1,24 @@
+"""存量借阅/预约记录回填查询索引表（按用户、按图书+状态、按日期）
+
+在backend目录下执行：python -m scripts.backfill_lookup_indexes [--batch-size 200]
+可重复执行（索引写入为覆盖写）；LOOKUP_INDEX_READS默认关闭（仓储层查询为全表过滤扫描），回填完成后再设为true。
+日常写入中同步失败的索引行由scripts.repair_secondary_indexes修复。
+"""
+import argparse
+from config import logger
+from repositories.borrow_repository import BorrowRepository
+from repositories.reservation_repository import ReservationRepository
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回填借阅/预约查询索引表')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批处理的主表行数')
+    args = parser.parse_args()
+
+    borrows = BorrowRepository().rebuild_secondary_indexes(args.batch_size)
+    reservations = ReservationRepository().rebuild_secondary_indexes(args.batch_size)
+    logger.info(f"✅ 查询索引回填完成: 借阅记录={borrows} 条, 预约记录={reservations} 条")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""存量用户回填UserIdIndex（user_id -> email）
+
+在backend目录下执行：python -m scripts.backfill_user_id_index
+可重复执行（索引写入为覆盖写）；未回填前的用户仍可通过get_by_id的扫描回退访问。
+全部写入成功后写入迁移完成标记，此后get_by_id/get_many以索引为准，不再扫描Users表。
+"""
+from config import logger
+from repositories.user_repository import UserRepository, USER_ID_INDEX_MIGRATION
+from utils.migration_state import mark_migration_done
+
+
+def main():
+    written, total = UserRepository().rebuild_user_id_index()
+    logger.info(f"✅ UserIdIndex回填完成: {written}/{total} 条")
+    if written == total:
+        mark_migration_done(USER_ID_INDEX_MIGRATION)
+    else:
+        logger.error("❌ 存在写入失败的索引，未写入迁移完成标记，请重新执行")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""并发借阅压测：N个线程同时对同一本书扣减库存，校验不超借并统计耗时
+
+在backend目录下执行：python -m scripts.bench_concurrent_borrow [--workers 50] [--stock 5] [--book-id ID] [--keep]
+未指定--book-id时创建一本临时图书（库存为--stock），结束后删除；指定时压测该书，结束后按成功数归还库存。
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import logger
+from models.book import Book
+from repositories.book_repository import BookRepository
+
+
+def _borrow_once(book_id: str, barrier: threading.Barrier):
+    """模拟一次借阅：读取图书后扣减1本库存，返回 (success, err, 耗时秒)"""
+    barrier.wait()
+    started = time.perf_counter()
+    book = Book.get_by_id(book_id)
+    if not book:
+        return False, "图书不存在", time.perf_counter() - started
+    success, err = book.update_stock(-1)
+    return success, err, time.perf_counter() - started
+
+
+def _percentile(values, ratio):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='并发借阅同一本书的库存扣减压测')
+    parser.add_argument('--workers', type=int, default=50, help='并发借阅数')
+    parser.add_argument('--stock', type=int, default=5, help='临时图书的初始库存')
+    parser.add_argument('--book-id', help='压测已有图书（不创建临时图书）')
+    parser.add_argument('--keep', action='store_true', help='保留临时图书及扣减后的库存')
+    args = parser.parse_args()
+
+    repository = BookRepository()
+    book_id = args.book_id
+    if not book_id:
+        success, book_id = Book.create_book({'title': '并发借阅压测', 'stock': args.stock})
+        if not success:
+            logger.error(f"❌ 创建临时图书失败: {book_id}")
+            return
+
+    initial = repository.get_by_id(book_id)
+    if not initial:
+        logger.error(f"❌ 图书不存在: book_id={book_id}")
+        return
+    initial_stock = int(initial.get('stock', 0))
+
+    barrier = threading.Barrier(args.workers)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(_borrow_once, book_id, barrier) for _ in range(args.workers)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(1 for success, _, _ in results if success)
+    insufficient = sum(1 for success, err, _ in results if not success and err == "库存不足")
+    failed = len(results) - succeeded - insufficient
+    latencies = [latency for _, _, latency in results]
+
+    final = repository.get_by_id(book_id) or {}
+    final_stock = int(final.get('stock', 0))
+    expected_stock = initial_stock - succeeded
+    oversold = succeeded > initial_stock or final_stock < 0
+
+    logger.info(
+        f"📊 并发借阅压测: 并发={args.workers}, 初始库存={initial_stock}, 成功={succeeded}, "
+        f"库存不足={insufficient}, 失败={failed}, 最终库存={final_stock}（预期{expected_stock}）, "
+        f"最终状态={final.get('status')}"
+    )
+    logger.info(
+        f"⏱️ 总耗时={elapsed:.3f}s, 单次p50={_percentile(latencies, 0.5) * 1000:.1f}ms, "
+        f"p99={_percentile(latencies, 0.99) * 1000:.1f}ms"
+    )
+    if oversold or final_stock != expected_stock:
+        logger.error("❌ 库存不一致：出现超借或扣减丢失")
+    else:
+        logger.info("✅ 未超借，库存与成功借阅数一致")
+
+    if args.keep:
+        return
+    if args.book_id:
+        if succeeded:
+            Book(final).update_stock(succeeded)
+        logger.info(f"已归还压测扣减的库存: {succeeded} 本")
+    else:
+        Book(final or initial).delete_book()
+        logger.info(f"已删除临时图书: book_id={book_id}")
+
+
+if __name__ == '__main__':
+    main()
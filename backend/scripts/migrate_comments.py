@@ -0,0 +1,119 @@
+"""旧Comments表（comment_id主键）迁移到BookComments表（book_id + created_at + comment_id主键）
+
+在backend目录下执行：python -m scripts.migrate_comments [--batch-size 200] [--checkpoint PATH] [--reset]
+- 按comment_id顺序流式扫描旧表，每批先写CommentIdIndex再写BookComments（均为BatchWriteRow）
+- 每批完成后将最后一个comment_id写入检查点文件，中断后重新执行从检查点继续
+- BookComments写入使用EXPECT_NOT_EXIST，不覆盖迁移期间已在新表中更新的评论（如点赞数）
+全部记录迁移成功（failed为0）后写入迁移完成标记，各进程随即停止读取旧表；存在失败时修复后使用--reset重新执行。
+"""
+import argparse
+from tablestore import INF_MAX, RowExistenceExpectation
+from config import logger, COMMENTS_TABLE, BOOK_COMMENTS_TABLE, COMMENT_ID_INDEX_TABLE
+from utils.database import ots_iter_range, ots_batch_write, BATCH_WRITE_ROW_LIMIT
+from repositories.comment_repository import COMMENTS_MIGRATION
+from scripts.migration_checkpoint import checkpoint_path, load_checkpoint, save_checkpoint, reset_checkpoint
+from utils.migration_state import mark_migration_done
+
+DEFAULT_CHECKPOINT = checkpoint_path('migrate_comments')
+
+# 迁移到新表的属性列（主键列除外）
+ATTRIBUTE_COLUMNS = ('user_id', 'user_display_name', 'user_avatar_url', 'content', 'parent_id', 'likes', 'updated_at')
+
+
+def write_batch(batch, stats):
+    """将一批旧评论写入索引表和新评论表，统计成功/已存在/失败数量"""
+    index_operations = [{
+        'type': 'put',
+        'primary_key': [('comment_id', comment['comment_id'])],
+        'attribute_columns': [('book_id', comment['book_id']), ('created_at', int(comment['created_at']))]
+    } for comment in batch]
+
+    index_results = ots_batch_write(COMMENT_ID_INDEX_TABLE, index_operations)
+    indexed = [comment for comment, (success, _) in zip(batch, index_results) if success]
+    for comment, (success, err) in zip(batch, index_results):
+        if not success:
+            stats['failed'] += 1
+            logger.error(f"❌ 评论索引写入失败: comment_id={comment['comment_id']}, err={err}")
+
+    operations = [{
+        'type': 'put',
+        'primary_key': [
+            ('book_id', comment['book_id']),
+            ('created_at', int(comment['created_at'])),
+            ('comment_id', comment['comment_id'])
+        ],
+        'attribute_columns': [(name, comment[name]) for name in ATTRIBUTE_COLUMNS if name in comment],
+        'expect_exist': RowExistenceExpectation.EXPECT_NOT_EXIST
+    } for comment in indexed]
+
+    for comment, (success, err) in zip(indexed, ots_batch_write(BOOK_COMMENTS_TABLE, operations)):
+        if success:
+            stats['migrated'] += 1
+        elif err and err.startswith('OTSConditionCheckFail'):
+            stats['existed'] += 1
+        else:
+            stats['failed'] += 1
+            logger.error(f"❌ 评论迁移失败: comment_id={comment['comment_id']}, err={err}")
+
+
+def migrate(batch_size, checkpoint_file):
+    checkpoint = load_checkpoint(checkpoint_file)
+    last_comment_id = checkpoint.get('last_comment_id')
+    start_key = last_comment_id if last_comment_id is not None else ''
+    logger.info(f"🚚 开始迁移评论: {COMMENTS_TABLE} -> {BOOK_COMMENTS_TABLE}, 起点={last_comment_id or '表头'}")
+
+    # 失败数跨断点续传累计：之前批次的失败记录已被检查点跳过，需--reset重新迁移后才写入完成标记
+    stats = {'scanned': 0, 'migrated': 0, 'existed': 0, 'skipped': 0,
+             'failed': checkpoint.get('stats', {}).get('failed', 0)}
+    batch = []
+
+    def flush():
+        write_batch(batch, stats)
+        save_checkpoint(checkpoint_file, {'last_comment_id': batch[-1]['comment_id'], 'stats': stats})
+        logger.info(f"📦 评论迁移进度: {stats}")
+
+    for comment in ots_iter_range(
+        COMMENTS_TABLE,
+        start_pk=[('comment_id', start_key)],
+        end_pk=[('comment_id', INF_MAX)],
+        raise_on_error=True
+    ):
+        # 起点为检查点本身（左闭区间），已迁移过，跳过
+        if comment['comment_id'] == last_comment_id:
+            continue
+
+        stats['scanned'] += 1
+        if not comment.get('book_id') or comment.get('created_at') is None:
+            stats['skipped'] += 1
+            logger.warning(f"⚠️ 跳过缺少book_id/created_at的评论: comment_id={comment['comment_id']}")
+            continue
+
+        batch.append(comment)
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+
+    if batch:
+        flush()
+
+    logger.info(f"✅ 评论迁移完成: {stats}")
+    if stats['failed'] == 0:
+        mark_migration_done(COMMENTS_MIGRATION)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='迁移评论数据到按图书连续存储的BookComments表')
+    parser.add_argument('--batch-size', type=int, default=BATCH_WRITE_ROW_LIMIT, help='每批写入行数')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='检查点文件路径')
+    parser.add_argument('--reset', action='store_true', help='忽略检查点，从表头重新迁移')
+    args = parser.parse_args()
+
+    if args.reset:
+        reset_checkpoint(args.checkpoint)
+
+    migrate(args.batch_size, args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""旧Favorites表（favorite_id主键）迁移到UserFavorites表（user_id + book_id复合主键）
+
+在backend目录下执行：python -m scripts.migrate_favorites [--batch-size 200] [--checkpoint PATH] [--reset]
+- 按favorite_id顺序流式扫描旧表，每批通过BatchWriteRow写入新表
+- 每批完成后将最后一个favorite_id写入检查点文件，中断后重新执行从检查点继续
+- 新表写入使用EXPECT_NOT_EXIST，不覆盖迁移期间用户新产生的收藏，也不写回迁移期间已取消的收藏
+  （取消收藏在新表留有删除标记行），两者均计为已存在
+全部记录迁移成功（failed为0）后写入迁移完成标记，各进程随即停止回查旧表；存在失败时修复后使用--reset重新执行。
+"""
+import argparse
+from tablestore import INF_MAX
+from config import logger, FAVORITES_TABLE, USER_FAVORITES_TABLE
+from utils.database import ots_iter_range, BATCH_WRITE_ROW_LIMIT
+from repositories.favorite_repository import FavoriteRepository, FAVORITES_MIGRATION
+from scripts.migration_checkpoint import checkpoint_path, load_checkpoint, save_checkpoint, reset_checkpoint
+from utils.migration_state import mark_migration_done
+
+DEFAULT_CHECKPOINT = checkpoint_path('migrate_favorites')
+
+
+def write_batch(batch, stats):
+    """将一批旧收藏记录写入新表，统计成功/已存在/失败数量"""
+    for favorite, (success, err) in zip(batch, FavoriteRepository().copy_from_legacy(batch)):
+        if success:
+            stats['migrated'] += 1
+        elif err and err.startswith('OTSConditionCheckFail'):
+            stats['existed'] += 1
+        else:
+            stats['failed'] += 1
+            logger.error(f"❌ 收藏迁移失败: favorite_id={favorite['favorite_id']}, err={err}")
+
+
+def migrate(batch_size, checkpoint_file):
+    checkpoint = load_checkpoint(checkpoint_file)
+    last_favorite_id = checkpoint.get('last_favorite_id')
+    start_key = last_favorite_id if last_favorite_id is not None else ''
+    logger.info(f"🚚 开始迁移收藏: {FAVORITES_TABLE} -> {USER_FAVORITES_TABLE}, 起点={last_favorite_id or '表头'}")
+
+    # 失败数跨断点续传累计：之前批次的失败记录已被检查点跳过，需--reset重新迁移后才写入完成标记
+    stats = {'scanned': 0, 'migrated': 0, 'existed': 0, 'skipped': 0,
+             'failed': checkpoint.get('stats', {}).get('failed', 0)}
+    batch = []
+
+    for favorite in ots_iter_range(
+        FAVORITES_TABLE,
+        start_pk=[('favorite_id', start_key)],
+        end_pk=[('favorite_id', INF_MAX)],
+        raise_on_error=True
+    ):
+        # 起点为检查点本身（左闭区间），已迁移过，跳过
+        if favorite['favorite_id'] == last_favorite_id:
+            continue
+
+        stats['scanned'] += 1
+        if not favorite.get('user_id') or not favorite.get('book_id'):
+            stats['skipped'] += 1
+            logger.warning(f"⚠️ 跳过缺少user_id/book_id的收藏: favorite_id={favorite['favorite_id']}")
+            continue
+
+        batch.append(favorite)
+        if len(batch) >= batch_size:
+            write_batch(batch, stats)
+            save_checkpoint(checkpoint_file, {'last_favorite_id': batch[-1]['favorite_id'], 'stats': stats})
+            logger.info(f"📦 收藏迁移进度: {stats}")
+            batch = []
+
+    if batch:
+        write_batch(batch, stats)
+        save_checkpoint(checkpoint_file, {'last_favorite_id': batch[-1]['favorite_id'], 'stats': stats})
+
+    logger.info(f"✅ 收藏迁移完成: {stats}")
+    if stats['failed'] == 0:
+        mark_migration_done(FAVORITES_MIGRATION)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='迁移收藏数据到复合主键表UserFavorites')
+    parser.add_argument('--batch-size', type=int, default=BATCH_WRITE_ROW_LIMIT, help='每批写入行数')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='检查点文件路径')
+    parser.add_argument('--reset', action='store_true', help='忽略检查点，从表头重新迁移')
+    args = parser.parse_args()
+
+    if args.reset:
+        reset_checkpoint(args.checkpoint)
+
+    migrate(args.batch_size, args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
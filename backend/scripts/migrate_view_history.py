@@ -0,0 +1,120 @@
+"""旧ViewHistory表（history_id主键）迁移到UserViewHistory表（user_id + 倒序时间戳主键）
+
+在backend目录下执行：python -m scripts.migrate_view_history [--batch-size 200] [--checkpoint PATH] [--reset] [--no-trim]
+- 按history_id顺序流式扫描旧表，每批通过BatchWriteRow写入新表
+- 每批完成后将最后一个history_id写入检查点文件，中断后重新执行从检查点继续
+- 迁移完成后对本次涉及的用户按VIEW_HISTORY_MAX_PER_USER裁剪（--no-trim跳过，读取时也会自动裁剪）
+超过VIEW_HISTORY_TTL_DAYS的旧记录不再迁移。全部记录迁移成功（failed为0）后写入迁移完成标记，各进程随即停止读取旧表；
+存在失败时修复后使用--reset重新执行。迁移前部署的读路径在标记写入前合并旧表，部署与迁移无先后要求。
+"""
+import argparse
+import time
+from tablestore import INF_MAX, RowExistenceExpectation
+from config import logger, VIEW_HISTORY_TABLE, USER_VIEW_HISTORY_TABLE, VIEW_HISTORY_TTL_DAYS
+from utils.database import ots_iter_range, ots_batch_write, BATCH_WRITE_ROW_LIMIT
+from repositories.view_history_repository import ViewHistoryRepository, VIEW_HISTORY_MIGRATION
+from scripts.migration_checkpoint import checkpoint_path, load_checkpoint, save_checkpoint, reset_checkpoint
+from utils.migration_state import mark_migration_done
+
+DEFAULT_CHECKPOINT = checkpoint_path('migrate_view_history')
+
+
+def write_batch(batch, stats):
+    """将一批旧浏览历史写入新表，统计成功/已存在/失败数量"""
+    operations = [{
+        'type': 'put',
+        'primary_key': [
+            ('user_id', history['user_id']),
+            ('reverse_ts', ViewHistoryRepository.to_reverse_ts(int(history['view_time']) * 1000)),
+            ('book_id', history['book_id'])
+        ],
+        'attribute_columns': [
+            ('history_id', history['history_id']),
+            ('view_time', history['view_time']),
+            ('created_at', history.get('created_at', history['view_time'])),
+            ('updated_at', history.get('updated_at', history['view_time']))
+        ],
+        'expect_exist': RowExistenceExpectation.EXPECT_NOT_EXIST
+    } for history in batch]
+
+    for history, (success, err) in zip(batch, ots_batch_write(USER_VIEW_HISTORY_TABLE, operations)):
+        if success:
+            stats['migrated'] += 1
+        elif err and err.startswith('OTSConditionCheckFail'):
+            stats['existed'] += 1
+        else:
+            stats['failed'] += 1
+            logger.error(f"❌ 浏览历史迁移失败: history_id={history['history_id']}, err={err}")
+
+
+def migrate(batch_size, checkpoint_file, trim=True):
+    checkpoint = load_checkpoint(checkpoint_file)
+    last_history_id = checkpoint.get('last_history_id')
+    start_key = last_history_id if last_history_id is not None else ''
+    logger.info(f"🚚 开始迁移浏览历史: {VIEW_HISTORY_TABLE} -> {USER_VIEW_HISTORY_TABLE}, 起点={last_history_id or '表头'}")
+
+    # OTS TTL从写入时间起算，迁移写入的旧记录会从迁移时起再保留TTL天，不会按浏览时间过期；超过保留天数的记录在此显式跳过
+    min_view_time = int(time.time()) - VIEW_HISTORY_TTL_DAYS * 24 * 3600 if VIEW_HISTORY_TTL_DAYS > 0 else 0
+
+    # 失败数跨断点续传累计：之前批次的失败记录已被检查点跳过，需--reset重新迁移后才写入完成标记
+    stats = {'scanned': 0, 'migrated': 0, 'existed': 0, 'skipped': 0,
+             'failed': checkpoint.get('stats', {}).get('failed', 0), 'trimmed': 0}
+    touched_users = set()
+    batch = []
+
+    def flush():
+        write_batch(batch, stats)
+        save_checkpoint(checkpoint_file, {'last_history_id': batch[-1]['history_id'], 'stats': stats})
+        logger.info(f"📦 浏览历史迁移进度: {stats}")
+
+    for history in ots_iter_range(
+        VIEW_HISTORY_TABLE,
+        start_pk=[('history_id', start_key)],
+        end_pk=[('history_id', INF_MAX)],
+        raise_on_error=True
+    ):
+        # 起点为检查点本身（左闭区间），已迁移过，跳过
+        if history['history_id'] == last_history_id:
+            continue
+
+        stats['scanned'] += 1
+        if not history.get('user_id') or not history.get('book_id') or int(history.get('view_time', 0)) < min_view_time:
+            stats['skipped'] += 1
+            continue
+
+        batch.append(history)
+        touched_users.add(history['user_id'])
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+
+    if batch:
+        flush()
+
+    if trim:
+        repository = ViewHistoryRepository()
+        for user_id in touched_users:
+            stats['trimmed'] += repository.trim_user_history(user_id)
+
+    logger.info(f"✅ 浏览历史迁移完成: {stats}")
+    if stats['failed'] == 0:
+        mark_migration_done(VIEW_HISTORY_MIGRATION)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='迁移浏览历史到UserViewHistory表')
+    parser.add_argument('--batch-size', type=int, default=BATCH_WRITE_ROW_LIMIT, help='每批写入行数')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='检查点文件路径')
+    parser.add_argument('--reset', action='store_true', help='忽略检查点，从表头重新迁移')
+    parser.add_argument('--no-trim', action='store_true', help='迁移后不按保留上限裁剪')
+    args = parser.parse_args()
+
+    if args.reset:
+        reset_checkpoint(args.checkpoint)
+
+    migrate(args.batch_size, args.checkpoint, trim=not args.no_trim)
+
+
+if __name__ == '__main__':
+    main()
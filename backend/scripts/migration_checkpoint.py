@@ -0,0 +1,31 @@
+"""迁移脚本共用的检查点读写（JSON文件，原子替换写入）"""
+import json
+import os
+import time
+
+
+def checkpoint_path(name):
+    """默认检查点路径：scripts/.{name}.checkpoint"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'.{name}.checkpoint')
+
+
+def load_checkpoint(path):
+    """读取检查点，无检查点返回空字典"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    """原子写入检查点（先写临时文件再替换）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(state, updated_at=int(time.time())), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def reset_checkpoint(path):
+    """删除检查点，下次从头开始"""
+    if os.path.exists(path):
+        os.remove(path)
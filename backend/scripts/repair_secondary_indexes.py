@@ -0,0 +1,20 @@
+"""处理索引表同步失败的修复队列（主表写入成功但索引写入失败的行）
+
+在backend目录下执行：python -m scripts.repair_secondary_indexes
+按主表当前数据重写索引行并删除残留的旧索引行，可重复执行；建议定期执行（如每分钟）。
+修复队列保存在Redis中，Redis不可用期间的同步失败未能入队时需重新执行全量回填脚本。
+"""
+from config import logger
+from repositories.book_repository import BookRepository
+from repositories.borrow_repository import BorrowRepository
+from repositories.reservation_repository import ReservationRepository
+
+
+def main():
+    for repository in (BorrowRepository(), ReservationRepository(), BookRepository()):
+        processed = repository.repair_secondary_indexes()
+        logger.info(f"✅ 索引修复完成: 表={repository.table_name}, 修复项={processed}")
+
+
+if __name__ == '__main__':
+    main()
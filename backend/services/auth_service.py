@@ -1,7 +1,7 @@
 import time
 from config import logger, VERIFICATION_CODES_TABLE
 from utils.email import send_verification_code
-from utils.auth import verify_admin_code, hash_password
+from utils.auth import verify_admin_code, hash_password, create_session_token
 from utils.database import ots_get_row
 from models.user import User
 
@@ -113,11 +113,19 @@ def login_user(email, password, admin_code=None):
         is_temporary_admin = True
         logger.info(f"用户获取临时管理员权限: email={email}")
 
-    # 4. 组装返回数据（与原代码一致）
+    # 4. 创建登录会话（随机Token，写入Sessions表）
+    role = 'admin' if is_temporary_admin else user.role
+    token = create_session_token(user.user_id, role)
+    if not token:
+        logger.error(f"创建登录会话失败: email={email}")
+        return False, "登录失败，请稍后重试"
+
+    # 5. 组装返回数据
     login_data = {
+        'token': token,
         'user_id': user.user_id,
         'email': email,
-        'role': 'admin' if is_temporary_admin else user.role,
+        'role': role,
         'is_admin': is_temporary_admin,
         'is_temporary_admin': is_temporary_admin
     }
@@ -1,50 +1,128 @@
 import json
 import time
-from config import logger
+from config import logger, BOOK_PAGE_CACHE_MAX_PAGE
+from utils.cache import SingleFlight
+from utils.redis_client import redis_client
 from utils.storage import generate_presigned_url
 from models.book import Book
 from models.user import User
+from models.view_history import ViewHistory
 from utils.auth import get_current_user_id
 
 
-def get_book_list(page=1, size=10, category=''):
-    """获取图书列表（使用仓储层优化）"""
+# 列表页生成的合并加载（进程内 + Redis锁跨进程）
+_page_flight = SingleFlight('book_page', distributed=True)
+
+
+def _list_page_cache_key(page, cursor):
+    """列表页缓存键中的分页部分，仅缓存前BOOK_PAGE_CACHE_MAX_PAGE页和游标分页首页，其余返回None"""
+    if cursor is not None:
+        return 'c' if cursor == '' else None
+    return f"p{page}" if 1 <= page <= BOOK_PAGE_CACHE_MAX_PAGE else None
+
+
+def get_book_list(page=1, size=10, category='', cursor=None):
+    """获取图书列表（使用仓储层优化）
+
+    传入cursor（首页为空字符串）时使用游标分页，响应为 {'items', 'next_cursor', 'size'}，不统计总数；
+    否则按page分页（兼容旧接口），响应为 {'items', 'total', 'page', 'size'}
+    前几页的响应体按 (目录版本号, 分类, 页, 每页数量) 缓存在Redis，命中时不访问OTS也不重新序列化；
+    未命中时同一页只由一个请求生成（进程内合并 + Redis锁跨进程），其余请求等待其结果
+    """
     try:
-        logger.info(f"🔍 开始获取图书列表: page={page}, size={size}, category='{category}'")
+        logger.info(f"🔍 开始获取图书列表: page={page}, size={size}, category='{category}', cursor={cursor!r}")
+
+        # 0. 查询列表页缓存（图书任何写入都会递增目录版本号，旧版本缓存不再命中）
+        page_key = _list_page_cache_key(page, cursor)
+        version = redis_client.get_catalog_version() if page_key else None
+        if version is not None:
+            cached_body = redis_client.get_book_page(version, page_key, size, category)
+            if cached_body:
+                logger.info(f"✅ 列表页缓存命中: version={version}, page={page_key}, size={size}, category='{category}'")
+            else:
+                def render():
+                    body, cacheable = _render_book_list(page, size, category, cursor)
+                    # 本进程目录快照尚未收到该版本的全部变更时不缓存，避免旧数据以新版本号缓存
+                    if cacheable and Book.is_catalog_current(version):
+                        redis_client.set_book_page(version, page_key, size, category, body)
+                    return body
+
+                cached_body = _page_flight.do(
+                    f"{version}:{page_key}:{size}:{category}", render,
+                    recheck=lambda: redis_client.get_book_page(version, page_key, size, category)
+                )
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': cached_body
+            }
+
+        body, _ = _render_book_list(page, size, category, cursor)
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': body
+        }
+
+    except Exception as e:
+        logger.error(f"❌ 获取图书列表失败: {str(e)}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Failed to get books', 'detail': str(e)})
+        }
+
 
-        # 1. 调用Book模型获取数据（已使用仓储层）
+def _render_book_list(page, size, category, cursor):
+    """查询并序列化一页图书列表，返回 (响应体JSON, 是否可缓存)"""
+    cacheable = True
+
+    # 1. 调用Book模型获取数据（已使用仓储层）
+    if cursor is not None:
+        books, next_cursor = Book.get_page(cursor=cursor, size=size, category=category)
+        logger.info(f"📊 查询结果: 获取到 {len(books)} 本书, 有下一页={next_cursor is not None}")
+    else:
         logger.info("📚 调用 Book.get_list()...")
-        books, total = Book.get_list(page=page, size=size, category=category)
+        # 读取失败时抛出异常（由调用方返回500），不把空结果当作真实数据缓存
+        books, total = Book.get_list(page=page, size=size, category=category, raise_on_error=True)
         logger.info(f"📊 查询结果: 获取到 {len(books)} 本书, 总数={total}")
 
         # 2. 如果总数获取失败，使用估算值
         if total == 0 and len(books) > 0:
             logger.warning("⚠️ 总数获取失败，使用估算值")
             total = len(books) * page  # 简单估算
+            cacheable = False  # 估算结果不缓存
+
+    # 3. 格式化返回数据
+    formatted_books = []
+    for i, book in enumerate(books):
+        book_data = {
+            'book_id': getattr(book, 'book_id', ''),
+            'title': getattr(book, 'title', ''),
+            'cover': getattr(book, 'cover', ''),
+            'category': getattr(book, 'category', ''),
+            'status': getattr(book, 'status', 'available'),
+            'stock': getattr(book, 'stock', 0),
+            'author': getattr(book, 'author', ''),
+            'publisher': getattr(book, 'publisher', ''),
+            'price': getattr(book, 'price', 0.0),
+            'summary': getattr(book, 'summary', ''),
+            'description': getattr(book, 'description', '')
+        }
+        formatted_books.append(book_data)
+        if i < 3:  # 只打印前3本书的调试信息
+            logger.info(f"📖 图书 {i + 1}: {book_data['title']} (ID: {book_data['book_id']})")
 
-        # 3. 格式化返回数据
-        formatted_books = []
-        for i, book in enumerate(books):
-            book_data = {
-                'book_id': getattr(book, 'book_id', ''),
-                'title': getattr(book, 'title', ''),
-                'cover': getattr(book, 'cover', ''),
-                'category': getattr(book, 'category', ''),
-                'status': getattr(book, 'status', 'available'),
-                'stock': getattr(book, 'stock', 0),
-                'author': getattr(book, 'author', ''),
-                'publisher': getattr(book, 'publisher', ''),
-                'price': getattr(book, 'price', 0.0),
-                'summary': getattr(book, 'summary', ''),
-                'description': getattr(book, 'description', '')
-            }
-            formatted_books.append(book_data)
-            if i < 3:  # 只打印前3本书的调试信息
-                logger.info(f"📖 图书 {i + 1}: {book_data['title']} (ID: {book_data['book_id']})")
-
-        logger.info(f"✅ 成功格式化 {len(formatted_books)} 本书")
+    logger.info(f"✅ 成功格式化 {len(formatted_books)} 本书")
 
-        # 4. 组装响应
+    # 4. 组装响应
+    if cursor is not None:
+        response_body = {
+            'items': formatted_books,
+            'next_cursor': next_cursor,
+            'size': size
+        }
+    else:
         response_body = {
             'items': formatted_books,
             'total': total,
@@ -52,18 +130,64 @@ def get_book_list(page=1, size=10, category=''):
             'size': size
         }
 
+    return json.dumps(response_body), cacheable
+
+
+def search_books(query, page=1, size=10):
+    """全文检索图书（进程内倒排索引，不访问OTS）"""
+    try:
+        query = (query or '').strip()
+        if not query:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': '检索关键词不能为空'})
+            }
+
+        page = max(page, 1)
+        size = min(max(size, 1), 100)
+        items, total = Book.search(query, page=page, size=size)
+
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps(response_body)
+            'body': json.dumps({
+                'items': items,
+                'total': total,
+                'page': page,
+                'size': size,
+                'q': query
+            })
         }
 
     except Exception as e:
-        logger.error(f"❌ 获取图书列表失败: {str(e)}", exc_info=True)
+        logger.error(f"❌ 图书检索失败: q='{query}', err={str(e)}", exc_info=True)
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'Failed to get books', 'detail': str(e)})
+            'body': json.dumps({'error': 'Failed to search books', 'detail': str(e)})
+        }
+
+
+def suggest_books(prefix, limit=10):
+    """书名/作者前缀联想（进程内索引，不访问OTS）"""
+    try:
+        prefix = (prefix or '').strip()
+        limit = min(max(limit, 1), 20)
+        suggestions = Book.suggest(prefix, limit=limit) if prefix else []
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'items': suggestions, 'prefix': prefix})
+        }
+
+    except Exception as e:
+        logger.error(f"❌ 图书联想失败: prefix='{prefix}', err={str(e)}", exc_info=True)
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Failed to suggest books', 'detail': str(e)})
         }
 
 
@@ -79,18 +203,11 @@ def get_book_detail(book_id, headers=None):
                 'body': json.dumps({'error': 'Book not found'})
             }
 
-        # 2. 记录浏览历史（使用仓储层优化）
+        # 2. 记录浏览历史（写后缓冲入队，由后台线程批量写入，不阻塞详情页响应）
         if headers:
             user_id = get_current_user_id(headers)
             if user_id:
-                user = User.get_by_id(user_id)
-                if user:
-                    # 通过仓储层添加浏览历史
-                    success, err = user.add_view_history(book_id)
-                    if success:
-                        logger.info(f"记录浏览历史: user_id={user_id}, book_id={book_id}")
-                    else:
-                        logger.warning(f"记录浏览历史失败: {err}")
+                ViewHistory.record(user_id, book_id)
 
         # 3. 获取借阅历史（通过仓储层）
         borrow_history = book.get_borrow_history()
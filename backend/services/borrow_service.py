@@ -242,15 +242,63 @@ def batch_borrow_books(data, headers):
                 'body': json.dumps({'error': '请选择要借阅的图书'})
             }
 
-        results = []
+        # 去重（保持提交顺序）
+        requested_ids = list(dict.fromkeys(book_ids))
+        messages = {}
+
+        # 通过仓储层获取用户（整批只校验一次）
+        user = User.get_by_id(user_id)
+        if user:
+            book_ids = requested_ids
+        else:
+            messages = {book_id: '用户不存在' for book_id in requested_ids}
+            book_ids = []
+
+        # 批量获取图书，并一次性获取用户当前在借的图书
+        books = Book.get_many(book_ids)
+        borrowed_book_ids = {
+            borrow.book_id for borrow in Borrow.get_by_user_id(user_id) if borrow.status == 'borrowed'
+        } if book_ids else set()
+
+        eligible_ids = []
         for book_id in book_ids:
-            # 对每本图书执行借阅操作
-            result = borrow_book(book_id, headers)
-            results.append({
-                'book_id': book_id,
-                'success': result['statusCode'] == 200,
-                'message': json.loads(result['body']).get('error', '借阅成功') if result['statusCode'] != 200 else '借阅成功'
-            })
+            book = books.get(book_id)
+            if not book:
+                messages[book_id] = '图书不存在'
+            elif book.stock <= 0:
+                messages[book_id] = '图书库存不足'
+            elif book_id in borrowed_book_ids:
+                messages[book_id] = '您已借阅该图书'
+            else:
+                eligible_ids.append(book_id)
+
+        # 批量创建借阅记录
+        created = Borrow.create_borrows(eligible_ids, user_id) if eligible_ids else {}
+        created_books = []
+        for book_id in eligible_ids:
+            if created.get(book_id):
+                created_books.append(books[book_id])
+            else:
+                messages[book_id] = '创建借阅记录失败'
+
+        # 批量更新图书库存，失败的回滚借阅记录
+        stock_results = Book.update_stocks(created_books, {book.book_id: -1 for book in created_books})
+        rollback = []
+        for book in created_books:
+            stock_success, stock_err = stock_results.get(book.book_id, (False, '库存更新失败'))
+            if stock_success:
+                messages[book.book_id] = None
+            else:
+                messages[book.book_id] = stock_err
+                rollback.append(Borrow({'borrow_id': created[book.book_id], 'book_id': book.book_id, 'user_id': user_id}))
+        if rollback:
+            Borrow.update_status_many(rollback, 'returned')
+
+        results = [{
+            'book_id': book_id,
+            'success': messages.get(book_id) is None,
+            'message': messages.get(book_id) or '借阅成功'
+        } for book_id in requested_ids]
 
         return {
             'statusCode': 200,
@@ -286,15 +334,62 @@ def batch_return_books(data, headers):
                 'body': json.dumps({'error': '请选择要归还的图书'})
             }
 
-        results = []
+        # 去重（保持提交顺序），批量获取借阅记录
+        borrow_ids = list(dict.fromkeys(borrow_ids))
+        borrows = Borrow.get_many(borrow_ids)
+        messages = {}
+
+        # 检查记录存在性与权限（只能归还自己的图书）
+        owned = []
         for borrow_id in borrow_ids:
-            # 对每个借阅记录执行归还操作
-            result = return_book_by_borrow_id(borrow_id, headers)
-            results.append({
-                'borrow_id': borrow_id,
-                'success': result['statusCode'] == 200,
-                'message': json.loads(result['body']).get('error', '归还成功') if result['statusCode'] != 200 else '归还成功'
-            })
+            borrow_record = borrows.get(borrow_id)
+            if not borrow_record:
+                messages[borrow_id] = '借阅记录不存在'
+            elif borrow_record.user_id != user_id:
+                messages[borrow_id] = '无权操作此借阅记录'
+            else:
+                owned.append(borrow_record)
+
+        # 批量获取图书
+        books = Book.get_many([borrow_record.book_id for borrow_record in owned])
+        eligible = []
+        for borrow_record in owned:
+            if borrow_record.book_id in books:
+                eligible.append(borrow_record)
+            else:
+                messages[borrow_record.borrow_id] = '图书不存在'
+
+        # 批量更新借阅状态
+        status_results = Borrow.update_status_many(eligible, 'returned')
+        returned = []
+        for borrow_record in eligible:
+            if status_results.get(borrow_record.borrow_id):
+                returned.append(borrow_record)
+            else:
+                messages[borrow_record.borrow_id] = '更新借阅状态失败'
+
+        # 批量更新图书库存（同一图书多条记录合并为一次变更），失败的回滚借阅状态
+        changes = {}
+        for borrow_record in returned:
+            changes[borrow_record.book_id] = changes.get(borrow_record.book_id, 0) + 1
+        stock_results = Book.update_stocks([books[book_id] for book_id in changes], changes)
+
+        rollback = []
+        for borrow_record in returned:
+            stock_success, stock_err = stock_results.get(borrow_record.book_id, (False, '库存更新失败'))
+            if stock_success:
+                messages[borrow_record.borrow_id] = None
+            else:
+                messages[borrow_record.borrow_id] = stock_err
+                rollback.append(borrow_record)
+        if rollback:
+            Borrow.update_status_many(rollback, 'borrowed')
+
+        results = [{
+            'borrow_id': borrow_id,
+            'success': messages.get(borrow_id) is None,
+            'message': messages.get(borrow_id) or '归还成功'
+        } for borrow_id in borrow_ids]
 
         return {
             'statusCode': 200,
@@ -328,9 +423,10 @@ def get_user_borrows(headers):
 
         # 格式化借阅记录
         formatted_borrows = []
+        # 通过仓储层批量获取图书信息
+        books = Book.get_many([borrow.book_id for borrow in borrows])
         for borrow in borrows:
-            # 通过仓储层获取图书信息
-            book = Book.get_by_id(borrow.book_id)
+            book = books.get(borrow.book_id)
             if book:
                 formatted_borrows.append({
                     'borrow_id': borrow.borrow_id,
@@ -5,11 +5,21 @@ from models.comment import Comment
 from utils.auth import get_current_user_id
 
 
-def get_comments(book_id: str) -> dict:
-    """获取图书评论列表（使用仓储层优化）"""
+def get_comments(book_id: str, cursor: str = None, limit: int = None) -> dict:
+    """获取图书评论列表（使用仓储层优化）
+
+    未传cursor/limit时返回全部评论（兼容旧接口，列表格式）；
+    分页时返回 {'comments': [...], 'next_cursor': ...}，父评论按发布时间倒序
+    """
     try:
+        paged = cursor is not None or limit is not None
+        next_cursor = None
+
         # 通过仓储层获取评论
-        comments = Comment.get_by_book_id(book_id)
+        if paged:
+            comments, next_cursor = Comment.get_page(book_id, cursor, limit)
+        else:
+            comments = Comment.get_by_book_id(book_id)
 
         # 格式化评论数据
         formatted_comments = []
@@ -42,6 +52,12 @@ def get_comments(book_id: str) -> dict:
 
             formatted_comments.append(comment_data)
 
+        if paged:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'comments': formatted_comments, 'next_cursor': next_cursor})
+            }
+
         return {
             'statusCode': 200,
             'body': json.dumps(formatted_comments)
@@ -106,16 +122,8 @@ def like_comment(comment_id: str, headers: dict) -> dict:
                 'body': json.dumps({'error': '未授权访问'})
             }
 
-        # 通过仓储层获取评论
-        comment = Comment.get_by_id(comment_id)
-        if not comment:
-            return {
-                'statusCode': 404,
-                'body': json.dumps({'error': '评论不存在'})
-            }
-
-        # 通过仓储层点赞/取消点赞
-        success, result = comment.like_comment(user_id)
+        # 点赞/取消点赞（一次条件写入 + 一次Redis累加，不读取评论）
+        success, result = Comment.like_comment(comment_id, user_id)
 
         if not success:
             return {
@@ -123,17 +131,13 @@ def like_comment(comment_id: str, headers: dict) -> dict:
                 'body': json.dumps({'error': result})
             }
 
-        # 获取更新后的评论信息
-        updated_comment = Comment.get_by_id(comment_id)
-
+        # 点赞数取自Redis中的总数（无需再次读取评论）
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'success': True,
-                'likes': updated_comment.likes,
-                'action': result.get('action'),
-                'user_display_name': updated_comment.user_display_name,
-                'user_avatar_url': updated_comment.user_avatar_url
+                'likes': result.get('likes'),
+                'action': result.get('action')
             })
         }
 
@@ -160,9 +160,10 @@ def get_user_reservations(headers: Dict[str, str]) -> Dict[str, Any]:
 
         # 格式化预约记录
         formatted_reservations = []
+        # 通过仓储层批量获取图书信息
+        books = Book.get_many([reservation.book_id for reservation in reservations])
         for reservation in reservations:
-            # 通过仓储层获取图书信息
-            book = Book.get_by_id(reservation.book_id)
+            book = books.get(reservation.book_id)
             if book:
                 formatted_reservations.append({
                     'reservation_id': reservation.reservation_id,
@@ -339,9 +340,10 @@ def get_book_reservations(book_id: str, headers: Dict[str, str]) -> Dict[str, An
 
         # 格式化预约记录
         formatted_reservations = []
+        # 批量获取预约用户信息
+        users = User.get_many([reservation.user_id for reservation in reservations])
         for reservation in reservations:
-            # 获取用户信息
-            user = User.get_by_id(reservation.user_id)
+            user = users.get(reservation.user_id)
             if user:
                 formatted_reservations.append({
                     'reservation_id': reservation.reservation_id,
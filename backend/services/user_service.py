@@ -120,8 +120,8 @@ def update_user_profile(headers, data, is_form_data=False):
                 'body': json.dumps({'error': err})
             }
 
-        # 更新后重新获取完整用户数据
-        updated_user = User.get_by_id(user_id)
+        # update_profile已按写入字段刷新实例，无需回读
+        updated_user = original_user
         complete_user_data = {
             # 基础字段
             'user_id': getattr(updated_user, 'user_id', user_id),
@@ -236,8 +236,11 @@ def get_user_favorites(headers):
         favorites = user.get_favorites()
         formatted_favorites = []
 
+        # 批量获取收藏关联的图书（避免逐本查询）
+        books = Book.get_many([fav.book_id for fav in favorites])
+
         for fav in favorites:
-            book = Book.get_by_id(fav.book_id)
+            book = books.get(fav.book_id)
             formatted_favorites.append({
                 'favorite_id': getattr(fav, 'favorite_id', ''),
                 'book_id': getattr(fav, 'book_id', ''),
@@ -285,8 +288,11 @@ def get_user_view_history(headers):
         history = user.get_view_history()
         formatted_history = []
 
+        # 批量获取浏览过的图书（避免逐本查询）
+        books = Book.get_many([record.book_id for record in history])
+
         for record in history:
-            book = Book.get_by_id(record.book_id)
+            book = books.get(record.book_id)
             formatted_history.append({
                 'history_id': getattr(record, 'history_id', ''),
                 'book_id': getattr(record, 'book_id', ''),
@@ -1,11 +1,13 @@
 import hashlib
 import time
-from tablestore import (
-    SingleColumnCondition, ComparatorType, INF_MIN, INF_MAX
+from config import (
+    logger, USERS_TABLE, ADMIN_CODE, SESSION_TTL_SECONDS, ALLOW_LEGACY_USER_ID_TOKEN, NEGATIVE_CACHE_TTL_SECONDS
 )
-from config import logger, USERS_TABLE, ADMIN_CODE
-from utils.database import ots_get_row, ots_get_range
+from utils.database import ots_get_row
 from utils.redis_client import redis_client  # 导入Redis客户端
+from utils.cache import token_cache, user_cache
+from repositories.user_repository import UserRepository
+from repositories.session_repository import SessionRepository
 
 
 def hash_password(password):
@@ -13,56 +15,72 @@ def hash_password(password):
     return hashlib.sha256(password.encode('utf-8')).hexdigest()
 
 
+def create_session_token(user_id, role='user'):
+    """登录时创建会话：写入Sessions表并预热Redis，返回随机Token"""
+    token = SessionRepository().create_session(user_id, role)
+    if token:
+        redis_client.set_token_user(token, user_id, expire=min(7200, SESSION_TTL_SECONDS))
+        token_cache.invalidate([token])  # 清除各进程可能存在的负缓存
+    return token
+
+
 def get_user_id_by_token(token):
-    """通过Token获取用户ID - Redis优化版（新增user_id空值校验）"""
+    """通过Token获取用户ID - 进程内L1、Redis优先，未命中时Sessions表单次点查"""
     try:
-        # 1. 先查Redis缓存
-        cached_user_id = redis_client.get_user_by_token(token)
-        if cached_user_id:
-            logger.info(f"✅ Redis缓存命中: token={token}")
-            return cached_user_id
+        return token_cache.get(token, _load_user_id_by_token)
+    except Exception as e:
+        logger.error(f"❌ 获取用户ID失败: {str(e)}", exc_info=True)
+        return None
 
-        # 2. 缓存未命中，查询OTS
-        condition = SingleColumnCondition('user_id', token, ComparatorType.EQUAL)
-        user_list = ots_get_range(
-            USERS_TABLE,
-            start_pk=[('email', INF_MIN)],
-            end_pk=[('email', INF_MAX)],
-            column_filter=condition,
-            limit=1
-        )
-
-        if user_list:
-            user = user_list[0]
-            user_id = user.get('user_id')
-
-            # 新增：user_id空值校验，避免缓存无效数据
-            if not user_id:
-                user_email = user.get('email', '未知邮箱')
-                logger.error(f"❌ 用户记录缺失user_id: email={user_email}, token={token}")
-                return None
-
-            # 3. 写入Redis缓存（仅在user_id有效时执行）
+
+def _load_user_id_by_token(token):
+    """L1/Redis均未命中时查询Token对应的用户ID，并写入Redis（无效Token写入短TTL负缓存）
+
+    OTS读取失败时抛出异常（不写入负缓存，避免一次超时把有效Token当作无效）
+    """
+    # 1. 点查Sessions表（过期会话由OTS TTL清理）
+    session = SessionRepository().get_by_id(token, raise_on_error=True)
+    if session:
+        user_id = session.get('user_id')
+        if not user_id:
+            logger.error("❌ 会话记录缺失user_id")
+            _cache_invalid_token(token)
+            return None
+
+        # 2. 写入Redis缓存（缓存时长不超过会话剩余有效期）
+        remaining = session['expire_at'] - int(time.time())
+        redis_client.set_token_user(token, user_id, expire=max(1, min(7200, remaining)))
+
+        logger.info(f"✅ 会话查询成功并缓存: user_id={user_id}")
+        return user_id
+
+    # 3. 兼容旧版Token（以user_id作为Token），UserIdIndex点查
+    if ALLOW_LEGACY_USER_ID_TOKEN:
+        user = UserRepository().get_by_id(token, raise_on_error=True)
+        if user and user.get('user_id'):
+            user_id = user['user_id']
             redis_client.set_token_user(token, user_id)
             redis_client.set_user(user_id, user)
-
-            logger.info(f"✅ OTS查询成功并缓存: user_id={user_id}")
+            logger.info(f"✅ 旧版Token校验成功并缓存: user_id={user_id}")
             return user_id
 
-        logger.warning(f"⚠️ 未找到匹配Token的用户: token={token}")
-        return None
-    except Exception as e:
-        logger.error(f"❌ 获取用户ID失败: {str(e)}", exc_info=True)
-        return None
+    logger.warning("⚠️ 未找到匹配Token的会话")
+    _cache_invalid_token(token)
+    return None
+
+
+def _cache_invalid_token(token):
+    """无效Token写入负缓存，重复请求只需一次Redis读取"""
+    if NEGATIVE_CACHE_TTL_SECONDS > 0:
+        redis_client.set_token_user(token, '', expire=NEGATIVE_CACHE_TTL_SECONDS)
 
 
 def get_current_user_id(headers):
     """从请求头获取当前用户ID（原代码逻辑：解析Bearer Token）"""
     auth_header = headers.get('Authorization', '')
-    logger.info(f"Authorization header: '{auth_header}'")
     if auth_header.startswith('Bearer '):
         token = auth_header[7:]  # 提取Token（去掉"Bearer "前缀）
-        logger.info(f"提取Token: {token}")
+        logger.info(f"提取Token: {token[:6]}***")  # 会话Token为凭证，日志中脱敏
         user_id = get_user_id_by_token(token)
         if user_id:
             return user_id
@@ -82,45 +100,11 @@ def verify_admin_code(input_code):
 
 
 def get_user_by_id(user_id):
-    """通过用户ID获取用户信息 - 增加Redis缓存优化"""
+    """通过用户ID获取用户信息 - 进程内L1 + Redis两级缓存"""
     try:
-        # 1. 先查Redis缓存
-        cached_user = redis_client.get_user(user_id)
-        if cached_user:
-            logger.info(f"✅ Redis缓存命中: user_id={user_id}")
-            return {
-                'email': cached_user.get('email'),
-                'user_id': cached_user.get('user_id'),
-                'password': cached_user.get('password'),
-                'role': cached_user.get('role', 'user'),
-                'display_name': cached_user.get('display_name'),
-                'avatar_url': cached_user.get('avatar_url'),
-                'gender': cached_user.get('gender', ''),
-                'created_at': cached_user.get('created_at'),
-                'updated_at': cached_user.get('updated_at')
-            }
-
-        # 2. 缓存未命中，查询OTS
-        condition = SingleColumnCondition(
-            'user_id',
-            user_id,
-            ComparatorType.EQUAL
-        )
-        user_list = ots_get_range(
-            USERS_TABLE,
-            start_pk=[('email', INF_MIN)],
-            end_pk=[('email', INF_MAX)],
-            column_filter=condition,
-            limit=1
-        )
-
-        if user_list:
-            user = user_list[0]
-
-            # 3. 写入Redis缓存
-            redis_client.set_user(user_id, user)
+        user = user_cache.get(user_id, lambda key: UserRepository().get_by_id(key, raise_on_error=True))
 
-            logger.info(f"✅ OTS查询成功并缓存: user_id={user_id}")
+        if user:
             return {
                 'email': user.get('email'),
                 'user_id': user.get('user_id'),
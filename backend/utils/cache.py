@@ -0,0 +1,417 @@
+# utils/cache.py
+"""两级缓存：进程内LRU（L1）+ Redis（L2）
+
+- L1：每个工作进程独立的有界LRU，条目带TTL，命中时无网络往返和反序列化开销
+- L2：现有RedisClient，进程间共享
+- 写入方调用invalidate：删除本进程L1条目，执行L2失效，并通过Redis发布/订阅通知所有进程删除L1条目
+- 订阅线程未就绪（Redis不可用、连接中断）时不读写L1，避免其他进程的写入无法通知到本进程
+- 数据源中不存在的key写入短TTL的负缓存（值为None），重复的无效请求不再回源
+- SingleFlight：热点key未命中时只有一个调用回源，其余等待其结果（进程内锁 + 可选Redis锁）
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    logger, L1_CACHE_MAX_SIZE, L1_CACHE_TTL_SECONDS, L1_CACHE_STALE_SECONDS, CACHE_INVALIDATION_CHANNEL,
+    NEGATIVE_CACHE_TTL_SECONDS, SINGLE_FLIGHT_LOCK_MS
+)
+from utils.redis_client import redis_client
+
+# 订阅连接中断后的重连间隔（秒）
+_RECONNECT_SECONDS = 3
+
+
+class LRUCache:
+    """线程安全的有界LRU缓存，条目超过TTL后变为过期（stale），再超过stale窗口后视为未命中"""
+
+    def __init__(self, max_size, ttl, stale_seconds=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, stale=None):
+        """批量读取，返回命中的 {key: value}（值可以为None）
+
+        传入stale集合时，过期但仍在stale窗口内的条目照常返回并将key加入该集合；否则过期条目视为未命中
+        """
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                value, fresh_until, expire_at = item
+                if expire_at <= now:
+                    del self._data[key]
+                    continue
+                if fresh_until <= now:
+                    if stale is None:
+                        continue
+                    stale.add(key)
+                self._data.move_to_end(key)
+                result[key] = value
+        return result
+
+    def set_many(self, items, ttl=None):
+        """批量写入（ttl默认为缓存的TTL），超过容量时淘汰最久未使用的条目"""
+        fresh_until = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        expire_at = fresh_until + self.stale_seconds
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (value, fresh_until, expire_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    """SingleFlight中一次进行中的加载"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """合并同一key的并发加载：进程内每个key只有一个调用执行加载，其余调用等待并共享其结果
+
+    distributed=True时可通过across_workers再用Redis锁跨进程合并：未获取到锁的进程轮询recheck()
+    （通常是重查Redis缓存），拿到结果即返回；锁释放或等待超时仍无结果时自行加载
+    """
+
+    # 等待其他进程加载时的轮询间隔（秒）
+    POLL_SECONDS = 0.05
+
+    def __init__(self, name, distributed=False, lock_ms=SINGLE_FLIGHT_LOCK_MS):
+        self.name = name
+        self.distributed = distributed
+        self.lock_ms = lock_ms
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, recheck=None):
+        """执行fn()并返回结果，同一key已有调用在执行时等待其结果（异常同样共享）
+
+        传入recheck时由across_workers执行fn（跨进程合并）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.lock_ms / 1000):
+                logger.warning(f"⚠️ 等待合并加载超时，自行加载: {self.name}={key}")
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.across_workers(key, fn, recheck) if recheck else fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def across_workers(self, key, fn, recheck):
+        """持有Redis锁执行fn()；锁被其他进程持有时轮询recheck()，返回非None结果即作为本次结果"""
+        if not self.distributed:
+            return fn()
+
+        lock_name = f"{self.name}:{key}"
+        token = redis_client.acquire_lock(lock_name, self.lock_ms)
+        if token is None:
+            deadline = time.monotonic() + self.lock_ms / 1000
+            while time.monotonic() < deadline:
+                time.sleep(self.POLL_SECONDS)
+                result = recheck()
+                if result is not None:
+                    return result
+                if not redis_client.is_locked(lock_name):
+                    break
+            return fn()
+
+        try:
+            return fn()
+        finally:
+            redis_client.release_lock(lock_name, token)
+
+
+class _InvalidationListener:
+    """订阅失效频道的后台线程（每个进程一个，fork后在子进程中首次使用时重新启动）"""
+
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._ready = threading.Event()
+
+    def register(self, name, handler):
+        self._handlers.setdefault(name, []).append(handler)
+
+    def ensure_started(self):
+        """确保本进程的订阅线程已启动，返回订阅是否就绪（未就绪时L1不可用）"""
+        if not redis_client.client:
+            return False
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._ready = threading.Event()
+                    threading.Thread(target=self._run, name='cache-invalidation', daemon=True).start()
+        return self._ready.is_set()
+
+    def _clear_all(self):
+        for handlers in self._handlers.values():
+            for handler in handlers:
+                handler.clear_local()
+
+    def _dispatch(self, data):
+        try:
+            message = json.loads(data)
+            for handler in self._handlers.get(message.get('cache'), ()):
+                handler.evict(message.get('keys') or [])
+        except Exception as e:
+            logger.error(f"❌ 处理缓存失效消息失败: {e}")
+
+    def _run(self):
+        ready = self._ready
+        while True:
+            pubsub = None
+            try:
+                pubsub = redis_client.client.pubsub()
+                pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                while True:
+                    # 带超时轮询，避免阻塞读触发socket超时
+                    message = pubsub.get_message(timeout=1.0)
+                    if not message:
+                        continue
+                    if message['type'] == 'subscribe':
+                        # 订阅建立前的失效消息可能已丢失，清空L1后再启用
+                        self._clear_all()
+                        ready.set()
+                        logger.info(f"✅ L1缓存失效订阅就绪: channel={CACHE_INVALIDATION_CHANNEL}, pid={os.getpid()}")
+                    elif message['type'] == 'message':
+                        self._dispatch(message['data'])
+            except Exception as e:
+                ready.clear()
+                self._clear_all()
+                logger.error(f"❌ L1缓存失效订阅中断，{_RECONNECT_SECONDS}秒后重连: {e}")
+                time.sleep(_RECONNECT_SECONDS)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+_listener = _InvalidationListener()
+
+
+class TwoTierCache:
+    """L1（进程内LRU）+ L2（Redis）两级缓存
+
+    - l2_get_many(keys) -> {key: value}：批量读取L2，负缓存的值为None
+    - l2_set_many({key: value}, expire=None) -> 实际写入的key集合：回填L2，value为None时写入负缓存
+      （仅写入成功的key进入L1，与L2的写入保护一致）；为None时由数据源加载函数自行写L2（含负缓存），加载结果全部进入L1
+    - l2_invalidate(keys)：写入后失效L2（创建实体后同样需要调用，清除负缓存）
+    数据源加载函数读取失败时必须抛出异常（不得返回None/遗漏key），否则会被当作不存在写入负缓存；异常向调用方传播，不写入任何缓存
+    单个读取（get）合并同一key的并发未命中（进程内 + Redis锁跨进程），L1过期后在stale窗口内先返回旧值再后台刷新
+    """
+
+    def __init__(self, name, l2_get_many, l2_set_many=None, l2_invalidate=None,
+                 max_size=L1_CACHE_MAX_SIZE, ttl=L1_CACHE_TTL_SECONDS, negative_ttl=NEGATIVE_CACHE_TTL_SECONDS,
+                 stale_seconds=L1_CACHE_STALE_SECONDS):
+        self.name = name
+        self.negative_ttl = negative_ttl
+        self._l1 = LRUCache(max_size, ttl, stale_seconds)
+        self._l2_get_many = l2_get_many
+        self._l2_set_many = l2_set_many
+        self._l2_invalidate = l2_invalidate
+        self._flight = SingleFlight(f"cache:{name}", distributed=True)
+        self._refreshing = set()
+        # 失效代数：读取期间发生过失效时，放弃本次L1回填，避免把失效前读到的旧值写回L1
+        self._generation = 0
+        self._lock = threading.Lock()
+        _listener.register(name, self)
+
+    def get_many(self, keys, loader):
+        """批量读取：L1 -> L2 -> loader(未命中的keys)返回 {key: value}，返回存在的 {key: value}"""
+        keys = [key for key in dict.fromkeys(keys) if key]
+        if not keys:
+            return {}
+
+        use_l1 = _listener.ensure_started()
+        generation = self._generation
+        result = self._l1.get_many(keys) if use_l1 else {}
+        missing = [key for key in keys if key not in result]
+        if not missing:
+            return self._present(result)
+
+        cacheable = self._l2_get_many(missing)
+        result.update(cacheable)
+        missing = [key for key in missing if key not in cacheable]
+
+        if missing:
+            loaded = loader(missing) or {}
+            result.update(loaded)
+            cacheable.update(self._store(loaded, missing))
+
+        if use_l1:
+            self._fill(cacheable, generation)
+        return self._present(result)
+
+    def get(self, key, loader):
+        """单个读取：loader(key)返回数据源中的值（不存在返回None）"""
+        if not key:
+            return None
+
+        use_l1 = _listener.ensure_started()
+        if use_l1:
+            stale = set()
+            hit = self._l1.get_many([key], stale)
+            if key in hit:
+                if stale:
+                    self._revalidate(key, loader)
+                return hit[key]
+
+        return self._flight.do(key, lambda: self._fetch(key, loader, use_l1))
+
+    def _fetch(self, key, loader, use_l1):
+        """L2 -> loader，L2未命中时跨进程只有一个调用回源，其余等待其回填L2"""
+        generation = self._generation
+        result = cacheable = self._l2_get_many([key])
+
+        if key not in result:
+            def load():
+                value = loader(key)
+                loaded = {key: value} if value is not None else {}
+                return loaded, self._store(loaded, [key])
+
+            def recheck():
+                found = self._l2_get_many([key])
+                return (found, found) if found else None
+
+            result, cacheable = self._flight.across_workers(key, load, recheck)
+
+        if use_l1:
+            self._fill(cacheable, generation)
+        return result.get(key)
+
+    def _revalidate(self, key, loader):
+        """后台刷新过期的L1条目（同一key同时只有一个刷新）"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._flight.do(key, lambda: self._fetch(key, loader, True))
+            except Exception as e:
+                logger.error(f"❌ 后台刷新缓存失败: {self.name}={key}, err={e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _store(self, loaded, missing):
+        """回填L2（含不存在key的负缓存），返回可进入L1的 {key: value}"""
+        absent = {key: None for key in missing if key not in loaded} if self.negative_ttl > 0 else {}
+        if not self._l2_set_many:
+            return {**loaded, **absent}
+
+        stored = set(self._l2_set_many(loaded)) if loaded else set()
+        if absent:
+            stored |= set(self._l2_set_many(absent, expire=self.negative_ttl))
+        return {key: loaded.get(key) for key in stored}
+
+    def _fill(self, cacheable, generation):
+        if not cacheable:
+            return
+        with self._lock:
+            if self._generation == generation:
+                self._l1.set_many({key: value for key, value in cacheable.items() if value is not None})
+                self._l1.set_many({key: None for key, value in cacheable.items() if value is None},
+                                  ttl=self.negative_ttl)
+
+    @staticmethod
+    def _present(result):
+        """去掉负缓存命中（不存在的key）"""
+        return {key: value for key, value in result.items() if value is not None}
+
+    def evict(self, keys):
+        """删除本进程L1条目"""
+        with self._lock:
+            self._generation += 1
+            self._l1.delete_many(keys)
+
+    def clear_local(self):
+        with self._lock:
+            self._generation += 1
+            self._l1.clear()
+
+    def invalidate(self, keys):
+        """写入后失效：本进程L1、L2，并通知其他进程删除L1条目"""
+        keys = [key for key in dict.fromkeys(keys) if key]
+        if not keys:
+            return
+        self.evict(keys)
+        if self._l2_invalidate:
+            self._l2_invalidate(keys)
+        redis_client.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({'cache': self.name, 'keys': keys}))
+
+
+def subscribe_invalidations(name, handler):
+    """订阅指定缓存的失效消息（如进程内派生数据随图书写入刷新）
+
+    handler需实现evict(keys)（收到失效消息）与clear_local()（订阅建立或中断，期间的消息可能丢失），
+    返回订阅是否已就绪
+    """
+    _listener.register(name, handler)
+    return _listener.ensure_started()
+
+
+def _get_token_users(tokens):
+    result = {}
+    for token in tokens:
+        user_id = redis_client.get_user_by_token(token)
+        if user_id is not None:
+            result[token] = user_id or None  # 空字符串为负缓存
+    return result
+
+
+# Token -> user_id（会话不可修改，L2由get_user_id_by_token按会话剩余有效期写入，无效Token写入空字符串）
+token_cache = TwoTierCache('token', _get_token_users)
+# user_id -> 用户数据
+user_cache = TwoTierCache('user', redis_client.get_users, redis_client.set_users, redis_client.invalidate_users)
+# book_id -> 图书数据（L2回填受写入标记保护）
+book_cache = TwoTierCache('book', redis_client.get_books, redis_client.set_books, redis_client.invalidate_books)
@@ -0,0 +1,261 @@
+import bisect
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from config import logger
+from utils.search_index import RebuildableIndex
+
+# 快照保存的图书字段（与Book.to_dict一致）
+BOOK_FIELDS = (
+    'book_id', 'title', 'author', 'publisher', 'isbn', 'price', 'category', 'description',
+    'cover', 'summary', 'status', 'stock', 'created_at', 'updated_at'
+)
+
+
+class BookRecord:
+    """快照中的图书记录（__slots__，不为每本书保存字典）"""
+
+    __slots__ = BOOK_FIELDS
+
+    def __init__(self, book: Dict[str, Any]):
+        for name in BOOK_FIELDS:
+            setattr(self, name, book.get(name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为图书数据字典（缺失字段不输出，由Book按默认值处理）"""
+        result = {}
+        for name in BOOK_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value
+        return result
+
+
+class Catalog:
+    """全部图书记录 + 按列表顺序排列的位置数组（全部、各分类），非线程安全，由CatalogSnapshot加锁访问
+
+    位置为position(图书)返回的元组（如 (倒序创建时间, book_id)），与列表游标的取值一致
+    """
+
+    def __init__(self, position: Callable[[Dict[str, Any]], tuple]):
+        self.position = position
+        self.records: Dict[str, BookRecord] = {}
+        self.positions: Dict[str, tuple] = {}
+        self.orders: Dict[str, List[tuple]] = {'': []}  # 分类 -> 有序位置数组（''为全部图书）
+
+    def __len__(self):
+        return len(self.records)
+
+    def _unlink(self, book_id: str):
+        record = self.records.pop(book_id, None)
+        if record is None:
+            return
+        position = self.positions.pop(book_id)
+        for category in {'', record.category or ''}:
+            order = self.orders.get(category)
+            if order is None:
+                continue
+            i = bisect.bisect_left(order, position)
+            if i < len(order) and order[i] == position:
+                del order[i]
+            if category and not order:
+                del self.orders[category]
+
+    def upsert(self, book: Dict[str, Any]):
+        """新增或替换图书记录"""
+        book_id = book['book_id']
+        self._unlink(book_id)
+        record = BookRecord(book)
+        position = self.position(book)
+        self.records[book_id] = record
+        self.positions[book_id] = position
+        for category in {'', record.category or ''}:
+            bisect.insort(self.orders.setdefault(category, []), position)
+
+    def bulk_load(self, books: Iterable[Dict[str, Any]]):
+        """全量加载（统一排序，避免逐条插入）"""
+        for book in books:
+            record = BookRecord(book)
+            self.records[book['book_id']] = record
+            self.positions[book['book_id']] = self.position(book)
+        for book_id, record in self.records.items():
+            position = self.positions[book_id]
+            self.orders[''].append(position)
+            if record.category:
+                self.orders.setdefault(record.category, []).append(position)
+        for order in self.orders.values():
+            order.sort()
+
+    def remove(self, book_id: str):
+        self._unlink(book_id)
+
+    def update_fields(self, book_id: str, values: Dict[str, Any]):
+        """更新不影响排序与分类的字段（如库存、状态），记录不存在时忽略"""
+        record = self.records.get(book_id)
+        if record is None:
+            return
+        for name, value in values.items():
+            if name in BOOK_FIELDS:
+                setattr(record, name, value)
+
+    def page(self, category: str, after: Optional[tuple], offset: int, size: int) -> Tuple[List[BookRecord], Optional[tuple]]:
+        """按列表顺序读取一页，after为上一页最后一条的位置，返回 (记录列表, 有下一页时本页最后一条的位置)"""
+        order = self.orders.get(category or '', [])
+        start = bisect.bisect_right(order, after) if after else 0
+        start += offset
+        positions = order[start:start + size]
+        has_more = start + size < len(order)
+        records = [self.records[position[-1]] for position in positions]
+        return records, (positions[-1] if has_more and positions else None)
+
+    def count(self, category: str = '') -> int:
+        return len(self.orders.get(category or '', []))
+
+
+class CatalogSnapshot(RebuildableIndex):
+    """进程级图书目录快照：列表、计数、分类过滤、AI知识库均从内存读取，不访问OTS
+
+    - loader：流式返回全部图书（首次使用及定期全量重建时调用）
+    - loader_many(book_ids)：批量读取指定图书 {book_id: 图书数据}，用于按变更通知增量刷新；
+      读取失败时必须抛出异常（结果中缺失的book_id会被当作已删除）
+    - position(图书)：列表排序位置，最后一个元素需为book_id
+    - version_loader：读取当前目录版本号（全量构建前调用，构建结果至少反映该版本）
+    本进程的写入通过upsert/remove/update_fields同步；其他进程的写入通过图书缓存失效消息（evict）
+    标记为待刷新，在下次读取时批量回读；订阅中断期间可能丢失消息，恢复后全量重建。
+    目录版本号的递增通知由version_watcher接收，is_current判断快照是否已反映某个版本（用于决定列表页能否缓存）
+    """
+
+    name = '图书目录快照'
+
+    def __init__(self, loader: Callable[[], Iterable[Dict[str, Any]]],
+                 loader_many: Callable[[List[str]], Dict[str, Dict[str, Any]]],
+                 position: Callable[[Dict[str, Any]], tuple], refresh_seconds: int = 0,
+                 version_loader: Callable[[], Optional[str]] = None):
+        super().__init__(refresh_seconds)
+        self.loader = loader
+        self.loader_many = loader_many
+        self.position = position
+        self.version_loader = version_loader
+        self._stale = set()
+        self._refreshing = set()  # 正在回读的图书（回读完成前快照尚未反映其变更）
+        self._stale_lock = threading.Lock()
+        self._resync = False
+        self._seen_version = 0
+        self.version_watcher = _VersionWatcher(self)
+
+    def rebuild(self, only_if_missing: bool = False) -> int:
+        """全量重建；构建前读取的版本号之前的变更均已包含在新快照中"""
+        version = self.version_loader() if self.version_loader else None
+        previous = self._index
+        count = super().rebuild(only_if_missing)
+        if version is not None and self._index is not previous:
+            self.see_version(int(version))
+        return count
+
+    def see_version(self, version: int):
+        """记录已收到的目录版本号（该版本及之前的变更通知均已到达）"""
+        with self._stale_lock:
+            self._seen_version = max(self._seen_version, version)
+
+    def is_current(self, version) -> bool:
+        """快照是否已反映指定目录版本：已收到该版本通知、无待刷新/回读中的图书且无需全量重建"""
+        with self._stale_lock:
+            return (int(version) <= self._seen_version and not self._stale and not self._refreshing
+                    and not self._resync)
+
+    def _new_index(self) -> Catalog:
+        return Catalog(self.position)
+
+    def _load(self, index: Catalog):
+        index.bulk_load(self.loader())
+
+    def _apply(self, index: Catalog, action: str, doc_id: str, payload: Any):
+        if action == 'upsert':
+            index.upsert(payload)
+        elif action == 'remove':
+            index.remove(doc_id)
+        elif action == 'fields':
+            index.update_fields(doc_id, payload)
+
+    def upsert(self, book: Dict[str, Any]):
+        """新增或更新图书"""
+        self._write('upsert', book['book_id'], dict(book))
+
+    def remove(self, book_id: str):
+        """删除图书"""
+        self._write('remove', book_id)
+
+    def update_fields(self, book_id: str, values: Dict[str, Any]):
+        """更新图书的库存、状态等字段"""
+        self._write('fields', book_id, dict(values))
+
+    def evict(self, book_ids: List[str]):
+        """收到图书变更通知（订阅线程调用）或本进程写入后新值未知，标记为待刷新"""
+        with self._stale_lock:
+            self._stale.update(book_ids)
+
+    def clear_local(self):
+        """订阅建立或中断（期间的变更通知可能丢失），已构建的快照需全量重建"""
+        if self._index is not None:
+            self._resync = True
+
+    def ensure_ready(self):
+        if self._resync and not self._build_lock.locked():
+            self._resync = False
+            threading.Thread(target=self._refresh_quietly, daemon=True).start()
+        super().ensure_ready()
+        self._refresh_stale()
+
+    def _refresh_stale(self):
+        """批量回读收到变更通知的图书（确认不存在的从快照删除）；读取失败时放回待刷新集合，下次读取重试"""
+        with self._stale_lock:
+            if not self._stale:
+                return
+            book_ids = list(self._stale)
+            self._stale.clear()
+            self._refreshing.update(book_ids)
+
+        try:
+            books = self.loader_many(book_ids)
+        except Exception as e:
+            with self._stale_lock:
+                self._stale.update(book_ids)
+                self._refreshing.difference_update(book_ids)
+            logger.error(f"❌ {self.name}增量刷新失败: {str(e)}")
+            return
+
+        for book_id in book_ids:
+            if book_id in books:
+                self.upsert(books[book_id])
+            else:
+                self.remove(book_id)
+        with self._stale_lock:
+            self._refreshing.difference_update(book_ids)
+        logger.info(f"🔄 {self.name}增量刷新: {len(book_ids)} 本")
+
+    def page(self, category: str = '', after: Optional[tuple] = None,
+             offset: int = 0, size: int = 10) -> Tuple[List[Dict[str, Any]], Optional[tuple]]:
+        """按列表顺序分页，返回 (图书数据列表, 有下一页时本页最后一条的位置)"""
+        self.ensure_ready()
+        with self._lock:
+            records, last = self._index.page(category, after, offset, size)
+            return [record.to_dict() for record in records], last
+
+    def count(self, category: str = '') -> int:
+        """图书总数（可按分类）"""
+        self.ensure_ready()
+        with self._lock:
+            return self._index.count(category)
+
+
+class _VersionWatcher:
+    """接收目录版本号递增通知（订阅线程调用），keys为新版本号"""
+
+    def __init__(self, snapshot: CatalogSnapshot):
+        self.snapshot = snapshot
+
+    def evict(self, keys: List[str]):
+        for version in keys:
+            self.snapshot.see_version(int(version))
+
+    def clear_local(self):
+        """订阅中断期间的版本通知可能丢失，由快照全量重建时重新记录版本号"""
@@ -0,0 +1,90 @@
+# utils/counter_buffer.py
+"""Redis缓冲计数器：高频计数（如评论点赞数）先在Redis中累加，由后台线程周期性批量写回OTS
+
+- add：一次Redis脚本调用（累加增量，总数已缓存时同步累加并返回），Redis不可用时由调用方直接原子增减OTS
+- totals：展示用总数（已落库值 + 尚未落库的增量），缓存在Redis中供add直接返回，TTL到期后按OTS重新初始化
+- pending：读取尚未落库的增量
+- 落库：每个进程一个后台线程按间隔触发，同一时刻只有持有Redis锁的进程执行；
+  待落库哈希先原子改名为落库中哈希（附带批次ID）再写库，写库失败或中途崩溃时增量留在落库中哈希，
+  下次以同一批次ID重放；flush_many需以批次ID作为幂等标记，保证同一批次不会重复累加
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from config import logger
+from utils.redis_client import redis_client
+
+
+class CounterBuffer:
+    """按名称区分的Redis缓冲计数器
+
+    - flush_many(flush_id, deltas)：将 {对象ID: 增量} 原子增减写入OTS，返回 {对象ID: 是否已生效}；
+      同一flush_id重复调用时已生效的对象不得再次累加（读取失败时应抛出异常，整批留待重放）
+    - interval：落库间隔（秒）
+    """
+
+    def __init__(self, name: str, flush_many: Callable[[str, Dict[str, int]], Dict[str, bool]], interval: int,
+                 total_ttl: int = 600):
+        self.name = name
+        self.flush_many = flush_many
+        self.interval = interval
+        self.total_ttl = total_ttl
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add(self, key: str, delta: int) -> Tuple[bool, Optional[int]]:
+        """累加计数，返回 (是否成功, 新总数)；总数未缓存时新总数为None，Redis不可用时返回 (False, None)"""
+        success, total = redis_client.incr_counter(self.name, key, delta)
+        if success:
+            self.ensure_started()
+        return success, total
+
+    def totals(self, bases: Dict[str, int]) -> Dict[str, int]:
+        """展示用总数 {对象ID: 总数}，bases为OTS中的已落库值（一次Redis往返）；Redis不可用时返回bases"""
+        return redis_client.get_counter_totals(self.name, bases, self.total_ttl) or dict(bases)
+
+    def pending(self, keys: List[str]) -> Dict[str, int]:
+        """尚未落库的增量 {对象ID: 增量}（一次Redis往返）"""
+        return redis_client.get_counters(self.name, list(keys))
+
+    def ensure_started(self):
+        """确保本进程的落库线程已启动（fork后在子进程中首次使用时重新启动）"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name=f'counter-flush-{self.name}', daemon=True).start()
+
+    def flush(self) -> int:
+        """执行一次落库（其他进程正在落库时跳过），返回写入的对象数"""
+        lock_name = f"counter_flush:{self.name}"
+        token = redis_client.acquire_lock(lock_name, max(self.interval, 1) * 1000 * 6)
+        if not token:
+            return 0  # 其他进程正在落库，或Redis不可用
+
+        try:
+            flush_id, deltas = redis_client.take_counters(self.name)
+            if not deltas:
+                return 0
+
+            try:
+                results = self.flush_many(flush_id, deltas)
+            except Exception as e:
+                logger.error(f"❌ 计数落库异常: name={self.name}, {e}")
+                results = {}
+            done = [key for key in deltas if results.get(key)]
+            redis_client.finish_counters(self.name, done)
+
+            logger.info(f"🧮 计数落库: name={self.name}, 批次={flush_id}, 对象数={len(deltas)}, 失败={len(deltas) - len(done)}")
+            return len(done)
+        finally:
+            redis_client.release_lock(lock_name, token)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ 计数落库线程异常: name={self.name}, {e}")
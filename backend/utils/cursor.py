@@ -0,0 +1,32 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+from config import logger
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """将分页位置（主键值列表）编码为不透明的游标字符串"""
+    raw = json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], size: int, types: Sequence[type] = None) -> Optional[List[Any]]:
+    """解码游标，格式非法、长度不符或值类型与types（逐位置的期望类型）不符时返回None（调用方按从头读取处理）"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception as e:
+        logger.warning(f"⚠️ 无效的分页游标: {cursor}, err={str(e)}")
+        return None
+
+    if not isinstance(values, list) or len(values) != size:
+        logger.warning(f"⚠️ 分页游标格式不符: {cursor}")
+        return None
+    # bool是int的子类，需单独排除
+    if types and any(isinstance(value, bool) or not isinstance(value, expected)
+                     for value, expected in zip(values, types)):
+        logger.warning(f"⚠️ 分页游标值类型不符: {cursor}")
+        return None
+    return values
@@ -3,19 +3,28 @@ import uuid
 import time
 import logging
 import threading  # 保留异步创建非核心表功能
+from concurrent.futures import ThreadPoolExecutor
 from tablestore import (
     OTSClient, Row, Condition, RowExistenceExpectation,
     INF_MIN, INF_MAX, TableMeta, TableOptions,
-    ReservedThroughput, CapacityUnit
+    ReservedThroughput, CapacityUnit,
+    BatchGetRowRequest, TableInBatchGetRowItem,
+    BatchWriteRowRequest, TableInBatchWriteRowItem,
+    PutRowItem, UpdateRowItem, DeleteRowItem
 )
 from tablestore.error import OTSServiceError
 import oss2
 from config import (
     logger,
     OSS_ENDPOINT, OSS_BUCKET_NAME,
-    OTS_TABLE_NAME, USERS_TABLE, VERIFICATION_CODES_TABLE,
-    BORROW_RECORDS_TABLE, FAVORITES_TABLE, VIEW_HISTORY_TABLE,
-    ANNOUNCEMENTS_TABLE, COMMENTS_TABLE, RESERVATIONS_TABLE
+    OTS_TABLE_NAME, BOOK_LIST_INDEX_TABLE, USERS_TABLE, USER_ID_INDEX_TABLE, SESSIONS_TABLE, SESSION_TTL_SECONDS,
+    VERIFICATION_CODES_TABLE,
+    BORROW_RECORDS_TABLE, FAVORITES_TABLE, USER_FAVORITES_TABLE, VIEW_HISTORY_TABLE,
+    USER_VIEW_HISTORY_TABLE, VIEW_HISTORY_TTL_DAYS,
+    ANNOUNCEMENTS_TABLE, COMMENTS_TABLE, BOOK_COMMENTS_TABLE, COMMENT_ID_INDEX_TABLE,
+    RESERVATIONS_TABLE, COMMENT_LIKES_TABLE,
+    BORROWS_BY_USER_TABLE, BORROWS_BY_BOOK_TABLE, BORROWS_BY_DUE_DATE_TABLE,
+    RESERVATIONS_BY_USER_TABLE, RESERVATIONS_BY_BOOK_TABLE, RESERVATIONS_BY_RETURN_DATE_TABLE
 )
 
 # -------------------------- OTS配置（修改版：完全对齐1.docx固定值）--------------------------
@@ -78,6 +87,21 @@ def create_tables():
             ots_client.create_table(table_meta, table_options, reserved_throughput)
             logger.info(f"用户表 {USERS_TABLE} 创建成功")
 
+        # 3. 用户ID索引表（UserIdIndex，user_id -> email）- 鉴权按user_id点查依赖此表
+        if USER_ID_INDEX_TABLE not in existing_tables:
+            logger.info("创建核心表：用户ID索引表...")
+            table_meta = TableMeta(USER_ID_INDEX_TABLE, [('user_id', 'STRING')])
+            ots_client.create_table(table_meta, table_options, reserved_throughput)
+            logger.info(f"用户ID索引表 {USER_ID_INDEX_TABLE} 创建成功")
+
+        # 4. 会话表（Sessions，token为主键）- 过期会话由OTS TTL自动清理
+        if SESSIONS_TABLE not in existing_tables:
+            logger.info("创建核心表：会话表...")
+            table_meta = TableMeta(SESSIONS_TABLE, [('token', 'STRING')])
+            session_options = TableOptions(time_to_live=SESSION_TTL_SECONDS, max_version=1)
+            ots_client.create_table(table_meta, session_options, reserved_throughput)
+            logger.info(f"会话表 {SESSIONS_TABLE} 创建成功（TTL={SESSION_TTL_SECONDS}秒）")
+
         # 非核心表延迟创建（不阻塞启动）
         threading.Thread(
             target=create_non_core_tables,
@@ -93,29 +117,47 @@ def create_non_core_tables(existing_tables, table_options, reserved_throughput):
     """延迟创建非核心表（含新增的CommentLikes表）"""
     time.sleep(10)  # 延迟10秒，等待核心服务启动
     try:
-        # 3. 验证码表（VerificationCodes）
+        # 5. 验证码表（VerificationCodes）
         if VERIFICATION_CODES_TABLE not in existing_tables:
             logger.info("异步创建：验证码表...")
             table_meta = TableMeta(VERIFICATION_CODES_TABLE, [('email', 'STRING')])
             ots_client.create_table(table_meta, table_options, reserved_throughput)
             logger.info(f"验证码表 {VERIFICATION_CODES_TABLE} 创建成功")
 
-        # 4. 其他非核心表（借阅记录、收藏、浏览历史等）
+        # 6. 其他非核心表（借阅记录、收藏、浏览历史等），第三项为可选的表配置（如TTL）
+        view_history_ttl = VIEW_HISTORY_TTL_DAYS * 24 * 3600 if VIEW_HISTORY_TTL_DAYS > 0 else -1
         non_core_tables = [
+            (BOOK_LIST_INDEX_TABLE, [('list_key', 'STRING'), ('reverse_created_at', 'INTEGER'),
+                                     ('book_id', 'STRING')]),  # 图书列表索引-按创建时间倒序
             (BORROW_RECORDS_TABLE, [('borrow_id', 'STRING')]),  # 借阅记录表
-            (FAVORITES_TABLE, [('favorite_id', 'STRING')]),  # 收藏表
-            (VIEW_HISTORY_TABLE, [('history_id', 'STRING')]),  # 浏览历史表
+            (BORROWS_BY_USER_TABLE, [('user_id', 'STRING'), ('borrow_id', 'STRING')]),  # 借阅索引-按用户
+            (BORROWS_BY_BOOK_TABLE, [('book_id', 'STRING'), ('status', 'STRING'), ('due_date', 'INTEGER'),
+                                     ('borrow_id', 'STRING')]),  # 借阅索引-按图书+状态
+            (BORROWS_BY_DUE_DATE_TABLE, [('status', 'STRING'), ('due_date', 'INTEGER'),
+                                         ('borrow_id', 'STRING')]),  # 借阅索引-按应还日期
+            (FAVORITES_TABLE, [('favorite_id', 'STRING')]),  # 旧收藏表（迁移期间保留）
+            (USER_FAVORITES_TABLE, [('user_id', 'STRING'), ('book_id', 'STRING')]),  # 收藏表-复合主键
+            (VIEW_HISTORY_TABLE, [('history_id', 'STRING')]),  # 旧浏览历史表（迁移期间保留）
+            (USER_VIEW_HISTORY_TABLE, [('user_id', 'STRING'), ('reverse_ts', 'INTEGER'), ('book_id', 'STRING')],
+             TableOptions(time_to_live=view_history_ttl, max_version=1)),  # 浏览历史表-用户内按时间倒序
             (ANNOUNCEMENTS_TABLE, [('announcement_id', 'STRING')]),  # 公告表
-            (COMMENTS_TABLE, [('comment_id', 'STRING')]),  # 评论表
+            (COMMENTS_TABLE, [('comment_id', 'STRING')]),  # 旧评论表（迁移期间保留）
+            (BOOK_COMMENTS_TABLE, [('book_id', 'STRING'), ('created_at', 'INTEGER'), ('comment_id', 'STRING')]),  # 评论表-按图书连续存储
+            (COMMENT_ID_INDEX_TABLE, [('comment_id', 'STRING')]),  # 评论ID索引表
             (RESERVATIONS_TABLE, [('reservation_id', 'STRING')]),  # 预约记录表 - 使用仓储层
-            ('CommentLikes', [('comment_id', 'STRING'), ('user_id', 'STRING')])  # 评论点赞表-复合主键
+            (RESERVATIONS_BY_USER_TABLE, [('user_id', 'STRING'), ('reservation_id', 'STRING')]),  # 预约索引-按用户
+            (RESERVATIONS_BY_BOOK_TABLE, [('book_id', 'STRING'), ('status', 'STRING'), ('expected_return_date', 'INTEGER'),
+                                          ('reservation_id', 'STRING')]),  # 预约索引-按图书+状态
+            (RESERVATIONS_BY_RETURN_DATE_TABLE, [('status', 'STRING'), ('expected_return_date', 'INTEGER'),
+                                                 ('reservation_id', 'STRING')]),  # 预约索引-按预计归还日期
+            (COMMENT_LIKES_TABLE, [('comment_id', 'STRING'), ('user_id', 'STRING')])  # 评论点赞表-复合主键
         ]
 
-        for table_name, primary_key in non_core_tables:
+        for table_name, primary_key, *options in non_core_tables:
             if table_name not in existing_tables:
                 logger.info(f"异步创建：{table_name}...")
                 table_meta = TableMeta(table_name, primary_key)
-                ots_client.create_table(table_meta, table_options, reserved_throughput)
+                ots_client.create_table(table_meta, options[0] if options else table_options, reserved_throughput)
                 logger.info(f"{table_name} 创建成功")
 
         logger.info("所有非核心表创建完成")
@@ -123,7 +165,7 @@ def create_non_core_tables(existing_tables, table_options, reserved_throughput):
         logger.error(f"异步创建非核心表失败: {str(e)}", exc_info=True)
 
 
-# -------------------------- OTS通用操作工具（仅替换ots_get_range函数）--------------------------
+# -------------------------- OTS通用操作工具（ots_get_range基于流式迭代器ots_iter_range）--------------------------
 def ots_put_row(table_name, primary_key, attribute_columns, expect_exist=RowExistenceExpectation.IGNORE):
     """OTS插入/更新行（封装原代码的put_row逻辑）"""
     try:
@@ -131,13 +173,51 @@ def ots_put_row(table_name, primary_key, attribute_columns, expect_exist=RowExis
         ots_client.put_row(table_name, row, Condition(expect_exist))
         logger.info(f"OTS表 {table_name} 插入/更新成功: 主键={primary_key}")
         return True, None
+    except OTSServiceError as e:
+        if e.code == 'OTSConditionCheckFail':
+            logger.info(f"OTS表 {table_name} 条件写入未满足: 主键={primary_key}")
+        else:
+            logger.error(f"OTS表 {table_name} 插入/更新失败: code={e.code}, {e.message}")
+        return False, f"{e.code}: {e.message}"
     except Exception as e:
         logger.error(f"OTS表 {table_name} 插入/更新失败: {str(e)}", exc_info=True)
         return False, str(e)
 
 
-def ots_get_row(table_name, primary_key, columns_to_get=None):
-    """完全对齐1.docx的OTS查询逻辑，确保数据提取正确"""
+def ots_update_row(table_name, primary_key, update_columns, expect_exist=RowExistenceExpectation.IGNORE,
+                   column_condition=None):
+    """OTS单行UpdateRow（仅修改指定列，不读旧值）
+
+    update_columns格式：{'put': [(列名, 值)], 'delete_all': [列名], 'increment': [(列名, 增量)]}
+    column_condition为列条件（如SingleColumnCondition），不满足时返回 (False, 'OTSConditionCheckFail: ...')
+    """
+    try:
+        row = Row(primary_key, update_columns)
+        ots_client.update_row(table_name, row, Condition(expect_exist, column_condition))
+        logger.info(f"OTS表 {table_name} 更新成功: 主键={primary_key}")
+        return True, None
+    except OTSServiceError as e:
+        if e.code == 'OTSConditionCheckFail':
+            logger.info(f"OTS表 {table_name} 条件更新未满足: 主键={primary_key}")
+        else:
+            logger.error(f"OTS表 {table_name} 更新失败: code={e.code}, {e.message}")
+        return False, f"{e.code}: {e.message}"
+    except Exception as e:
+        logger.error(f"OTS表 {table_name} 更新失败: {str(e)}", exc_info=True)
+        return False, str(e)
+
+
+def is_condition_check_failure(err):
+    """写入失败是否由行存在性/列条件不满足导致（err为ots_put_row/ots_update_row/ots_delete_row/ots_batch_write返回的错误）"""
+    return bool(err) and err.startswith('OTSConditionCheckFail')
+
+
+def ots_get_row(table_name, primary_key, columns_to_get=None, raise_on_error=False):
+    """完全对齐1.docx的OTS查询逻辑，确保数据提取正确
+
+    raise_on_error：读取失败时抛出异常；默认记录日志后返回None（与行不存在无法区分，
+    结果会被当作"不存在"缓存或据此删除数据的调用方必须开启）
+    """
     try:
         consumed, return_row, next_token = ots_client.get_row(
             table_name, primary_key, columns_to_get=columns_to_get
@@ -164,62 +244,280 @@ def ots_get_row(table_name, primary_key, columns_to_get=None):
             logger.error(f"OTS服务错误：表={table_name}，错误码={e.code}，消息={e.message}（可能是配置/权限问题）")
         else:
             logger.error(f"OTS查询异常：表={table_name}，{str(e)}", exc_info=True)
+        if raise_on_error:
+            raise
         return None
 
 
-def ots_get_range(table_name, start_pk, end_pk, column_filter=None, limit=100, column_to_get=None):
-    """OTS范围查询（修复：补充columns_to_get参数传递，支持指定字段查询）"""
-    try:
-        result = []
-        next_start_pk = start_pk
-
-        logger.info(f"🔍 OTS范围查询: table={table_name}, start_pk={start_pk}, limit={limit}")
-        # 新增日志：打印待查询的字段列表，确认参数传递正确
-        logger.info(f"📋 待查询的字段列表: {column_to_get}")
-
-        # 核心修复：补充 columns_to_get=column_to_get，将指定字段列表传递给OTS
-        consumed, next_start_pk, row_list, next_token = ots_client.get_range(
-            table_name,
-            'FORWARD',
-            next_start_pk,
-            end_pk,
-            limit=limit,
-            max_version=1,
-            column_filter=column_filter,
-            columns_to_get=column_to_get  # ✅ 修复点：传递指定字段列表
-        )
+def _row_to_dict(row):
+    """将OTS返回的Row转换为字典（主键列+属性列）"""
+    row_data = {}
+    # 提取主键
+    for pk_name, pk_value in row.primary_key:
+        row_data[pk_name] = pk_value
+    # 提取属性列（仅返回主键时attribute_columns可能为空）
+    for col_name, col_value, col_timestamp in row.attribute_columns or []:
+        row_data[col_name] = col_value
+    return row_data
+
+
+def ots_iter_range(table_name, start_pk, end_pk, column_filter=None, column_to_get=None,
+                   max_rows=None, batch_size=1000, direction='FORWARD', raise_on_error=False):
+    """OTS流式范围查询：惰性跟随next_start_pk逐批读取，逐行yield
+
+    - max_rows：最多返回的总行数（None表示不限制）
+    - batch_size：单次get_range请求的行数上限
+    - raise_on_error：中途请求失败时抛出异常；默认记录日志后结束迭代（仅适用于容忍部分结果的页面读取，
+      全量重建、统计、迁移必须开启，否则会把截断的结果当作完整数据）
+    - 调用方可随时停止迭代（break/close），不会再发起后续请求
+    """
+    next_start_pk = start_pk
+    returned = 0
+    batch_count = 0
+
+    while next_start_pk:
+        limit = batch_size
+        if max_rows is not None:
+            remaining = max_rows - returned
+            if remaining <= 0:
+                return
+            limit = min(batch_size, remaining)
+
+        batch_count += 1
+        try:
+            consumed, next_start_pk, row_list, next_token = ots_client.get_range(
+                table_name,
+                direction,
+                next_start_pk,
+                end_pk,
+                limit=limit,
+                max_version=1,
+                column_filter=column_filter,
+                columns_to_get=column_to_get
+            )
+        except Exception as e:
+            logger.error(f"❌ OTS表 {table_name} 范围查询失败（第{batch_count}批次）: {str(e)}", exc_info=True)
+            if raise_on_error:
+                raise
+            return
+
+        logger.info(f"📦 OTS表 {table_name} 第{batch_count}批次返回 {len(row_list)} 条记录, 下一批次起始主键: {next_start_pk}")
 
-        # 转换每一行为字典（原有逻辑不变）
         for row in row_list:
-            row_data = {}
-            # 提取主键
-            for pk_name, pk_value in row.primary_key:
-                row_data[pk_name] = pk_value
-            # 提取属性列
-            for col_name, col_value, col_timestamp in row.attribute_columns:
-                row_data[col_name] = col_value
-            result.append(row_data)
+            yield _row_to_dict(row)
+            returned += 1
+
+
+def ots_get_range(table_name, start_pk, end_pk, column_filter=None, limit=None, column_to_get=None):
+    """OTS范围查询（基于ots_iter_range，自动跟随next_start_pk读取全部批次）
 
-        logger.info(f"📦 OTS批次返回 {len(result)} 条记录")
-        logger.info(f"➡️ 下一批次起始主键: {next_start_pk}")
+    limit为返回的总行数上限，None表示读取范围内的全部数据
+    """
+    logger.info(f"🔍 OTS范围查询: table={table_name}, start_pk={start_pk}, limit={limit}")
+    logger.info(f"📋 待查询的字段列表: {column_to_get}")
 
-        return result
+    result = list(ots_iter_range(
+        table_name,
+        start_pk,
+        end_pk,
+        column_filter=column_filter,
+        column_to_get=column_to_get,
+        max_rows=limit
+    ))
 
+    logger.info(f"📦 OTS范围查询共返回 {len(result)} 条记录")
+    return result
+
+
+# BatchGetRow单次请求最多100行（OTS服务端限制）
+BATCH_GET_ROW_LIMIT = 100
+# 批量读取的并发请求数
+BATCH_GET_MAX_WORKERS = 4
+
+
+def _ots_batch_get_chunk(table_name, primary_keys, columns_to_get=None, raise_on_error=False):
+    """执行单个BatchGetRow请求（主键数不超过BATCH_GET_ROW_LIMIT），返回存在的行"""
+    request = BatchGetRowRequest()
+    request.add(TableInBatchGetRowItem(table_name, primary_keys, columns_to_get=columns_to_get, max_version=1))
+
+    try:
+        response = ots_client.batch_get_row(request)
     except Exception as e:
-        logger.error(f"❌ OTS表 {table_name} 范围查询失败: {str(e)}", exc_info=True)
+        logger.error(f"❌ OTS表 {table_name} 批量读取失败: 主键数={len(primary_keys)}, {str(e)}", exc_info=True)
+        if raise_on_error:
+            raise
+        return []
+
+    result = []
+    for item in response.get_result_by_table(table_name) or []:
+        if not item.is_ok:
+            logger.error(f"OTS表 {table_name} 批量读取单行失败: 错误码={item.error_code}, 消息={item.error_message}")
+            if raise_on_error:
+                raise RuntimeError(f"OTS表 {table_name} 批量读取单行失败: {item.error_code}: {item.error_message}")
+            continue
+        # 行不存在时row为None
+        if item.row is None:
+            continue
+        result.append(_row_to_dict(item.row))
+
+    return result
+
+
+def ots_batch_get_rows(table_name, primary_keys, columns_to_get=None, max_workers=BATCH_GET_MAX_WORKERS,
+                       raise_on_error=False):
+    """OTS批量读取多行（封装batch_get_row）
+
+    主键按BATCH_GET_ROW_LIMIT分块，多个分块并发请求；返回存在的行（字典列表，按分块顺序），
+    不存在或读取失败的行会被跳过；raise_on_error开启时任一分块或单行读取失败即抛出异常（缺失的行即确认不存在）
+    """
+    if not primary_keys:
         return []
 
+    chunks = [
+        primary_keys[i:i + BATCH_GET_ROW_LIMIT]
+        for i in range(0, len(primary_keys), BATCH_GET_ROW_LIMIT)
+    ]
+    logger.info(f"🔍 OTS批量读取: table={table_name}, 主键数={len(primary_keys)}, 分块数={len(chunks)}")
+
+    if len(chunks) == 1:
+        return _ots_batch_get_chunk(table_name, chunks[0], columns_to_get, raise_on_error)
+
+    result = []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+        futures = [
+            executor.submit(_ots_batch_get_chunk, table_name, chunk, columns_to_get, raise_on_error)
+            for chunk in chunks
+        ]
+        for future in futures:
+            result.extend(future.result())
+
+    logger.info(f"📦 OTS批量读取完成: table={table_name}, 命中 {len(result)} 行")
+    return result
+
+
+# BatchWriteRow单次请求最多200行（OTS服务端限制）
+BATCH_WRITE_ROW_LIMIT = 200
+# 可重试的行级错误码（其余错误如条件检查失败直接返回失败）
+RETRYABLE_ERROR_CODES = {
+    'OTSServerBusy', 'OTSTimeout', 'OTSQuotaExhausted', 'OTSRowOperationConflict',
+    'OTSPartitionUnavailable', 'OTSServerUnavailable', 'OTSInternalServerError',
+    'OTSNotEnoughCapacityUnit', 'OTSCapacityUnitExhausted', 'OTSTableNotReady'
+}
+# 结果不确定的失败：服务端可能已执行写入（请求异常、超时、服务端内部错误），非幂等写入不可重试
+AMBIGUOUS_ERROR_CODES = {'OTSRequestFailed', 'OTSTimeout', 'OTSInternalServerError', 'OTSServerUnavailable'}
+
+
+def is_ambiguous_write_failure(err):
+    """批量写入失败的行是否可能已在服务端生效（err为ots_batch_write返回的错误）"""
+    return bool(err) and err.split(':', 1)[0] in AMBIGUOUS_ERROR_CODES
+
+
+def _build_write_row_item(operation):
+    """将写操作字典转换为BatchWriteRow的行操作对象
+
+    operation格式：
+    - {'type': 'put', 'primary_key': [...], 'attribute_columns': [(列名, 值), ...]}
+    - {'type': 'update', 'primary_key': [...], 'attribute_columns': {'put': [...], 'delete_all': [...]}}
+    - {'type': 'delete', 'primary_key': [...]}
+    可选：'expect_exist'（默认IGNORE）、'column_condition'（列条件）
+    """
+    condition = Condition(
+        operation.get('expect_exist', RowExistenceExpectation.IGNORE),
+        operation.get('column_condition')
+    )
+    op_type = operation['type']
+
+    if op_type == 'put':
+        return PutRowItem(Row(operation['primary_key'], operation.get('attribute_columns', [])), condition)
+    if op_type == 'update':
+        return UpdateRowItem(Row(operation['primary_key'], operation['attribute_columns']), condition)
+    if op_type == 'delete':
+        return DeleteRowItem(Row(operation['primary_key']), condition)
+
+    raise ValueError(f"不支持的批量写操作类型: {op_type}")
+
+
+def ots_batch_write(table_name, operations, max_retries=3, base_delay=0.1, idempotent=True):
+    """OTS批量写入（封装batch_write_row，支持put/update/delete混合操作）
+
+    - 按BATCH_WRITE_ROW_LIMIT分块提交
+    - 仅重试失败且可重试的行，重试间隔指数退避（base_delay * 2^n）
+    - idempotent=False（含increment原子增减的写入）时不重试：失败的行可能已在服务端生效（响应丢失），
+      重试会重复累加；调用方用is_ambiguous_write_failure识别结果未知的行
+    - 返回与operations一一对应的结果列表：[(success, err), ...]
+    """
+    results = [(False, '未执行')] * len(operations)
+    if not operations:
+        return results
 
-def ots_delete_row(table_name, primary_key):
-    """OTS删除行（封装原代码的delete_row逻辑）"""
+    try:
+        row_items = [_build_write_row_item(operation) for operation in operations]
+    except Exception as e:
+        logger.error(f"OTS表 {table_name} 批量写入参数错误: {str(e)}", exc_info=True)
+        return [(False, str(e))] * len(operations)
+
+    pending = list(range(len(operations)))
+    attempt = 0
+
+    while pending:
+        retry = []
+        for i in range(0, len(pending), BATCH_WRITE_ROW_LIMIT):
+            chunk = pending[i:i + BATCH_WRITE_ROW_LIMIT]
+            request = BatchWriteRowRequest()
+            request.add(TableInBatchWriteRowItem(table_name, [row_items[index] for index in chunk]))
+
+            try:
+                response = ots_client.batch_write_row(request)
+            except Exception as e:
+                # 整个请求失败（网络/限流等），整块重试
+                logger.error(f"OTS表 {table_name} 批量写入请求失败: 行数={len(chunk)}, {str(e)}")
+                for index in chunk:
+                    results[index] = (False, f"OTSRequestFailed: {str(e)}")
+                retry.extend(chunk)
+                continue
+
+            # 响应按put/update/delete分组，组内顺序与请求一致
+            grouped = {
+                'put': iter(response.get_put_by_table(table_name)),
+                'update': iter(response.get_update_by_table(table_name)),
+                'delete': iter(response.get_delete_by_table(table_name))
+            }
+            for index in chunk:
+                item = next(grouped[operations[index]['type']])
+                if item.is_ok:
+                    results[index] = (True, None)
+                else:
+                    results[index] = (False, f"{item.error_code}: {item.error_message}")
+                    if item.error_code in RETRYABLE_ERROR_CODES:
+                        retry.append(index)
+
+        if not retry or attempt >= max_retries or not idempotent:
+            break
+
+        delay = base_delay * (2 ** attempt)
+        attempt += 1
+        logger.warning(f"OTS表 {table_name} 批量写入有 {len(retry)} 行失败，{delay:.2f}s后第{attempt}次重试")
+        time.sleep(delay)
+        pending = sorted(retry)
+
+    failed = sum(1 for success, _ in results if not success)
+    logger.info(f"OTS表 {table_name} 批量写入完成: 总数={len(operations)}, 失败={failed}")
+    return results
+
+
+def ots_delete_row(table_name, primary_key, expect_exist=RowExistenceExpectation.IGNORE):
+    """OTS删除行（封装原代码的delete_row逻辑），expect_exist=EXPECT_EXIST时行不存在返回条件检查失败"""
     try:
         row = Row(primary_key)
-        ots_client.delete_row(table_name, row, Condition(RowExistenceExpectation.IGNORE))
+        ots_client.delete_row(table_name, row, Condition(expect_exist))
         logger.info(f"OTS表 {table_name} 删除成功: 主键={primary_key}")
         return True, None
     except OTSServiceError as e:
-        logger.error(f"OTS服务错误: {e.message}, code={e.code}")
-        return False, f"OTS服务错误: {e.message}"
+        if e.code == 'OTSConditionCheckFail':
+            logger.info(f"OTS表 {table_name} 条件删除未满足: 主键={primary_key}")
+        else:
+            logger.error(f"OTS服务错误: {e.message}, code={e.code}")
+        return False, f"{e.code}: {e.message}"
     except Exception as e:
         logger.error(f"OTS表 {table_name} 删除失败: {str(e)}", exc_info=True)
         return False, str(e)
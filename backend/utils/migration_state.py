@@ -0,0 +1,47 @@
+# utils/migration_state.py
+"""数据迁移完成标记：迁移/回填脚本成功结束后写入Redis，读路径据此关闭旧表双读与扫描回退
+
+- 标记未写入（或Redis不可用、标记被淘汰）时按未完成处理，继续走兼容路径，只影响性能不影响正确性
+- 已完成的结果在进程内永久缓存；未完成的结果缓存CHECK_INTERVAL_SECONDS秒，避免每次读取都访问Redis
+"""
+import threading
+import time
+from config import logger
+from utils.redis_client import redis_client
+
+# 未完成状态的复查间隔（秒）
+CHECK_INTERVAL_SECONDS = 60
+
+_done = set()
+_checked_at = {}
+_lock = threading.Lock()
+
+
+def is_migration_done(name: str) -> bool:
+    """迁移是否已完成"""
+    if name in _done:
+        return True
+
+    now = time.time()
+    with _lock:
+        if now - _checked_at.get(name, 0) < CHECK_INTERVAL_SECONDS:
+            return False
+        _checked_at[name] = now
+
+    if redis_client.get_migration_done(name):
+        _done.add(name)
+        logger.info(f"✅ 数据迁移已完成，关闭兼容读取: {name}")
+        return True
+    return False
+
+
+def mark_migration_done(name: str) -> bool:
+    """迁移/回填脚本成功结束后调用，各进程在CHECK_INTERVAL_SECONDS内生效"""
+    success = redis_client.set_migration_done(name)
+    if success:
+        _done.add(name)
+        logger.info(f"🏁 已写入迁移完成标记: {name}")
+    else:
+        logger.error(f"❌ 写入迁移完成标记失败: {name}，读路径将继续兼容旧数据")
+    return success
+
@@ -0,0 +1,171 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from tablestore import INF_MIN, INF_MAX
+from config import logger, PARALLEL_SCAN_WORKERS
+from utils.database import ots_client, ots_iter_range
+
+# 默认分片字符表（uuid类主键为十六进制字符串）
+HEX_ALPHABET = '0123456789abcdef'
+# 邮箱等文本类主键的分片字符表
+TEXT_ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+# 分片结束标记
+_SPLIT_DONE = object()
+
+
+class _SplitError:
+    """分片扫描失败标记，携带异常交由消费方重新抛出"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class ParallelScanner:
+    """OTS并行全表扫描器
+
+    将表的第一主键列切分为多个左闭右开区间，在有界线程池中并发扫描各区间，
+    结果可流式返回（iter_rows，行顺序不保证），也可按分片归约后合并（reduce/count）。
+    任一分片读取失败时整体抛出异常，不会返回部分数据。
+
+    分片点优先使用OTS的compute_split_points_by_size（SDK提供时），
+    否则按主键字符表均匀生成前缀分片点，也可通过split_points显式指定。
+    """
+
+    def __init__(self, table_name: str, primary_key_names: Sequence[str],
+                 max_workers: int = PARALLEL_SCAN_WORKERS, split_points: Optional[List[Any]] = None,
+                 alphabet: str = HEX_ALPHABET, split_size: int = 1, batch_size: int = 1000):
+        """
+        - primary_key_names：主键列名（按表主键顺序），仅按第一列切分
+        - max_workers：并发扫描线程数上限
+        - split_points：显式指定的第一主键列分片点（升序）
+        - alphabet：无法从服务端获取分片点时，用于生成前缀分片点的字符表
+        - split_size：compute_split_points_by_size的分片大小（单位100MB）
+        """
+        self.table_name = table_name
+        self.primary_key_names = list(primary_key_names)
+        self.max_workers = max(1, max_workers)
+        self.split_points = split_points
+        self.alphabet = alphabet
+        self.split_size = split_size
+        self.batch_size = batch_size
+
+    def get_splits(self) -> List[Tuple[list, list]]:
+        """计算分片区间列表：[(start_pk, end_pk), ...]，区间首尾相接覆盖整张表"""
+        points = self.split_points if self.split_points is not None else self._compute_split_points()
+        bounds = [INF_MIN] + sorted(set(points)) + [INF_MAX]
+
+        splits = []
+        for lower, upper in zip(bounds, bounds[1:]):
+            splits.append((self._build_primary_key(lower), self._build_primary_key(upper)))
+
+        logger.info(f"🧩 OTS表 {self.table_name} 并行扫描分片数: {len(splits)}")
+        return splits
+
+    def _compute_split_points(self) -> List[Any]:
+        """获取第一主键列的分片点"""
+        compute = getattr(ots_client, 'compute_split_points_by_size', None)
+        if compute is not None:
+            try:
+                split_points = compute(self.table_name, self.split_size)
+                # 服务端返回的分片点为主键列表，取第一主键列的值
+                return [split_point[0][1] for split_point in split_points if split_point]
+            except Exception as e:
+                logger.warning(f"⚠️ OTS表 {self.table_name} 计算分片点失败，改用前缀分片: {str(e)}")
+
+        # 以字符表前缀均匀切分，分片数约为线程数的4倍，便于负载均衡
+        target = self.max_workers * 4
+        step = max(1, len(self.alphabet) // target)
+        return list(self.alphabet[step::step])
+
+    def _build_primary_key(self, first_value) -> list:
+        """构造分片边界主键（第一列取边界值，其余列取INF_MIN）"""
+        primary_key = [(self.primary_key_names[0], first_value)]
+        primary_key.extend((name, INF_MIN) for name in self.primary_key_names[1:])
+        return primary_key
+
+    def iter_rows(self, column_filter=None, column_to_get=None) -> Iterator[Dict[str, Any]]:
+        """并行扫描全表，流式返回每一行（跨分片无序）
+
+        各分片按批次写入有界队列，消费方停止迭代后工作线程随即退出；分片失败时在消费方抛出异常
+        """
+        splits = self.get_splits()
+        rows_queue = queue.Queue(maxsize=self.max_workers * 2)
+        stop_event = threading.Event()
+
+        def put(item) -> bool:
+            while not stop_event.is_set():
+                try:
+                    rows_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_split(start_pk, end_pk):
+            batch = []
+            try:
+                for row in ots_iter_range(self.table_name, start_pk, end_pk, column_filter=column_filter,
+                                          column_to_get=column_to_get, batch_size=self.batch_size,
+                                          raise_on_error=True):
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch:
+                    put(batch)
+            except Exception as e:
+                put(_SplitError(e))
+            finally:
+                put(_SPLIT_DONE)
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(splits)))
+        try:
+            for start_pk, end_pk in splits:
+                executor.submit(scan_split, start_pk, end_pk)
+
+            remaining = len(splits)
+            while remaining:
+                item = rows_queue.get()
+                if item is _SPLIT_DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(item, _SplitError):
+                    raise item.error
+                yield from item
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=False)
+
+    def reduce(self, reducer: Callable[[Any, Dict[str, Any]], Any], combiner: Callable[[Any, Any], Any],
+               initial: Any, column_filter=None, column_to_get=None) -> Any:
+        """并行扫描并归约：每个分片从initial开始用reducer累积，再用combiner合并各分片结果
+
+        initial会在每个分片中复用，请传入不可变值（如0、空元组）
+        """
+        splits = self.get_splits()
+
+        def reduce_split(start_pk, end_pk):
+            acc = initial
+            for row in ots_iter_range(self.table_name, start_pk, end_pk, column_filter=column_filter,
+                                      column_to_get=column_to_get, batch_size=self.batch_size,
+                                      raise_on_error=True):
+                acc = reducer(acc, row)
+            return acc
+
+        result = initial
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(splits))) as executor:
+            futures = [executor.submit(reduce_split, start_pk, end_pk) for start_pk, end_pk in splits]
+            for future in futures:
+                result = combiner(result, future.result())
+
+        return result
+
+    def count(self, column_filter=None, column_to_get=None) -> int:
+        """并行统计行数"""
+        count = self.reduce(lambda acc, _: acc + 1, lambda a, b: a + b, 0,
+                            column_filter=column_filter, column_to_get=column_to_get)
+        logger.info(f"🔢 OTS表 {self.table_name} 并行统计完成: {count} 条记录")
+        return count
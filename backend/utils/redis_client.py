@@ -2,7 +2,91 @@
 import redis
 import json
 import os
-from config import logger
+import random
+import time
+import uuid
+from config import (
+    logger, BOOK_CACHE_VERSION, BOOK_CACHE_TTL_SECONDS, BOOK_CACHE_TTL_JITTER, BOOK_CACHE_DIRTY_SECONDS,
+    BOOK_PAGE_CACHE_TTL_SECONDS, CACHE_INVALIDATION_CHANNEL
+)
+
+# 图书目录版本号（任何图书写入后INCR，列表页缓存键包含该版本号）
+CATALOG_VERSION_KEY = 'catalog:version'
+# 目录版本号递增后在失效频道发布的消息名（keys为新版本号）
+CATALOG_VERSION_MESSAGE = 'catalog_version'
+
+# 递增版本号并在同一脚本内发布新版本（KEYS[1]=版本号键, ARGV[1]=频道, ARGV[2]=消息名），
+# 保证各进程按版本号顺序收到通知，且先于版本通知发布的失效消息已送达
+_BUMP_VERSION_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', ARGV[1], cjson.encode({cache = ARGV[2], keys = {tostring(version)}}))
+return version
+"""
+
+# 仅在没有写入标记时回填缓存（KEYS[1]=缓存键, KEYS[2]=写入标记键, ARGV[1]=数据, ARGV[2]=TTL）
+_SET_IF_CLEAN_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# 仅释放自己持有的锁（KEYS[1]=锁键, ARGV[1]=加锁时的令牌）
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+# 写入新值并返回旧值（KEYS[1]=键, ARGV[1]=新值, ARGV[2]=TTL），兼容不支持SET ... GET的Redis版本
+_SWAP_SCRIPT = """
+local old = redis.call('GET', KEYS[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return old
+"""
+
+# 仍为预期值时回退为指定旧值，旧值为空串时删除（KEYS[1]=键, ARGV[1]=预期值, ARGV[2]=旧值, ARGV[3]=TTL）
+_RESTORE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+# 累加缓冲计数，总数已缓存时同步累加并返回新总数（KEYS[1]=待落库哈希, KEYS[2]=总数键, ARGV[1]=字段, ARGV[2]=增量）
+_INCR_COUNTER_SCRIPT = """
+redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return redis.call('INCRBY', KEYS[2], ARGV[2])
+end
+return false
+"""
+
+# 读取或初始化计数总数（KEYS[1]=待落库哈希, KEYS[2]=落库中哈希, KEYS[3..]=各字段总数键；
+# ARGV[1]=TTL, ARGV[2*i]/ARGV[2*i+1]=第i个字段及其已落库值），未缓存的总数 = 已落库值 + 尚未落库的增量
+_SEED_COUNTERS_SCRIPT = """
+local totals = {}
+for i = 3, #KEYS do
+    local total = redis.call('GET', KEYS[i])
+    if not total then
+        local field = ARGV[2 * (i - 2)]
+        total = tonumber(ARGV[2 * (i - 2) + 1])
+            + tonumber(redis.call('HGET', KEYS[1], field) or 0)
+            + tonumber(redis.call('HGET', KEYS[2], field) or 0)
+        redis.call('SET', KEYS[i], total, 'EX', ARGV[1])
+    end
+    totals[#totals + 1] = tostring(total)
+end
+return totals
+"""
 
 
 class RedisClient:
@@ -19,6 +103,13 @@ class RedisClient:
             )
             # 测试连接
             self.client.ping()
+            self._set_if_clean = self.client.register_script(_SET_IF_CLEAN_SCRIPT)
+            self._release_lock = self.client.register_script(_RELEASE_LOCK_SCRIPT)
+            self._swap = self.client.register_script(_SWAP_SCRIPT)
+            self._restore = self.client.register_script(_RESTORE_SCRIPT)
+            self._bump_version = self.client.register_script(_BUMP_VERSION_SCRIPT)
+            self._incr_counter = self.client.register_script(_INCR_COUNTER_SCRIPT)
+            self._seed_counters = self.client.register_script(_SEED_COUNTERS_SCRIPT)
             logger.info("✅ Redis连接成功")
         except Exception as e:
             logger.error(f"❌ Redis连接失败: {e}")
@@ -48,8 +139,42 @@ class RedisClient:
         except Exception as e:
             logger.error(f"Redis设置用户失败: {e}")
 
+    def get_users(self, user_ids):
+        """批量获取用户缓存（MGET），返回以user_id为键的字典，未命中的不出现在结果中（负缓存的值为None）"""
+        if not self.client or not user_ids:
+            return {}
+        try:
+            values = self.client.mget([f"user:{user_id}" for user_id in user_ids])
+            return {user_id: json.loads(data) for user_id, data in zip(user_ids, values) if data}
+        except Exception as e:
+            logger.error(f"Redis批量获取用户失败: {e}")
+            return {}
+
+    def set_users(self, users, expire=3600):
+        """批量设置用户缓存 {user_id: 用户数据}（None表示用户不存在），返回成功写入的user_id集合"""
+        if not self.client or not users:
+            return set()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for user_id, user_data in users.items():
+                pipe.setex(f"user:{user_id}", expire, json.dumps(user_data))
+            pipe.execute()
+            return set(users)
+        except Exception as e:
+            logger.error(f"Redis批量设置用户失败: {e}")
+            return set()
+
+    def invalidate_users(self, user_ids):
+        """用户资料变更后删除缓存"""
+        if not self.client or not user_ids:
+            return
+        try:
+            self.client.delete(*[f"user:{user_id}" for user_id in user_ids])
+        except Exception as e:
+            logger.error(f"Redis删除用户缓存失败: {e}")
+
     def get_user_by_token(self, token):
-        """通过token获取用户ID"""
+        """通过token获取用户ID（负缓存的Token返回空字符串）"""
         if not self.client:
             return None
         try:
@@ -68,5 +193,335 @@ class RedisClient:
             logger.error(f"Redis设置token失败: {e}")
 
 
+    @staticmethod
+    def _book_key(book_id):
+        return f"book:v{BOOK_CACHE_VERSION}:{book_id}"
+
+    @staticmethod
+    def _book_dirty_key(book_id):
+        return f"book:v{BOOK_CACHE_VERSION}:{book_id}:dirty"
+
+    @staticmethod
+    def _jittered_ttl(ttl):
+        """TTL按比例随机抖动，避免同时写入的缓存集中过期"""
+        jitter = int(ttl * BOOK_CACHE_TTL_JITTER)
+        return max(1, ttl + random.randint(-jitter, jitter))
+
+    def get_book(self, book_id):
+        """获取图书缓存"""
+        if not self.client:
+            return None
+        try:
+            data = self.client.get(self._book_key(book_id))
+            return json.loads(data) if data else None
+        except Exception as e:
+            logger.error(f"Redis获取图书失败: {e}")
+            return None
+
+    def get_books(self, book_ids):
+        """批量获取图书缓存（MGET），返回以book_id为键的字典，未命中的不出现在结果中（负缓存的值为None）"""
+        if not self.client or not book_ids:
+            return {}
+        try:
+            values = self.client.mget([self._book_key(book_id) for book_id in book_ids])
+            return {book_id: json.loads(data) for book_id, data in zip(book_ids, values) if data}
+        except Exception as e:
+            logger.error(f"Redis批量获取图书失败: {e}")
+            return {}
+
+    def set_books(self, books, expire=BOOK_CACHE_TTL_SECONDS):
+        """回填图书缓存 {book_id: 图书数据}（None表示图书不存在；最近有写入的图书跳过，由下次读取回填），返回实际写入的book_id集合"""
+        if not self.client or not books:
+            return set()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for book_id, book_data in books.items():
+                self._set_if_clean(
+                    keys=[self._book_key(book_id), self._book_dirty_key(book_id)],
+                    args=[json.dumps(book_data), self._jittered_ttl(expire)],
+                    client=pipe
+                )
+            return {book_id for book_id, written in zip(books, pipe.execute()) if written}
+        except Exception as e:
+            logger.error(f"Redis设置图书缓存失败: {e}")
+            return set()
+
+    def set_book(self, book_id, book_data, expire=BOOK_CACHE_TTL_SECONDS):
+        """回填单本图书缓存"""
+        return self.set_books({book_id: book_data}, expire)
+
+    def invalidate_books(self, book_ids):
+        """图书写入后失效缓存，并在短时间内禁止回填（防止并发读取写回旧数据）"""
+        if not self.client or not book_ids:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for book_id in book_ids:
+                pipe.setex(self._book_dirty_key(book_id), BOOK_CACHE_DIRTY_SECONDS, 1)
+                pipe.delete(self._book_key(book_id))
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis失效图书缓存失败: {e}")
+
+    def get_catalog_version(self):
+        """获取图书目录版本号，Redis不可用时返回None"""
+        if not self.client:
+            return None
+        try:
+            return self.client.get(CATALOG_VERSION_KEY) or '0'
+        except Exception as e:
+            logger.error(f"Redis获取目录版本号失败: {e}")
+            return None
+
+    def bump_catalog_version(self):
+        """图书写入后递增目录版本号并发布新版本号，旧版本的列表页缓存随即不再被读取（由TTL过期清理）"""
+        if not self.client:
+            return
+        try:
+            self._bump_version(keys=[CATALOG_VERSION_KEY], args=[CACHE_INVALIDATION_CHANNEL, CATALOG_VERSION_MESSAGE])
+        except Exception as e:
+            logger.error(f"Redis递增目录版本号失败: {e}")
+
+    @staticmethod
+    def _book_page_key(version, page_key, size, category):
+        return f"book_page:v{BOOK_CACHE_VERSION}:{version}:{size}:{page_key}:{category}"
+
+    def get_book_page(self, version, page_key, size, category):
+        """获取已渲染的列表页响应体（JSON字符串）"""
+        if not self.client:
+            return None
+        try:
+            return self.client.get(self._book_page_key(version, page_key, size, category))
+        except Exception as e:
+            logger.error(f"Redis获取列表页缓存失败: {e}")
+            return None
+
+    def set_book_page(self, version, page_key, size, category, body, expire=BOOK_PAGE_CACHE_TTL_SECONDS):
+        """缓存已渲染的列表页响应体"""
+        if not self.client:
+            return
+        try:
+            self.client.setex(self._book_page_key(version, page_key, size, category), expire, body)
+        except Exception as e:
+            logger.error(f"Redis设置列表页缓存失败: {e}")
+
+    def acquire_lock(self, name, expire_ms):
+        """获取跨进程锁（SET NX PX），成功返回令牌，已被其他进程持有返回None；
+        Redis不可用时返回空字符串（不加锁继续执行）"""
+        if not self.client:
+            return ''
+        try:
+            token = uuid.uuid4().hex
+            return token if self.client.set(f"lock:{name}", token, nx=True, px=expire_ms) else None
+        except Exception as e:
+            logger.error(f"Redis加锁失败: name={name}, err={e}")
+            return ''
+
+    def release_lock(self, name, token):
+        """释放跨进程锁（令牌不符时不删除，避免误删锁过期后其他进程获取的锁）"""
+        if not self.client or not token:
+            return
+        try:
+            self._release_lock(keys=[f"lock:{name}"], args=[token])
+        except Exception as e:
+            logger.error(f"Redis释放锁失败: name={name}, err={e}")
+
+    def is_locked(self, name):
+        """跨进程锁是否仍被持有"""
+        if not self.client:
+            return False
+        try:
+            return bool(self.client.exists(f"lock:{name}"))
+        except Exception as e:
+            logger.error(f"Redis检查锁失败: name={name}, err={e}")
+            return False
+
+    def publish(self, channel, message):
+        """发布消息（用于跨进程通知，如L1缓存失效）"""
+        if not self.client:
+            return
+        try:
+            self.client.publish(channel, message)
+        except Exception as e:
+            logger.error(f"Redis发布消息失败: channel={channel}, err={e}")
+
+    def swap_last_view(self, user_id, book_id, reverse_ts, window):
+        """记录用户对图书的最近一次浏览（倒序时间戳），返回合并窗口内上一次浏览的倒序时间戳（没有或Redis不可用时返回None）"""
+        if not self.client:
+            return None
+        try:
+            old = self._swap(keys=[f"last_view:{user_id}:{book_id}"], args=[reverse_ts, window])
+            return int(old) if old is not None else None
+        except Exception as e:
+            logger.error(f"Redis记录最近浏览失败: user_id={user_id}, book_id={book_id}, err={e}")
+            return None
+
+    def restore_last_view(self, user_id, book_id, reverse_ts, previous, window):
+        """写入失败时回退最近浏览：仍指向reverse_ts时改回previous（None则删除），已被更新的浏览覆盖时不动"""
+        if not self.client:
+            return False
+        try:
+            restored = self._restore(
+                keys=[f"last_view:{user_id}:{book_id}"],
+                args=[reverse_ts, '' if previous is None else previous, window]
+            )
+            return bool(restored)
+        except Exception as e:
+            logger.error(f"Redis回退最近浏览失败: user_id={user_id}, book_id={book_id}, err={e}")
+            return False
+
+    @staticmethod
+    def _counter_keys(name):
+        """缓冲计数器的待落库哈希与落库中哈希（字段为计数对象ID，值为尚未写入OTS的增量）"""
+        return f"counter:{name}:pending", f"counter:{name}:flushing"
+
+    @staticmethod
+    def _counter_flush_id_key(name):
+        """落库中哈希对应的落库批次ID（写入OTS时作为幂等标记，同一批次重放不会重复累加）"""
+        return f"counter:{name}:flush_id"
+
+    @staticmethod
+    def _counter_total_key(name, field):
+        """计数总数缓存（已落库值 + 尚未落库的增量），由读取路径初始化，累加时同步更新"""
+        return f"counter:{name}:total:{field}"
+
+    def incr_counter(self, name, field, delta):
+        """累加缓冲计数（一次脚本调用），返回 (是否成功, 新总数)；总数未缓存时新总数为None；
+        Redis不可用返回 (False, None)（调用方应直接写库）"""
+        if not self.client:
+            return False, None
+        try:
+            total = self._incr_counter(keys=[self._counter_keys(name)[0], self._counter_total_key(name, field)],
+                                       args=[field, delta])
+            return True, int(total) if total is not None else None
+        except Exception as e:
+            logger.error(f"Redis累加计数失败: name={name}, field={field}, err={e}")
+            return False, None
+
+    def get_counter_totals(self, name, bases, expire):
+        """读取计数总数，未缓存的以 已落库值(bases) + 尚未落库的增量 初始化（TTL为expire秒）；
+        返回 {field: 总数}，Redis不可用时返回空字典"""
+        if not self.client or not bases:
+            return {}
+        fields = list(bases)
+        args = [expire]
+        for field in fields:
+            args.extend([field, int(bases[field])])
+        try:
+            totals = self._seed_counters(
+                keys=list(self._counter_keys(name)) + [self._counter_total_key(name, field) for field in fields],
+                args=args
+            )
+            return {field: int(total) for field, total in zip(fields, totals)}
+        except Exception as e:
+            logger.error(f"Redis读取计数总数失败: name={name}, err={e}")
+            return {}
+
+    def get_counters(self, name, fields):
+        """读取尚未落库的增量（待落库 + 落库中），返回 {field: 增量}，仅包含非0项"""
+        if not self.client or not fields:
+            return {}
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in self._counter_keys(name):
+                pipe.hmget(key, fields)
+            pending, flushing = pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis读取计数失败: name={name}, err={e}")
+            return {}
+
+        result = {}
+        for field, a, b in zip(fields, pending, flushing):
+            delta = int(a or 0) + int(b or 0)
+            if delta:
+                result[field] = delta
+        return result
+
+    def take_counters(self, name):
+        """取出待落库的增量：上次落库未完成时先返回残留的落库中数据（沿用原批次ID），
+        否则将待落库哈希原子改名为落库中并生成新的批次ID；
+        返回 (批次ID, {field: 增量})，需由单一落库进程调用（配合acquire_lock）"""
+        if not self.client:
+            return None, {}
+        pending_key, flushing_key = self._counter_keys(name)
+        flush_id_key = self._counter_flush_id_key(name)
+        try:
+            if not self.client.exists(flushing_key):
+                try:
+                    self.client.rename(pending_key, flushing_key)
+                except redis.ResponseError:
+                    return None, {}  # 没有待落库的增量
+                self.client.set(flush_id_key, uuid.uuid4().hex)
+            # 改名后、写入批次ID前中断时尚未写库，补一个新批次ID即可
+            self.client.set(flush_id_key, uuid.uuid4().hex, nx=True)
+            flush_id = self.client.get(flush_id_key)
+            deltas = {field: int(value) for field, value in self.client.hgetall(flushing_key).items() if int(value)}
+            return flush_id, deltas
+        except Exception as e:
+            logger.error(f"Redis取出计数失败: name={name}, err={e}")
+            return None, {}
+
+    def finish_counters(self, name, done):
+        """落库完成：从落库中哈希删除已写入的字段；全部写入后删除落库中哈希与批次ID
+
+        写库失败（或结果未知）的增量留在落库中哈希，下次以同一批次ID重放，由OTS侧的批次标记保证不重复累加
+        """
+        if not self.client:
+            return
+        pending_key, flushing_key = self._counter_keys(name)
+        try:
+            if done:
+                self.client.hdel(flushing_key, *done)
+            if not self.client.hlen(flushing_key):
+                pipe = self.client.pipeline(transaction=True)
+                pipe.delete(flushing_key)
+                pipe.delete(self._counter_flush_id_key(name))
+                pipe.execute()
+        except Exception as e:
+            logger.error(f"Redis完成计数落库失败: name={name}, err={e}")
+
+    def add_index_repairs(self, index_name, entries):
+        """记录同步失败待修复的索引项（按索引区分的集合，去重），成功返回True"""
+        if not self.client or not entries:
+            return False
+        try:
+            self.client.sadd(f"index_repair:{index_name}", *entries)
+            return True
+        except Exception as e:
+            logger.error(f"Redis记录索引修复项失败: index={index_name}, err={e}")
+            return False
+
+    def take_index_repairs(self, index_name, count=1000):
+        """取出（SPOP）最多count个待修复的索引项"""
+        if not self.client:
+            return []
+        try:
+            return self.client.spop(f"index_repair:{index_name}", count) or []
+        except Exception as e:
+            logger.error(f"Redis取出索引修复项失败: index={index_name}, err={e}")
+            return []
+
+    def get_migration_done(self, name):
+        """数据迁移是否已标记完成；Redis不可用时返回None（调用方按未完成处理）"""
+        if not self.client:
+            return None
+        try:
+            return bool(self.client.exists(f"migration_done:{name}"))
+        except Exception as e:
+            logger.error(f"Redis读取迁移标记失败: name={name}, err={e}")
+            return None
+
+    def set_migration_done(self, name):
+        """标记数据迁移已完成（不过期），成功返回True"""
+        if not self.client:
+            return False
+        try:
+            self.client.set(f"migration_done:{name}", int(time.time()))
+            return True
+        except Exception as e:
+            logger.error(f"Redis写入迁移标记失败: name={name}, err={e}")
+            return False
+
+
 # 全局Redis客户端
 redis_client = RedisClient()
\ No newline at end of file
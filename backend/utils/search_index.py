@@ -0,0 +1,456 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from config import logger
+
+# 英文/数字词元
+_WORD_PATTERN = re.compile(r'[0-9a-z]+')
+# 中日韩字符（统一表意文字、扩展A、假名、谚文）
+_CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]+')
+# 联想词的分词边界（空白及常见标点），每个边界之后的后缀都可作为前缀匹配起点
+_SUGGEST_BOUNDARY_PATTERN = re.compile(r'[\s:：·,，、\-—()（）《》]+')
+# ISBN形式的查询（数字、连字符、空格，末位可为X）
+_ISBN_PATTERN = re.compile(r'[0-9][0-9\-\s]*[0-9xX]')
+
+
+def tokenize(text: Any) -> List[str]:
+    """文本分词：英文/数字按单词切分，连续中日韩字符切分为二元组（单字保留为单字词元）"""
+    if not text:
+        return []
+    text = str(text).lower()
+
+    tokens = _WORD_PATTERN.findall(text)
+    for run in _CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class InvertedIndex:
+    """倒排索引（BM25F打分），非线程安全，由BookSearchIndex加锁访问
+
+    - fields：{字段名: 权重}，文档词频与长度按字段权重加权
+    - stored_fields：随文档保存的展示字段，查询结果直接返回，无需回表
+    """
+
+    def __init__(self, fields: Dict[str, float], stored_fields: Tuple[str, ...], k1: float = 1.2, b: float = 0.75):
+        self.fields = fields
+        self.stored_fields = stored_fields
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)  # 词元 -> {doc_id: 加权词频}
+        self.doc_terms: Dict[str, Dict[str, float]] = {}  # doc_id -> {词元: 加权词频}，用于删除
+        self.doc_lengths: Dict[str, float] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0.0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, doc_id: str, doc: Dict[str, Any]):
+        """添加或替换文档"""
+        self.remove(doc_id)
+
+        term_freqs: Dict[str, float] = defaultdict(float)
+        length = 0.0
+        for field, weight in self.fields.items():
+            tokens = tokenize(doc.get(field))
+            length += weight * len(tokens)
+            for token in tokens:
+                term_freqs[token] += weight
+
+        for token, freq in term_freqs.items():
+            self.postings[token][doc_id] = freq
+        self.doc_terms[doc_id] = dict(term_freqs)
+        self.doc_lengths[doc_id] = length
+        self.documents[doc_id] = {name: doc.get(name) for name in self.stored_fields}
+        self.total_length += length
+
+    def remove(self, doc_id: str):
+        """删除文档（不存在时忽略）"""
+        term_freqs = self.doc_terms.pop(doc_id, None)
+        if term_freqs is None:
+            return
+
+        for token in term_freqs:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[token]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0.0)
+        self.documents.pop(doc_id, None)
+
+    def update_stored(self, doc_id: str, values: Dict[str, Any]):
+        """仅更新展示字段（如库存、状态），不重新分词"""
+        stored = self.documents.get(doc_id)
+        if stored is not None:
+            stored.update({name: value for name, value in values.items() if name in self.stored_fields})
+
+    def search(self, query: str, offset: int = 0, limit: int = 10) -> Tuple[int, List[Tuple[Dict[str, Any], float]]]:
+        """BM25检索，返回 (命中总数, [(展示字段, 得分)])，按得分降序"""
+        terms = set(tokenize(query))
+        doc_count = len(self.documents)
+        if not terms or not doc_count:
+            return 0, []
+
+        avg_length = self.total_length / doc_count or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, freq in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(ranked), [(self.documents[doc_id], score) for doc_id, score in ranked[offset:offset + limit]]
+
+
+class PrefixIndex:
+    """前缀联想索引：有序数组 + 二分查找前缀区间，非线程安全，由BookSuggestIndex加锁访问
+
+    每个条目为(规范化文本, 类型, doc_id)，同一文本在每个分词边界后的后缀也各有一个条目，
+    使"Cookbook"能匹配"Python Cookbook"。前缀区间内按热度取top-k。
+    """
+
+    KINDS = ('title', 'author')
+
+    def __init__(self):
+        self.keys: List[Tuple[str, str, str]] = []
+        self.doc_keys: Dict[str, List[Tuple[str, str, str]]] = {}
+        self.displays: Dict[Tuple[str, str], str] = {}  # (类型, doc_id) -> 展示文本
+        self.popularity: Dict[str, float] = defaultdict(float)
+
+    def __len__(self):
+        return len(self.doc_keys)
+
+    @staticmethod
+    def normalize(text: Any) -> str:
+        return ' '.join(str(text or '').lower().split())
+
+    @classmethod
+    def _prefix_keys(cls, text: str) -> List[str]:
+        normalized = cls.normalize(text)
+        keys = [normalized]
+        for match in _SUGGEST_BOUNDARY_PATTERN.finditer(normalized):
+            suffix = normalized[match.end():]
+            if suffix:
+                keys.append(suffix)
+        return list(dict.fromkeys(keys))
+
+    def _entries(self, doc_id: str, doc: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        entries = []
+        for kind in self.KINDS:
+            text = (doc.get(kind) or '').strip()
+            if not text:
+                continue
+            self.displays[(kind, doc_id)] = text
+            entries.extend((key, kind, doc_id) for key in self._prefix_keys(text))
+        return entries
+
+    def bulk_load(self, docs: Iterable[Dict[str, Any]]):
+        """批量加载（追加后一次排序，用于全量构建）"""
+        for doc in docs:
+            entries = self._entries(doc['book_id'], doc)
+            self.doc_keys[doc['book_id']] = entries
+            self.keys.extend(entries)
+        self.keys.sort()
+
+    def add(self, doc_id: str, doc: Dict[str, Any]):
+        """添加或替换文档（有序插入）"""
+        self.remove(doc_id)
+        entries = self._entries(doc_id, doc)
+        for entry in entries:
+            bisect.insort(self.keys, entry)
+        self.doc_keys[doc_id] = entries
+
+    def remove(self, doc_id: str):
+        """删除文档（不存在时忽略）"""
+        for entry in self.doc_keys.pop(doc_id, []):
+            position = bisect.bisect_left(self.keys, entry)
+            if position < len(self.keys) and self.keys[position] == entry:
+                del self.keys[position]
+        for kind in self.KINDS:
+            self.displays.pop((kind, doc_id), None)
+
+    def bump(self, doc_id: str, delta: float):
+        """增加文档热度"""
+        self.popularity[doc_id] += delta
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """返回前缀匹配的联想词，书名按该书热度、作者按其所有图书热度之和排序"""
+        prefix = self.normalize(prefix)
+        if not prefix:
+            return []
+
+        low = bisect.bisect_left(self.keys, (prefix,))
+        high = bisect.bisect_left(self.keys, (prefix + '\uffff',))
+
+        candidates: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for _, kind, doc_id in self.keys[low:high]:
+            display = self.displays.get((kind, doc_id))
+            if display is None:
+                continue
+            dedup_key = (kind, self.normalize(display) if kind == 'author' else doc_id)
+            candidate = candidates.setdefault(dedup_key, {'text': display, 'type': kind, 'docs': set()})
+            candidate['docs'].add(doc_id)
+
+        scored = []
+        for candidate in candidates.values():
+            score = sum(self.popularity.get(doc_id, 0) for doc_id in candidate['docs'])
+            scored.append((score, candidate))
+
+        top = heapq.nsmallest(limit, scored, key=lambda item: (-item[0], len(item[1]['text']), item[1]['text']))
+        result = []
+        for score, candidate in top:
+            item = {'text': candidate['text'], 'type': candidate['type'], 'score': score}
+            if candidate['type'] == 'title':
+                item['book_id'] = next(iter(candidate['docs']))
+            result.append(item)
+        return result
+
+
+class RebuildableIndex:
+    """可全量重建、可增量维护的进程内索引基类
+
+    首次使用时同步构建，写路径通过_write增量维护；超过refresh_seconds后在后台线程全量重建并原子替换
+    （用于同步其他进程的写入），重建期间的增量变更在替换前重放。子类实现_new_index/_load/_apply。
+    """
+
+    name = '索引'
+
+    def __init__(self, refresh_seconds: int = 0):
+        self.refresh_seconds = refresh_seconds
+        self._index = None
+        self._built_at = 0.0
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._pending: Optional[List[Tuple[str, str, Any]]] = None  # 重建期间的增量变更
+
+    def _new_index(self):
+        raise NotImplementedError
+
+    def _load(self, index):
+        """从数据源全量加载到新索引"""
+        raise NotImplementedError
+
+    def _apply(self, index, action: str, doc_id: str, payload: Any):
+        raise NotImplementedError
+
+    def rebuild(self, only_if_missing: bool = False) -> int:
+        """全量重建索引，完成后原子替换，返回文档数"""
+        with self._build_lock:
+            if only_if_missing and self._index is not None:
+                return len(self._index)
+            started = time.time()
+            with self._lock:
+                self._pending = []
+
+            index = self._new_index()
+            try:
+                self._load(index)
+            except Exception as e:
+                with self._lock:
+                    self._pending = None
+                logger.error(f"❌ {self.name}构建失败: {str(e)}", exc_info=True)
+                raise
+
+            with self._lock:
+                for action, doc_id, payload in self._pending:
+                    self._apply(index, action, doc_id, payload)
+                self._pending = None
+                self._index = index
+                self._built_at = time.time()
+
+            logger.info(f"🔎 {self.name}构建完成: 文档数={len(index)}, 耗时={time.time() - started:.2f}s")
+            return len(index)
+
+    def ensure_ready(self):
+        """确保索引可用：未构建时同步构建，过期时后台重建（期间继续使用旧索引）"""
+        if self._index is None:
+            self.rebuild(only_if_missing=True)
+            return
+
+        if self.refresh_seconds > 0 and time.time() - self._built_at > self.refresh_seconds \
+                and not self._build_lock.locked():
+            self._built_at = time.time()  # 避免并发请求重复触发重建
+            threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.rebuild()
+        except Exception:
+            pass  # 已记录日志，继续使用旧索引
+
+    def _write(self, action: str, doc_id: str, payload: Any = None):
+        with self._lock:
+            if self._index is not None:
+                self._apply(self._index, action, doc_id, payload)
+            if self._pending is not None:
+                self._pending.append((action, doc_id, payload))
+
+
+class BookSearchIndex(RebuildableIndex):
+    """进程内图书全文检索索引（倒排索引 + BM25），查询期间不访问OTS"""
+
+    name = '图书检索索引'
+    # isbn_compact为去除连字符后的ISBN，使带/不带连字符的ISBN查询都能命中
+    FIELDS = {
+        'title': 3.0, 'author': 2.0, 'isbn': 1.0, 'isbn_compact': 2.0,
+        'publisher': 1.0, 'summary': 1.0, 'description': 0.5
+    }
+    STORED_FIELDS = (
+        'book_id', 'title', 'author', 'publisher', 'isbn', 'cover', 'category',
+        'status', 'stock', 'price', 'summary', 'description'
+    )
+
+    def __init__(self, loader: Callable[[], Iterable[Dict[str, Any]]], refresh_seconds: int = 0,
+                 loader_many: Callable[[List[str]], Dict[str, Dict[str, Any]]] = None):
+        super().__init__(refresh_seconds)
+        self.loader = loader
+        self.loader_many = loader_many
+        self._stale = set()
+        self._stale_lock = threading.Lock()
+
+    def _new_index(self) -> InvertedIndex:
+        return InvertedIndex(self.FIELDS, self.STORED_FIELDS)
+
+    @staticmethod
+    def _document(book: Dict[str, Any]) -> Dict[str, Any]:
+        """图书数据转换为索引文档（补充规范化ISBN）"""
+        doc = dict(book)
+        doc['isbn_compact'] = re.sub(r'[^0-9xX]', '', str(book.get('isbn') or ''))
+        return doc
+
+    def _load(self, index: InvertedIndex):
+        for book in self.loader():
+            index.add(book['book_id'], self._document(book))
+
+    def _apply(self, index: InvertedIndex, action: str, doc_id: str, payload: Any):
+        if action == 'upsert':
+            index.add(doc_id, payload)
+        elif action == 'remove':
+            index.remove(doc_id)
+        elif action == 'stored':
+            index.update_stored(doc_id, payload)
+
+    def upsert(self, book: Dict[str, Any]):
+        """新增或更新图书（重新分词）"""
+        self._write('upsert', book['book_id'], self._document(book))
+
+    def remove(self, book_id: str):
+        """删除图书"""
+        self._write('remove', book_id)
+
+    def update_stored(self, book_id: str, values: Dict[str, Any]):
+        """更新图书展示字段（库存、状态等非检索字段）"""
+        self._write('stored', book_id, dict(values))
+
+    def evict(self, book_ids: List[str]):
+        """标记图书待刷新（写入成功但新值未知，如条件增减库存），下次检索前批量回读；未配置loader_many时忽略"""
+        if self.loader_many is None:
+            return
+        with self._stale_lock:
+            self._stale.update(book_ids)
+
+    def ensure_ready(self):
+        super().ensure_ready()
+        self._refresh_stale()
+
+    def _refresh_stale(self):
+        """批量回读待刷新的图书（确认不存在的从索引删除）；读取失败时放回待刷新集合，下次检索重试"""
+        with self._stale_lock:
+            if not self._stale:
+                return
+            book_ids = list(self._stale)
+            self._stale.clear()
+
+        try:
+            books = self.loader_many(book_ids)
+        except Exception as e:
+            with self._stale_lock:
+                self._stale.update(book_ids)
+            logger.error(f"❌ {self.name}增量刷新失败: {str(e)}")
+            return
+
+        for book_id in book_ids:
+            if book_id in books:
+                self.upsert(books[book_id])
+            else:
+                self.remove(book_id)
+        logger.info(f"🔄 {self.name}增量刷新: {len(book_ids)} 本")
+
+    def search(self, query: str, page: int = 1, size: int = 10) -> Dict[str, Any]:
+        """检索图书，返回 {'items': [展示字段 + score], 'total': 命中总数}"""
+        self.ensure_ready()
+        offset = (max(page, 1) - 1) * size
+
+        query = query.strip()
+        if _ISBN_PATTERN.fullmatch(query):
+            query = re.sub(r'[^0-9xX]', '', query)
+
+        with self._lock:
+            total, hits = self._index.search(query, offset, size)
+            items = [dict(doc, score=round(score, 4)) for doc, score in hits]
+
+        return {'items': items, 'total': total}
+
+
+class BookSuggestIndex(RebuildableIndex):
+    """进程内书名/作者前缀联想索引，按借阅热度排序，查询期间不访问OTS
+
+    - loader：流式返回全部图书
+    - popularity_loader：返回 {book_id: 借阅次数}，构建时加载，之后由bump增量累加
+    """
+
+    name = '图书联想索引'
+
+    def __init__(self, loader: Callable[[], Iterable[Dict[str, Any]]],
+                 popularity_loader: Callable[[], Dict[str, float]], refresh_seconds: int = 0):
+        super().__init__(refresh_seconds)
+        self.loader = loader
+        self.popularity_loader = popularity_loader
+
+    def _new_index(self) -> PrefixIndex:
+        return PrefixIndex()
+
+    def _load(self, index: PrefixIndex):
+        index.bulk_load(self.loader())
+        for book_id, count in self.popularity_loader().items():
+            index.bump(book_id, count)
+
+    def _apply(self, index: PrefixIndex, action: str, doc_id: str, payload: Any):
+        if action == 'upsert':
+            index.add(doc_id, payload)
+        elif action == 'remove':
+            index.remove(doc_id)
+        elif action == 'bump':
+            index.bump(doc_id, payload)
+
+    def upsert(self, book: Dict[str, Any]):
+        """新增或更新图书的书名/作者"""
+        self._write('upsert', book['book_id'], {kind: book.get(kind) for kind in PrefixIndex.KINDS})
+
+    def remove(self, book_id: str):
+        """删除图书"""
+        self._write('remove', book_id)
+
+    def bump(self, book_id: str, delta: float = 1):
+        """累加图书热度（如借出次数）"""
+        self._write('bump', book_id, delta)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """前缀联想，返回 [{'text', 'type': title/author, 'score', 'book_id'(仅书名)}]"""
+        self.ensure_ready()
+        with self._lock:
+            return self._index.suggest(prefix, limit)
@@ -0,0 +1,130 @@
+# utils/write_behind.py
+"""进程内写后缓冲（write-behind）：请求线程只把写入事件放入有界队列，由后台线程攒批后批量写库
+
+- submit：非阻塞入队，队列满时丢弃并计入dropped（适用于浏览记录等可容忍少量丢失的分析类写入）
+- 后台线程每攒满batch_size条或距本批首条超过interval_ms即写入一批（write_many，通常为BatchWriteRow）
+- 进程正常退出时（atexit）在drain_timeout秒内写完队列中剩余的事件
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List
+from config import logger
+
+# 已创建的缓冲队列（按名称），供健康检查输出统计
+_queues: Dict[str, 'WriteBehindQueue'] = {}
+
+
+class WriteBehindQueue:
+    """有界队列 + 后台批量刷写线程（每个进程一个线程，fork后在子进程中首次入队时启动）
+
+    write_many(items)返回与items一一对应的成功标记列表
+    """
+
+    def __init__(self, name: str, write_many: Callable[[List[Any]], List[bool]], max_size: int = 10000,
+                 batch_size: int = 200, interval_ms: int = 500, drain_timeout: float = 5.0):
+        self.name = name
+        self.write_many = write_many
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.drain_timeout = drain_timeout
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stopping = threading.Event()
+        _queues[name] = self
+
+    def submit(self, item: Any) -> bool:
+        """事件入队（不阻塞），队列已满返回False并计入丢弃数"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"⚠️ 写后队列已满，丢弃事件: name={self.name}, 累计丢弃={dropped}")
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        """队列统计：排队数、累计写入/失败/丢弃数"""
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'failed': self.failed,
+            'dropped': self.dropped
+        }
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # fork继承的队列属于父进程，子进程使用新队列
+                    if self._pid is not None:
+                        self._queue = queue.Queue(maxsize=self.max_size)
+                    self._pid = os.getpid()
+                    self._stopping = threading.Event()
+                    threading.Thread(target=self._run, name=f'write-behind-{self.name}', daemon=True).start()
+                    atexit.register(self.drain)
+
+    def _next_batch(self, block: bool) -> List[Any]:
+        """取出一批事件：阻塞等待首条（block=True时），之后在interval内攒满batch_size条为止"""
+        try:
+            first = self._queue.get(timeout=self.interval) if block else self._queue.get_nowait()
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if block and remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Any]):
+        try:
+            results = self.write_many(batch)
+        except Exception as e:
+            logger.error(f"❌ 写后队列批量写入异常: name={self.name}, 条数={len(batch)}, {e}")
+            results = [False] * len(batch)
+        succeeded = sum(1 for success in results if success)
+        with self._lock:
+            self.written += succeeded
+            self.failed += len(batch) - succeeded
+        logger.info(f"📝 写后队列批量写入: name={self.name}, 条数={len(batch)}, 成功={succeeded}")
+
+    def _run(self):
+        stopping = self._stopping
+        while not stopping.is_set():
+            batch = self._next_batch(block=True)
+            if batch:
+                self._write(batch)
+
+    def drain(self):
+        """停止后台线程并写完队列中剩余的事件（进程退出时调用，最长drain_timeout秒）"""
+        self._stopping.set()
+        deadline = time.monotonic() + self.drain_timeout
+        while time.monotonic() < deadline:
+            batch = self._next_batch(block=False)
+            if not batch:
+                break
+            self._write(batch)
+        remaining = self._queue.qsize()
+        if remaining:
+            logger.warning(f"⚠️ 写后队列退出时未写完: name={self.name}, 剩余={remaining}")
+
+
+def queue_stats() -> Dict[str, Dict[str, int]]:
+    """全部写后队列的统计 {名称: stats}"""
+    return {name: write_queue.stats() for name, write_queue in _queues.items()}